@@ -0,0 +1,423 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from sqlalchemy import delete, func
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.db.session import engine as default_engine
+from app.models.onboarding_checkpoint import (
+    OnboardingCheckpoint,
+    OnboardingCheckpointWrite,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseCheckpointer(BaseCheckpointSaver):
+    """
+    LangGraph checkpointer keeping onboarding conversations in the app
+    database, so they survive restarts and cost no memory between turns.
+
+    Each thread is bounded: only its `keep` latest checkpoints are stored,
+    and a checkpoint larger than `max_bytes` drops its oldest messages until
+    it fits. Threads idle for longer than `ttl` seconds are no longer loaded
+    and are deleted by the pruning loop (see `start`).
+
+    Channel values are stored inline with each checkpoint; the onboarding
+    state is small and only the latest checkpoints are kept. The sync
+    methods are blocking, the async ones run them with `asyncio.to_thread`.
+    """
+
+    def __init__(
+        self,
+        engine=None,
+        ttl: Optional[float] = None,
+        keep: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        super().__init__()
+        self.engine = engine or default_engine
+        if ttl is None:
+            ttl = settings.ONBOARDING_CHECKPOINT_TTL_SECONDS
+        if keep is None:
+            keep = settings.ONBOARDING_CHECKPOINTS_PER_THREAD
+        if max_bytes is None:
+            max_bytes = settings.ONBOARDING_CHECKPOINT_MAX_BYTES
+        self.ttl = ttl
+        self.keep = keep
+        self.max_bytes = max_bytes
+        self._prune_task: Optional[asyncio.Task] = None
+        self.trimmed = 0
+        self.expired = 0
+
+    # --- Reads ---
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = self._thread_query(thread_id, checkpoint_ns)
+        checkpoint_id = get_checkpoint_id(config)
+        if checkpoint_id:
+            query = query.where(OnboardingCheckpoint.checkpoint_id == checkpoint_id)
+        with Session(self.engine) as session:
+            row = session.exec(
+                query.order_by(OnboardingCheckpoint.checkpoint_id.desc())
+            ).first()
+            if row is None:
+                return None
+            return self._to_tuple(session, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = select(OnboardingCheckpoint).where(
+            OnboardingCheckpoint.created_at >= self._cutoff()
+        )
+        if config:
+            configurable = config["configurable"]
+            query = query.where(
+                OnboardingCheckpoint.thread_id == configurable["thread_id"]
+            )
+            if configurable.get("checkpoint_ns") is not None:
+                query = query.where(
+                    OnboardingCheckpoint.checkpoint_ns == configurable["checkpoint_ns"]
+                )
+            if get_checkpoint_id(config):
+                query = query.where(
+                    OnboardingCheckpoint.checkpoint_id == get_checkpoint_id(config)
+                )
+        if before and get_checkpoint_id(before):
+            query = query.where(
+                OnboardingCheckpoint.checkpoint_id < get_checkpoint_id(before)
+            )
+        query = query.order_by(OnboardingCheckpoint.checkpoint_id.desc())
+
+        with Session(self.engine) as session:
+            tuples: List[CheckpointTuple] = []
+            for row in session.exec(query):
+                if limit is not None and len(tuples) >= limit:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed((row.meta_type, row.meta))
+                    if any(metadata.get(k) != v for k, v in filter.items()):
+                        continue
+                tuples.append(self._to_tuple(session, row))
+        yield from tuples
+
+    # --- Writes ---
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, data = self._dump_bounded(checkpoint)
+        meta_type, meta = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+        with Session(self.engine) as session:
+            session.merge(
+                OnboardingCheckpoint(
+                    thread_id=thread_id,
+                    checkpoint_ns=checkpoint_ns,
+                    checkpoint_id=checkpoint["id"],
+                    parent_checkpoint_id=config["configurable"].get("checkpoint_id"),
+                    type=type_,
+                    checkpoint=data,
+                    meta_type=meta_type,
+                    meta=meta,
+                    size=len(data),
+                )
+            )
+            session.flush()
+            self._drop_old_checkpoints(session, thread_id, checkpoint_ns)
+            session.commit()
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        key = (
+            configurable["thread_id"],
+            configurable.get("checkpoint_ns", ""),
+            configurable["checkpoint_id"],
+        )
+        with Session(self.engine) as session:
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                # Regular writes are recorded once, special ones overwritten
+                if idx >= 0 and session.get(
+                    OnboardingCheckpointWrite, (*key, task_id, idx)
+                ):
+                    continue
+                type_, data = self.serde.dumps_typed(value)
+                session.merge(
+                    OnboardingCheckpointWrite(
+                        thread_id=key[0],
+                        checkpoint_ns=key[1],
+                        checkpoint_id=key[2],
+                        task_id=task_id,
+                        idx=idx,
+                        channel=channel,
+                        type=type_,
+                        value=data,
+                        task_path=task_path,
+                    )
+                )
+            session.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with Session(self.engine) as session:
+            self._delete_threads(session, [thread_id])
+            session.commit()
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest"):
+        with Session(self.engine) as session:
+            if strategy == "delete":
+                self._delete_threads(session, list(thread_ids))
+            else:
+                namespaces = session.exec(
+                    select(
+                        OnboardingCheckpoint.thread_id,
+                        OnboardingCheckpoint.checkpoint_ns,
+                    )
+                    .where(OnboardingCheckpoint.thread_id.in_(thread_ids))
+                    .distinct()
+                ).all()
+                for thread_id, checkpoint_ns in namespaces:
+                    self._drop_old_checkpoints(session, thread_id, checkpoint_ns, 1)
+            session.commit()
+
+    def prune_expired(self) -> int:
+        """Deletes the threads idle for longer than `ttl`, returns how many."""
+        with Session(self.engine) as session:
+            expired = session.exec(
+                select(OnboardingCheckpoint.thread_id)
+                .group_by(OnboardingCheckpoint.thread_id)
+                .having(func.max(OnboardingCheckpoint.created_at) < self._cutoff())
+            ).all()
+            if expired:
+                self._delete_threads(session, list(expired))
+                session.commit()
+        self.expired += len(expired)
+        return len(expired)
+
+    # --- Async ---
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in tuples:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aprune(
+        self, thread_ids: Sequence[str], *, strategy: str = "keep_latest"
+    ) -> None:
+        await asyncio.to_thread(self.prune, thread_ids, strategy=strategy)
+
+    # --- Pruning loop ---
+
+    def start(self):
+        """Starts deleting expired threads in the background."""
+        if self._prune_task is None or self._prune_task.done():
+            self._prune_task = asyncio.create_task(self._prune_loop())
+
+    async def stop(self):
+        if self._prune_task is not None:
+            self._prune_task.cancel()
+            await asyncio.gather(self._prune_task, return_exceptions=True)
+            self._prune_task = None
+
+    async def _prune_loop(self):
+        while True:
+            await asyncio.sleep(settings.ONBOARDING_CHECKPOINT_PRUNE_INTERVAL_SECONDS)
+            try:
+                count = await asyncio.to_thread(self.prune_expired)
+                if count:
+                    logger.info(f"Pruned {count} expired onboarding conversations")
+            except Exception as e:
+                logger.error(f"Onboarding checkpoint pruning failed: {e}")
+
+    def get_stats(self) -> dict:
+        return {"trimmed": self.trimmed, "expired": self.expired}
+
+    # --- Helpers ---
+
+    def _cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.ttl)
+
+    def _thread_query(self, thread_id: str, checkpoint_ns: str):
+        return select(OnboardingCheckpoint).where(
+            OnboardingCheckpoint.thread_id == thread_id,
+            OnboardingCheckpoint.checkpoint_ns == checkpoint_ns,
+            # Expired threads start over, the pruning loop deletes them
+            OnboardingCheckpoint.created_at >= self._cutoff(),
+        )
+
+    def _dump_bounded(self, checkpoint: Checkpoint) -> tuple:
+        """
+        Serializes a checkpoint, dropping its oldest messages while it is
+        larger than `max_bytes`. The latest message is always kept.
+        """
+        type_, data = self.serde.dumps_typed(checkpoint)
+        messages = checkpoint["channel_values"].get("messages")
+        if len(data) <= self.max_bytes or not isinstance(messages, list):
+            return type_, data
+
+        messages = list(messages)
+        while len(data) > self.max_bytes and len(messages) > 1:
+            # Halves the history each round, then serializes again
+            messages = messages[len(messages) // 2 :]
+            trimmed = {
+                **checkpoint,
+                "channel_values": {
+                    **checkpoint["channel_values"],
+                    "messages": messages,
+                },
+            }
+            type_, data = self.serde.dumps_typed(trimmed)
+        self.trimmed += 1
+        return type_, data
+
+    def _drop_old_checkpoints(
+        self,
+        session: Session,
+        thread_id: str,
+        checkpoint_ns: str,
+        keep: Optional[int] = None,
+    ):
+        old = session.exec(
+            select(OnboardingCheckpoint.checkpoint_id)
+            .where(
+                OnboardingCheckpoint.thread_id == thread_id,
+                OnboardingCheckpoint.checkpoint_ns == checkpoint_ns,
+            )
+            .order_by(OnboardingCheckpoint.checkpoint_id.desc())
+            .offset(keep or self.keep)
+        ).all()
+        if not old:
+            return
+        for model in (OnboardingCheckpoint, OnboardingCheckpointWrite):
+            session.exec(
+                delete(model).where(
+                    model.thread_id == thread_id,
+                    model.checkpoint_ns == checkpoint_ns,
+                    model.checkpoint_id.in_(old),
+                )
+            )
+
+    def _delete_threads(self, session: Session, thread_ids: List[str]):
+        for model in (OnboardingCheckpoint, OnboardingCheckpointWrite):
+            session.exec(delete(model).where(model.thread_id.in_(thread_ids)))
+
+    def _to_tuple(
+        self, session: Session, row: OnboardingCheckpoint
+    ) -> CheckpointTuple:
+        writes = session.exec(
+            select(OnboardingCheckpointWrite)
+            .where(
+                OnboardingCheckpointWrite.thread_id == row.thread_id,
+                OnboardingCheckpointWrite.checkpoint_ns == row.checkpoint_ns,
+                OnboardingCheckpointWrite.checkpoint_id == row.checkpoint_id,
+            )
+            .order_by(
+                OnboardingCheckpointWrite.task_path,
+                OnboardingCheckpointWrite.task_id,
+                OnboardingCheckpointWrite.idx,
+            )
+        ).all()
+        config = {
+            "configurable": {
+                "thread_id": row.thread_id,
+                "checkpoint_ns": row.checkpoint_ns,
+                "checkpoint_id": row.checkpoint_id,
+            }
+        }
+        parent_config = None
+        if row.parent_checkpoint_id:
+            parent_config = {
+                "configurable": {
+                    **config["configurable"],
+                    "checkpoint_id": row.parent_checkpoint_id,
+                }
+            }
+        return CheckpointTuple(
+            config=config,
+            checkpoint=self.serde.loads_typed((row.type, row.checkpoint)),
+            metadata=self.serde.loads_typed((row.meta_type, row.meta)),
+            parent_config=parent_config,
+            pending_writes=[
+                (w.task_id, w.channel, self.serde.loads_typed((w.type, w.value)))
+                for w in writes
+            ],
+        )
+
+
+# Singleton instance
+onboarding_checkpointer = DatabaseCheckpointer()
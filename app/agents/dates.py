@@ -0,0 +1,201 @@
+import calendar
+import re
+import unicodedata
+from datetime import date, timedelta
+from typing import Optional, Set
+
+MONTHS = {
+    "janeiro": 1,
+    "jan": 1,
+    "fevereiro": 2,
+    "fev": 2,
+    "marco": 3,
+    "mar": 3,
+    "abril": 4,
+    "abr": 4,
+    "maio": 5,
+    "mai": 5,
+    "junho": 6,
+    "jun": 6,
+    "julho": 7,
+    "jul": 7,
+    "agosto": 8,
+    "ago": 8,
+    "setembro": 9,
+    "set": 9,
+    "outubro": 10,
+    "out": 10,
+    "novembro": 11,
+    "nov": 11,
+    "dezembro": 12,
+    "dez": 12,
+}
+NUMBERS = {
+    "um": 1,
+    "uma": 1,
+    "dois": 2,
+    "duas": 2,
+    "tres": 3,
+    "quatro": 4,
+    "cinco": 5,
+    "seis": 6,
+    "sete": 7,
+    "oito": 8,
+    "nove": 9,
+    "dez": 10,
+    "onze": 11,
+    "doze": 12,
+}
+_MONTH = "(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + ")"
+_NUMBER = r"(\d+|" + "|".join(NUMBERS) + ")"
+_YEAR = r"(?:\s*(?:de|/)?\s*(\d{4}))?"
+
+_UNIT = r"(?:dias?|semanas?|mes|meses|anos?)"
+
+# Patterns run on lowercased text without accents
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+# 15/03/2027, 15-03-27, 15.03 (day first), but not 2-3 meses or 3.5 meses
+NUMERIC_DATE = re.compile(
+    r"(?<![\d.,])\b(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{4}|\d{2}))?\b"
+    rf"(?![.,]?\d)(?!\s*{_UNIT}\b)"
+)
+# 15 de março de 2027, 1º de junho
+WRITTEN_DATE = re.compile(rf"\b(\d{{1,2}})(?:o|º)?\s+de\s+{_MONTH}\b{_YEAR}")
+# fim de junho, início de março de 2027, meados de agosto
+PART_OF_MONTH = re.compile(
+    rf"\b(fim|final|inicio|comeco|meados)\s+(?:de|do\s+mes\s+de)\s+{_MONTH}\b{_YEAR}"
+)
+# em 3 meses, daqui a duas semanas, dentro de 45 dias
+RELATIVE = re.compile(
+    rf"\b(?:em|daqui\s+a|daqui|dentro\s+de)\s+{_NUMBER}\s+({_UNIT})\b"
+)
+# Ranges, fractions and compound durations (2-3 meses, 3,5 meses, um ano e
+# meio, 1 ano e 6 meses), left to the LLM
+UNSUPPORTED = re.compile(
+    rf"\b\d+\s*(?:[-.,/]|a|ou)\s*\d+\s+{_UNIT}\b"
+    rf"|\b{_UNIT}\s+e\s+(?:meio|meia|{_NUMBER})\b"
+)
+DAY_WORDS = {"hoje": 0, "amanha": 1}
+PART_DAYS = {"inicio": 1, "comeco": 1, "meados": 15}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _add_months(start: date, months: int) -> date:
+    month = start.month - 1 + months
+    year = start.year + month // 12
+    month = month % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+def _relative(today: date, count: int, unit: str) -> date:
+    """`count` days, weeks, months or years from today."""
+    if unit.startswith("dia"):
+        return today + timedelta(days=count)
+    if unit.startswith("semana"):
+        return today + timedelta(weeks=count)
+    if unit.startswith("mes"):
+        return _add_months(today, count)
+    return _add_months(today, 12 * count)
+
+
+def _upcoming(today: date, month: int, day: Optional[int], year: Optional[str]):
+    """
+    The date in `year`, or, without a year, its next occurrence from today.
+    A missing `day` means the end of the month.
+    """
+    years = [int(year)] if year else [today.year, today.year + 1]
+    for y in years:
+        last = calendar.monthrange(y, month)[1]
+        candidate = date(y, month, day or last)
+        if year or candidate >= today:
+            return candidate
+    return candidate
+
+
+class DeadlineParser:
+    """
+    Reads a deadline from a message without the LLM, for the usual
+    Brazilian and ISO formats and relative expressions ("em 3 meses",
+    "fim de junho"). Returns None when the message holds no date it
+    understands, several different ones, or a duration it does not (a range,
+    a fraction); the caller then asks the LLM.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, text: str, today: date) -> Optional[date]:
+        text = _normalize(text)
+        found: Set[date] = set()
+        if UNSUPPORTED.search(text):
+            self.misses += 1
+            return None
+
+        for match in ISO_DATE.finditer(text):
+            self._add(found, lambda: date(*map(int, match.groups())))
+        # So that ISO dates are not read again as day/month
+        text = ISO_DATE.sub(" ", text)
+
+        for match in NUMERIC_DATE.finditer(text):
+            day, month, year = match.groups()
+            if year and len(year) == 2:
+                year = f"20{year}"
+            self._add(found, lambda: _upcoming(today, int(month), int(day), year))
+
+        for match in WRITTEN_DATE.finditer(text):
+            day, month, year = match.groups()
+            self._add(
+                found, lambda: _upcoming(today, MONTHS[month], int(day), year)
+            )
+
+        for match in PART_OF_MONTH.finditer(text):
+            part, month, year = match.groups()
+            self._add(
+                found,
+                lambda: _upcoming(today, MONTHS[month], PART_DAYS.get(part), year),
+            )
+
+        try:
+            for match in RELATIVE.finditer(text):
+                count, unit = match.groups()
+                count = int(count) if count.isdigit() else NUMBERS[count]
+                found.add(_relative(today, count, unit))
+
+            for word, days in DAY_WORDS.items():
+                if re.search(rf"\b{word}\b", text):
+                    found.add(today + timedelta(days=days))
+        except (OverflowError, ValueError):
+            # Past the calendar, e.g. "em 99999999 semanas"
+            self.misses += 1
+            return None
+
+        if len(found) != 1:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return found.pop()
+
+    def _add(self, found: Set[date], build):
+        try:
+            found.add(build())
+        except (OverflowError, ValueError):
+            # Not a calendar date, e.g. 31/02
+            pass
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else None,
+        }
+
+
+# Singleton instance
+deadline_parser = DeadlineParser()
@@ -0,0 +1,340 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+GREETING = "greeting"
+THANKS = "thanks"
+HELP = "help"
+TOPIC = "topic"
+
+RESPONSES = {
+    GREETING: (
+        "Olá! Sou o SciAgent e vou ajudá-lo a planejar sua pesquisa. "
+        "Qual tema você pretende investigar?"
+    ),
+    THANKS: (
+        "Por nada! Quando quiser, conte-me qual tema de pesquisa você "
+        "pretende investigar."
+    ),
+    HELP: (
+        "Eu ajudo a transformar uma ideia em um projeto de pesquisa: definimos o "
+        "tema, selecionamos referências, estabelecemos o prazo e montamos um "
+        "roteiro com título e resumo. Qual tema você pretende investigar?"
+    ),
+}
+
+# Whole messages made only of these words (after normalization)
+SMALL_TALK = {
+    GREETING: set(
+        "ola oi opa hello hi hey bom boa dia tarde noite tudo bem e ai como vai "
+        "voce sciagent".split()
+    ),
+    THANKS: set("obrigado obrigada brigado valeu thanks muito".split()),
+}
+# Questions about the assistant itself
+HELP_QUESTION = re.compile(
+    r"^(como (isso |voce |)funciona|o que (voce faz|e isso|posso fazer)|"
+    r"quem e voce|como voce (pode )?(me )?ajuda(r)?|ajuda)\b"
+)
+# Help requests that also mention what the help is for
+TOPIC_SIGNAL = re.compile(
+    r"\b(sobre|tema|tese|dissertacao|tcc|monografia|artigo|pesquisa|projeto)\b"
+)
+# "quero pesquisar sobre X", "meu tema é X", "I want to write about X": only
+# explicit markers, "vou estudar amanhã" states no topic
+TOPIC_LEAD = re.compile(
+    r"^(?:eu\s+)?(?:quero|gostaria\s+de|pretendo|vou|desejo|preciso)\s+"
+    r"(?:pesquisar|estudar|investigar|escrever|trabalhar|fazer\s+um\s+\w+)\s+"
+    r"(?:sobre|acerca\s+de|a\s+respeito\s+de)\s+"
+    r"|^(?:o\s+)?meu\s+tema\s+(?:e|sera)\s+"
+    r"|^(?:uma\s+)?pesquisa\s+sobre\s+"
+    r"|^i\s+(?:want|would\s+like)\s+to\s+(?:study|research|write)\s+about\s+"
+)
+# A topic that is not one yet
+VAGUE = re.compile(r"\b(nao sei|algo|alguma coisa|qualquer|talvez|ainda)\b")
+WORD = re.compile(r"[a-z0-9]+")
+
+# Seed examples of the linear model, completed by logged LLM classifications
+SEED_EXAMPLES: List[Tuple[str, bool]] = [
+    ("Machine Learning na medicina", True),
+    ("Micro frontends em aplicações web", True),
+    ("Impacto das redes sociais na saúde mental de adolescentes", True),
+    ("Aprendizado profundo para detecção de câncer de pele", True),
+    ("Computação quântica aplicada à criptografia", True),
+    ("Energia solar em comunidades rurais", True),
+    ("Análise de sentimentos em tweets sobre política", True),
+    ("Blockchain na cadeia de suprimentos de alimentos", True),
+    ("Efeitos do trabalho remoto na produtividade", True),
+    ("Modelos de linguagem para educação", True),
+    ("Segurança de redes 5G", True),
+    ("Mudanças climáticas e agricultura familiar", True),
+    ("O que é um paper?", False),
+    ("Como funciona isso?", False),
+    ("Não sei por onde começar", False),
+    ("Pode me ajudar?", False),
+    ("Qual a diferença entre tese e dissertação?", False),
+    ("O que você faz?", False),
+    ("Não tenho certeza ainda", False),
+    ("Quanto tempo demora?", False),
+    ("Tudo bem?", False),
+    ("Me explica o que é uma revisão sistemática", False),
+    ("Quero criar um app", False),
+    ("Estou com dúvida", False),
+    ("Sou estudante de graduação em biologia", False),
+    ("Estou no doutorado em física", False),
+    ("Faço mestrado em engenharia elétrica", False),
+    ("Vou estudar amanhã", False),
+    ("Preciso escrever rápido", False),
+]
+# Held out of training: the model only answers above the highest probability
+# it gives to one of these non-topics (see `IntentClassifier.calibrate`)
+VALIDATION_EXAMPLES: List[Tuple[str, bool]] = [
+    ("Sou aluno de mestrado em computação", False),
+    ("Trabalho com pesquisa em química", False),
+    ("Estou no último ano de medicina", False),
+    ("Minha orientadora pediu um projeto", False),
+    ("Quero escrever melhor", False),
+    ("Tenho pouco tempo para terminar", False),
+    ("Preciso de ajuda com a metodologia", False),
+    ("Reconhecimento de voz para idosos", True),
+    ("Gestão de resíduos sólidos urbanos", True),
+    ("Redes neurais para previsão do tempo", True),
+]
+# One logged example out of this many is held out for calibration
+VALIDATION_EVERY = 5
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower().strip())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _original(message: str, text: str) -> str:
+    """
+    `message` as written if its positions match the normalized `text`, so
+    extracted topics keep their case and accents.
+    """
+    message = message.strip()
+    return message if len(message) == len(text) else text
+
+
+def _features(text: str) -> List[str]:
+    """Words and word pairs of a normalized message, plus a question mark."""
+    words = WORD.findall(text)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if text.endswith("?"):
+        features.append("?")
+    return features
+
+
+class Intent:
+    """How the onboarding agent answers a message, decided locally."""
+
+    def __init__(self, kind: str, confidence: float, topic: Optional[str] = None):
+        self.kind = kind
+        self.confidence = confidence
+        self.topic = topic
+
+    @property
+    def response(self) -> Optional[str]:
+        return RESPONSES.get(self.kind)
+
+
+class IntentClassifier:
+    """
+    Answers the obvious onboarding messages without the LLM: greetings,
+    thanks, questions about the assistant and research topics. Keyword rules
+    come first; for the rest a logistic regression over word features says
+    whether the message states a topic. Anything it is not confident about
+    returns None, for the LLM to classify: below `min_confidence`, or below
+    the threshold calibrated on held-out examples if that is higher.
+
+    LLM classifications passed to `record` keep training the model and are
+    appended to `examples_path`, which keeps the latest `max_examples`. The
+    model is trained on first use, or by `train` at startup.
+    """
+
+    def __init__(
+        self,
+        examples_path: Optional[str] = None,
+        min_confidence: float = 0.95,
+        max_examples: int = 5000,
+        epochs: int = 50,
+        learning_rate: float = 0.5,
+    ):
+        self.examples_path = Path(examples_path) if examples_path else None
+        self.min_confidence = min_confidence
+        self.threshold = min_confidence
+        self.max_examples = max_examples
+        self.epochs = epochs
+        self.learning_rate = learning_rate
+        self.weights: Dict[str, float] = {}
+        self.bias = 0.0
+        self.hits: Dict[str, int] = {}
+        self.escalated = 0
+        self.recorded = 0
+        # Lines in the examples file, to know when to rotate it
+        self._logged = 0
+        self._trained = False
+        self._train_lock = threading.Lock()
+
+    def train(self):
+        """Trains the model from the seed and logged examples. Blocking."""
+        with self._train_lock:
+            if self._trained:
+                return
+            logged = self._load_examples()
+            self._logged = len(logged)
+            training = SEED_EXAMPLES + [
+                example
+                for i, example in enumerate(logged)
+                if i % VALIDATION_EVERY != VALIDATION_EVERY - 1
+            ]
+            validation = VALIDATION_EXAMPLES + logged[
+                VALIDATION_EVERY - 1 :: VALIDATION_EVERY
+            ]
+            for _ in range(self.epochs):
+                for text, is_topic in training:
+                    self._update(_features(_normalize(text)), is_topic)
+            self.calibrate(validation)
+            self._trained = True
+
+    def calibrate(self, examples: List[Tuple[str, bool]]):
+        """
+        Raises the threshold above the probability of every non-topic in
+        `examples`, which the model was not trained on.
+        """
+        negatives = [
+            self.probability(_normalize(text))
+            for text, is_topic in examples
+            if not is_topic
+        ]
+        self.threshold = max([self.min_confidence, *negatives])
+
+    def classify(self, message: str) -> Optional[Intent]:
+        self.train()
+        text = _normalize(message)
+        if HELP_QUESTION.match(text) and TOPIC_SIGNAL.search(text):
+            # Help with a given work: needs a written reply and maybe a topic
+            intent = None
+        else:
+            intent = self._rules(text, message) or self._model(text, message)
+        if intent is None:
+            self.escalated += 1
+        else:
+            self.hits[intent.kind] = self.hits.get(intent.kind, 0) + 1
+        return intent
+
+    def probability(self, text: str) -> float:
+        """Probability that a normalized message states a research topic."""
+        score = self.bias + sum(self.weights.get(f, 0.0) for f in _features(text))
+        return 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+
+    def record(self, message: str, is_topic: bool):
+        """Learns from an LLM classification. Blocking when logging to disk."""
+        self.train()
+        self._update(_features(_normalize(message)), is_topic)
+        self.recorded += 1
+        if self.examples_path is None:
+            return
+        try:
+            self.examples_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.examples_path.open("a", encoding="utf-8") as f:
+                line = {"text": message, "is_research_topic": is_topic}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self._logged += 1
+            if self._logged >= 2 * self.max_examples:
+                self._rotate()
+        except OSError as e:
+            logger.warning(f"Could not log intent example: {e}")
+
+    def _rotate(self):
+        """Rewrites the examples file with only the latest `max_examples`."""
+        examples = self._load_examples()
+        tmp_path = self.examples_path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            for text, is_topic in examples:
+                line = {"text": text, "is_research_topic": is_topic}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.examples_path)
+        self._logged = len(examples)
+
+    def get_stats(self) -> dict:
+        handled = sum(self.hits.values())
+        total = handled + self.escalated
+        return {
+            "local": dict(self.hits),
+            "escalated": self.escalated,
+            "local_rate": handled / total if total else None,
+            "recorded": self.recorded,
+            "threshold": self.threshold,
+        }
+
+    def _rules(self, text: str, message: str) -> Optional[Intent]:
+        words = set(WORD.findall(text))
+        if words:
+            for kind, vocabulary in SMALL_TALK.items():
+                if words <= vocabulary:
+                    return Intent(kind, 1.0)
+        if HELP_QUESTION.match(text):
+            return Intent(HELP, 1.0)
+        lead = TOPIC_LEAD.match(text)
+        if lead and not text.endswith("?") and not VAGUE.search(text):
+            topic = _original(message, text)[lead.end() :].strip(" .!")
+            if topic:
+                return Intent(TOPIC, 1.0, topic)
+        return None
+
+    def _model(self, text: str, message: str) -> Optional[Intent]:
+        # Only topics can be answered without the LLM, other messages need
+        # a written reply
+        if text.endswith("?") or VAGUE.search(text) or len(WORD.findall(text)) < 2:
+            return None
+        p = self.probability(text)
+        if p <= self.threshold:
+            return None
+        return Intent(TOPIC, p, _original(message, text).strip(" .!"))
+
+    def _update(self, features: Iterable[str], is_topic: bool):
+        """One stochastic gradient step of the logistic loss."""
+        features = list(features)
+        score = self.bias + sum(self.weights.get(f, 0.0) for f in features)
+        p = 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+        step = self.learning_rate * ((1.0 if is_topic else 0.0) - p)
+        self.bias += step
+        for f in features:
+            self.weights[f] = self.weights.get(f, 0.0) + step
+
+    def _load_examples(self) -> List[Tuple[str, bool]]:
+        """The latest `max_examples` logged examples."""
+        if self.examples_path is None or not self.examples_path.exists():
+            return []
+        examples: Deque[Tuple[str, bool]] = deque(maxlen=self.max_examples)
+        with self.examples_path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                    examples.append(
+                        (data["text"], bool(data["is_research_topic"]))
+                    )
+                except (ValueError, KeyError):
+                    continue
+        return list(examples)
+
+
+# Singleton instance, trained at startup
+intent_classifier = IntentClassifier(
+    settings.ONBOARDING_INTENT_EXAMPLES_PATH,
+    settings.ONBOARDING_INTENT_MIN_CONFIDENCE,
+    settings.ONBOARDING_INTENT_MAX_EXAMPLES,
+)
@@ -1,9 +1,12 @@
-from typing import List, Dict, Any, Literal
+import asyncio
+from typing import List, Dict, Any, Literal, Optional
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from app.core.config import settings
+from app.agents.dates import deadline_parser
+from app.agents.intent import intent_classifier
 from app.agents.state import OnboardingState
 from app.agents.tools.scholar_mcp import search_scholar_mcp
 
@@ -99,10 +102,44 @@ from app.core.llm import get_llm
 
 llm = get_llm()
 
+# Generations in flight at once; the others wait here instead of piling up
+# on the LLM backend
+llm_slots = asyncio.Semaphore(settings.ONBOARDING_LLM_CONCURRENCY)
+
+
+async def call_llm(messages: List[Any], cache_as: Optional[str] = None) -> Any:
+    """
+    Runs a prompt on the LLM without blocking the event loop and returns its
+    message. Raises asyncio.TimeoutError after ONBOARDING_LLM_TIMEOUT_SECONDS;
+    the generation is cancelled then, as it is when the request itself is
+    cancelled. With `cache_as`, repeated prompts may be answered from the LLM
+    cache (see LLM_CACHE_TTLS), with `response_metadata["cached"]` set; those
+    take no generation slot and are not timed.
+    """
+    if cache_as is not None:
+        cached = await llm.acached(messages, cache_as)
+        if cached is not None:
+            return cached
+    async with llm_slots:
+        return await asyncio.wait_for(
+            llm.ainvoke(messages, cache_as=cache_as, lookup=False),
+            timeout=settings.ONBOARDING_LLM_TIMEOUT_SECONDS,
+        )
+
+
+def _strip_fences(content: str) -> str:
+    return content.replace("```json", "").replace("```", "").strip()
+
+
+async def ask_llm(messages: List[Any], cache_as: Optional[str] = None) -> str:
+    """`call_llm`, returning the reply stripped of markdown code fences."""
+    return _strip_fences((await call_llm(messages, cache_as)).content)
+
+
 # --- Nodes ---
 
 
-def node_clarify_concept(state: OnboardingState):
+async def node_clarify_concept(state: OnboardingState):
     """
     Analyzes the user's input.
     If vague -> Ask question.
@@ -123,6 +160,16 @@ def node_clarify_concept(state: OnboardingState):
     messages = state["messages"]
     last_message = messages[-1].content
 
+    # Greetings, thanks and clear topics are answered without the LLM
+    intent = intent_classifier.classify(last_message)
+    if intent is not None:
+        if intent.topic:
+            return {"topic": intent.topic, "current_step": "search"}
+        return {
+            "messages": [AIMessage(content=intent.response)],
+            "current_step": "clarify",
+        }
+
     # Intent Classification
     classification_prompt = f"""
     Analyze the user's last message: "{last_message}".
@@ -140,14 +187,22 @@ def node_clarify_concept(state: OnboardingState):
     """
 
     try:
-        response = llm.invoke(
+        response = await call_llm(
             [
                 SystemMessage(content="Classify user intent. JSON only."),
                 HumanMessage(content=classification_prompt),
-            ]
+            ],
+            cache_as="onboarding.intent",
         )
-        content = response.content.replace("```json", "").replace("```", "").strip()
-        data = json.loads(content)
+        data = json.loads(_strip_fences(response.content))
+        # Trains the local classifier for the next messages, once per message:
+        # cached replies were recorded when first generated
+        if not response.response_metadata.get("cached"):
+            await asyncio.to_thread(
+                intent_classifier.record,
+                last_message,
+                bool(data.get("is_research_topic")),
+            )
 
         if data.get("is_research_topic"):
             # User defined a topic, move to search
@@ -202,7 +257,7 @@ async def node_search_references(state: OnboardingState):
     }
 
 
-def node_process_deadline(state: OnboardingState):
+async def node_process_deadline(state: OnboardingState):
     """
     Asks for deadline or validates it.
     """
@@ -242,15 +297,21 @@ def node_process_deadline(state: OnboardingState):
     """
 
     try:
-        response = llm.invoke(
-            [
-                SystemMessage(content="Extract date. JSON only."),
-                HumanMessage(content=prompt),
-            ]
-        )
-        content = response.content.replace("```json", "").replace("```", "").strip()
-        data = json.loads(content)
-        extracted_date_str = data.get("date")
+        # Usual formats are read locally, the LLM only gets the rest
+        parsed = deadline_parser.parse(last_message, today.date())
+        if parsed is not None:
+            extracted_date_str = parsed.isoformat()
+        else:
+            content = await ask_llm(
+                [
+                    SystemMessage(content="Extract date. JSON only."),
+                    HumanMessage(content=prompt),
+                ],
+                # The prompt holds today's date, so entries change every day
+                cache_as="onboarding.deadline",
+            )
+            data = json.loads(content)
+            extracted_date_str = data.get("date")
 
         if not extracted_date_str:
             msg = AIMessage(
@@ -298,7 +359,7 @@ def node_process_deadline(state: OnboardingState):
         }
 
 
-def node_generate_roadmap(state: OnboardingState):
+async def node_generate_roadmap(state: OnboardingState):
     """
     Generates a list of tasks (roadmap) based on deadline.
     """
@@ -318,13 +379,12 @@ def node_generate_roadmap(state: OnboardingState):
     """
 
     try:
-        response = llm.invoke(
+        content = await ask_llm(
             [
                 SystemMessage(content="You are a research planner. Output JSON only."),
                 HumanMessage(content=prompt),
             ]
         )
-        content = response.content.replace("```json", "").replace("```", "").strip()
         data = json.loads(content)
 
         roadmap = data.get("roadmap", [])
@@ -429,7 +489,7 @@ workflow.add_conditional_edges(
 )
 
 # Compile
-from langgraph.checkpoint.memory import MemorySaver
+# Conversations are persisted in the database, see DatabaseCheckpointer
+from app.agents.checkpointer import onboarding_checkpointer
 
-memory = MemorySaver()
-onboarding_graph = workflow.compile(checkpointer=memory)
+onboarding_graph = workflow.compile(checkpointer=onboarding_checkpointer)
@@ -1,29 +1,207 @@
+import asyncio
+import json
 import logging
-from typing import List
+import time
+from functools import partial
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
 import uuid
-import asyncio
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Response
+import y_py as Y
+from ypy_websocket.yutils import (
+    YMessageType,
+    YSyncMessageType,
+    create_update_message,
+    read_message,
+)
+from fastapi import (
+    APIRouter,
+    WebSocket,
+    WebSocketDisconnect,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlmodel import Session
 from app.models.project import Project
-from app.api.deps import SessionDep
+from app.models.project_member import ProjectMember
+from app.api.deps import SessionDep, CurrentUser
+from app.services.compile_jobs import (
+    FAILED,
+    SUPERSEDED,
+    CompileJob,
+    CompileQueueFull,
+)
+from app.services.asset_store import FileTree, asset_store
+from app.services.compile_preview import PreviewSelection
 from app.services.compiler import compiler_service
-from app.services.collaboration import collaboration_service
-from app.schemas.compiler import CompileRequest
+from app.services.precompile import precompiler
+from app.core.config import settings
+from app.services.collaboration import RoomStats, collaboration_service
+from app.models.project_file import normalize_file_path
+from app.services.document_store import document_id, document_store
+from app.schemas.compiler import (
+    CompileDiagnostic,
+    CompileJobPublic,
+    CompileRequest,
+)
+
+
+# Yjs encodes the state vector of an empty document as a single zero
+EMPTY_STATE_VECTOR = b"\x00"
+
+
+def _is_update(message: bytes) -> bool:
+    return (
+        message[0] == YMessageType.SYNC and message[1] == YSyncMessageType.SYNC_UPDATE
+    )
 
 
 class FastAPIwebsocketAdapter:
-    def __init__(self, websocket: WebSocket):
+    """
+    Websocket as seen by `YRoom`, with a bounded outbound queue drained by a
+    dedicated writer task, so a slow client never stalls the room's broadcast.
+
+    When the queue is full, queued awareness messages are dropped and queued
+    document updates are coalesced into one update carrying the room's full
+    state. A client whose oldest queued message is older than
+    COLLAB_CLIENT_MAX_LAG_SECONDS is disconnected.
+
+    A fresh client (sync step 1 with an empty state vector) is answered with
+    the messages returned by `initial_sync` instead of a per-client diff.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        ydoc: Y.YDoc | None = None,
+        stats: RoomStats | None = None,
+        initial_sync: Callable[[], List[bytes]] | None = None,
+    ):
         self._websocket = websocket
+        self._initial_sync = initial_sync
+        # Used to build the merged update when coalescing
+        self._ydoc = ydoc
+        self._stats = stats
+        # (enqueued at, message)
+        self._queue: Deque[Tuple[float, bytes]] = deque()
+        self._has_messages = asyncio.Event()
+        self._writer: asyncio.Task | None = None
+        self._closing: asyncio.Task | None = None
+        self._closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
 
     async def send(self, message: bytes):
-        try:
-            await self._websocket.send_bytes(message)
-        except RuntimeError as e:
-            # Starlette raises RuntimeError if send is called after close
-            if 'Cannot call "send" once a close message has been sent' in str(e):
+        if self._closed:
+            return
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+        if (
+            self._queue
+            and time.monotonic() - self._queue[0][0]
+            > settings.COLLAB_CLIENT_MAX_LAG_SECONDS
+        ):
+            self._disconnect_lagging()
+            return
+
+        if len(self._queue) >= settings.COLLAB_CLIENT_QUEUE_SIZE:
+            if not self._make_room(message):
+                self._disconnect_lagging()
+            return
+
+        self._queue.append((time.monotonic(), message))
+        self._has_messages.set()
+
+    def _make_room(self, message: bytes) -> bool:
+        """
+        Frees queue space for `message` on a full queue. Returns False if
+        nothing could be dropped or merged.
+        """
+        if message[0] == YMessageType.AWARENESS:
+            # Superseded by the next awareness message anyway
+            self._count_drops(1)
+            return True
+
+        kept = deque(
+            item for item in self._queue if item[1][0] != YMessageType.AWARENESS
+        )
+        dropped = len(self._queue) - len(kept)
+
+        updates = [item for item in kept if _is_update(item[1])]
+        if _is_update(message) and updates and self._ydoc is not None:
+            # The full state includes every queued update and `message`
+            kept = deque(item for item in kept if not _is_update(item[1]))
+            merged = create_update_message(Y.encode_state_as_update(self._ydoc))
+            # Keeps the age of the oldest merged update for the lag check
+            kept.append((updates[0][0], merged))
+            dropped += len(updates)
+            message = None
+
+        if message is not None:
+            if len(kept) >= settings.COLLAB_CLIENT_QUEUE_SIZE:
+                return False
+            kept.append((time.monotonic(), message))
+
+        self._queue = kept
+        self._count_drops(dropped)
+        self._has_messages.set()
+        return True
+
+    def _count_drops(self, count: int):
+        if self._stats and count:
+            self._stats.dropped_messages += count
+
+    async def _write_loop(self):
+        while not self._closed:
+            if not self._queue:
+                self._has_messages.clear()
+                await self._has_messages.wait()
+                continue
+            _, message = self._queue[0]
+            try:
+                await self._websocket.send_bytes(message)
+            except Exception:
+                # Closed by the client or after a close message was sent
+                self._closed = True
                 return
-            raise e
+            if self._queue and self._queue[0][1] is message:
+                self._queue.popleft()
+
+    def _disconnect_lagging(self):
+        if self._closed:
+            return
+        logging.warning(
+            f"Disconnecting websocket {self.path}: "
+            f"{len(self._queue)} messages queued for too long"
+        )
+        self._closed = True
+        self._count_drops(len(self._queue))
+        self._queue.clear()
+        if self._stats:
+            self._stats.lag_disconnects += 1
+        # In its own task: `send` runs on the room's broadcast path and must
+        # not wait for the slow socket to close
+        self._closing = asyncio.create_task(self.disconnect(1013))  # try again later
+
+    async def disconnect(self, code: int):
+        """Closes the websocket, which ends the receive loop of YRoom.serve."""
+        await self.close()
+        try:
+            await asyncio.wait_for(self._websocket.close(code=code), timeout=1.0)
         except Exception:
-            raise
+            pass
+
+    async def close(self):
+        """Stops the writer task, dropping anything still queued."""
+        self._closed = True
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
 
     async def recv(self) -> bytes:
         data = await self._websocket.receive_bytes()
@@ -33,12 +211,30 @@ class FastAPIwebsocketAdapter:
         return self
 
     async def __anext__(self):
-        try:
-            return await self.recv()
-        except WebSocketDisconnect:
-            raise StopAsyncIteration
-        except Exception as e:
-            raise StopAsyncIteration
+        while True:
+            try:
+                message = await self.recv()
+            except WebSocketDisconnect:
+                raise StopAsyncIteration
+            except Exception as e:
+                raise StopAsyncIteration
+
+            if self._initial_sync and self._is_fresh_join(message):
+                # Queued as separate messages, the writer sends them one at a
+                # time so large documents do not hold up the event loop
+                for reply in self._initial_sync():
+                    await self.send(reply)
+                continue
+            return message
+
+    @staticmethod
+    def _is_fresh_join(message: bytes) -> bool:
+        return (
+            len(message) > 2
+            and message[0] == YMessageType.SYNC
+            and message[1] == YSyncMessageType.SYNC_STEP1
+            and read_message(message[2:]) == EMPTY_STATE_VECTOR
+        )
 
     @property
     def path(self) -> str:
@@ -54,35 +250,162 @@ async def websocket_endpoint(
     project_id: str,
 ):
     """
-    WebSocket endpoint for Yjs collaboration.
+    WebSocket endpoint for Yjs collaboration on the project's main file.
     URL: /api/v1/editor/ws/{project_id}
     The {project_id} here captures the 'room name' sent by y-websocket.
+
+    A joining client receives the document's whole state in one message,
+    since a Yjs update cannot be split into valid parts. The size of a
+    document is therefore limited by the smallest websocket frame limit
+    between the server and the client (browser, proxies); states larger
+    than COLLAB_SYNC_MESSAGE_WARN_BYTES are logged and counted in /stats.
+    """
+    await _serve_document(websocket, project_id)
+
+
+@router.websocket("/ws/{project_id}/{file_path:path}")
+async def file_websocket_endpoint(
+    websocket: WebSocket,
+    project_id: str,
+    file_path: str,
+):
+    """
+    WebSocket endpoint for Yjs collaboration on one file of a project.
+    URL: /api/v1/editor/ws/{project_id}/{file_path}
+    Each file is a separate room, loaded when its first client connects.
+    The size limit of the main file's endpoint applies.
     """
     try:
-        room = collaboration_service.get_room(project_id)
+        doc_id = document_id(project_id, normalize_file_path(file_path))
+    except ValueError:
+        await websocket.close(code=1008)  # policy violation
+        return
+    await _serve_document(websocket, doc_id)
+
+
+async def _serve_document(websocket: WebSocket, doc_id: str):
+    try:
+        # Waits for the (shared) load of the room's document
+        room = await collaboration_service.get_room(doc_id)
     except Exception as e:
+        logging.error(f"Could not open room {doc_id}: {e}")
         await websocket.close(code=1011)  # internal error
         return
 
     await websocket.accept()
-    logging.info(f"WebSocket accepted for project/room {project_id}")
-
-    # Wait for room to be ready (loaded from DB)
-    wait_count = 0
-    while not room.ready:
-        if wait_count % 10 == 0:
-            logging.info(f"Waiting for room {project_id} to be ready... ({wait_count})")
-        await asyncio.sleep(0.1)
-        wait_count += 1
-
-    logging.info(f"Room {project_id} is ready. Starting adapter.")
-    adapter = FastAPIwebsocketAdapter(websocket)
+    logging.info(f"WebSocket accepted for room {doc_id}")
+
+    adapter = FastAPIwebsocketAdapter(
+        websocket,
+        room.ydoc,
+        collaboration_service.room_stats.get(doc_id),
+        initial_sync=partial(collaboration_service.initial_sync_messages, doc_id),
+    )
     try:
-        await room.serve(adapter)
+        await collaboration_service.serve(doc_id, room, adapter)
     except Exception as e:
         # Check if it's a disconnect
         # ypy-websocket might raise or just return
         pass
+    finally:
+        await adapter.close()
+
+
+@router.get("/stats")
+def read_collaboration_stats(current_user: CurrentUser):
+    """
+    Resident rooms, connected clients, estimated memory and eviction counters
+    of this worker's collaboration service.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return collaboration_service.get_stats()
+
+
+@router.get("/compile/stats")
+def read_compile_stats(current_user: CurrentUser):
+    """
+    Compile cache, worker pool, job queue and precompile counters of this
+    worker.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {**compiler_service.get_stats(), "precompile": precompiler.get_stats()}
+
+
+def _get_project(
+    session: SessionDep, current_user: CurrentUser, project_id: uuid.UUID
+) -> Project:
+    project = session.get(Project, project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if not current_user.is_superuser and project.owner_id != current_user.id:
+        if not session.get(ProjectMember, (project_id, current_user.id)):
+            raise HTTPException(status_code=403, detail="Not a member of this project")
+    return project
+
+
+def _get_job(current_user: CurrentUser, job_id: str) -> CompileJob:
+    job = compiler_service.queue.get(job_id)
+    # Other users' jobs are reported as missing
+    if not job or (current_user.id not in job.users and not current_user.is_superuser):
+        raise HTTPException(status_code=404, detail="Compile job not found")
+    return job
+
+
+def _job_public(job: CompileJob) -> CompileJobPublic:
+    return CompileJobPublic(
+        id=job.id,
+        project_id=job.project_id,
+        status=job.status,
+        queue_position=compiler_service.queue.position(job),
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        error=job.error,
+        superseded_by=job.superseded_by,
+        preview=job.preview,
+        diagnostics=[
+            CompileDiagnostic(**diagnostic.to_dict())
+            for diagnostic in job.log.diagnostics
+        ],
+    )
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+def _job_pdf(job: CompileJob) -> Response:
+    if not job.done:
+        raise HTTPException(status_code=409, detail="Compile job has not finished")
+    if job.status == FAILED:
+        raise HTTPException(status_code=job.error_status, detail=job.error)
+    if job.status == SUPERSEDED:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Compile job was superseded by {job.superseded_by}",
+        )
+    return Response(
+        content=job.pdf,
+        media_type="application/pdf",
+        headers={"X-Compile-Job": job.id},
+    )
+
+
+def _load_files(bind, project_id: uuid.UUID) -> FileTree:
+    """
+    The stored file tree of a project, uncompacted Yjs updates included,
+    and its uploaded figures and bibliographies (linked into the build by
+    hash). Blocking, run in a thread with its own session.
+    """
+    with Session(bind) as session:
+        project = session.get(Project, project_id)
+        if project is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        files = document_store.read_files(session, project)
+        files.update(asset_store.project_assets(session, project_id))
+        return files
 
 
 @router.post("/{project_id}/compile")
@@ -90,32 +413,194 @@ async def compile_project(
     project_id: uuid.UUID,
     # request: CompileRequest, # Content from client is ignored or optional
     session: SessionDep,
+    current_user: CurrentUser,
+    wait: bool = True,
+    preview: bool = False,
+    include: List[str] = Query(default=[]),
+    cursor_file: Optional[str] = None,
+    cursor_line: Optional[int] = None,
 ):
     """
-    Compile the project's LaTeX content into a PDF.
+    Compile the project's files into a PDF.
     Uses Server-Side State (YDoc or DB).
+
+    The compile is queued, unless the sources were compiled before: the
+    job is then finished right away with the cached PDF. With `wait` (the
+    default) the PDF is returned once it is ready; otherwise the job is
+    returned with status 202 and can be polled at `/compile/jobs/{job_id}`.
+    A full queue is answered with 429 and a Retry-After header.
+
+    Requests for unchanged sources share the compile already in flight;
+    newer sources supersede it, and waiting requests get the newer PDF.
+
+    With `preview`, a fast draft is compiled instead: only the `include`d
+    chapters, or the chapter or section at `cursor_file`/`cursor_line`, in
+    a single pass with images left out. Previews do not replace the full
+    PDF served at `/{project_id}/pdf`.
     """
     project_id_str = str(project_id)
-    content = ""
-
-    # 1. Check active room
-    room = collaboration_service.rooms.get(project_id_str)
-    if room and room.ready:
-        content = str(room.ydoc.get_text("codemirror"))
-        logging.info(f"Compiling from Active YRoom: {project_id_str}")
-    else:
-        # 2. Check DB
-        project = session.get(Project, project_id)
-        if not project:
-            raise HTTPException(status_code=404, detail="Project not found")
-        content = project.content or ""
-        logging.info(f"Compiling from DB: {project_id_str}")
+    selection = None
+    if preview:
+        try:
+            selection = PreviewSelection(include, cursor_file, cursor_line)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    _get_project(session, current_user, project_id)
+    files = await asyncio.to_thread(_load_files, session.get_bind(), project_id)
+    # Files open in an active room are taken from the live YDoc
+    files = collaboration_service.live_files(project_id_str, files)
 
     try:
-        pdf_bytes = await compiler_service.compile_project(project_id_str, content)
-        return Response(content=pdf_bytes, media_type="application/pdf")
-    except Exception as e:
-        print(f"Compilation error: {e}")
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=500, detail=str(e))
+        job = await compiler_service.submit(
+            project_id_str, current_user.id, files, preview=selection
+        )
+    except CompileQueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    if not wait:
+        return JSONResponse(status_code=202, content=jsonable_encoder(_job_public(job)))
+    # A newer version of the project may replace this compile meanwhile
+    return _job_pdf(await compiler_service.queue.latest(job))
+
+
+def _byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    First and last byte of a single-range `Range` header. Returns None to
+    serve the whole body: no header, a malformed one or several ranges.
+    Raises 416 when the range starts past the end.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes=") :].strip().partition("-")
+    try:
+        if not start:
+            # Suffix range: the last `end` bytes
+            length = int(end)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if first >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    if last < first:
+        return None
+    return first, min(last, size - 1)
+
+
+@router.get("/{project_id}/pdf")
+def read_project_pdf(
+    project_id: uuid.UUID,
+    request: Request,
+    session: SessionDep,
+    current_user: CurrentUser,
+):
+    """
+    Latest compiled PDF of the project.
+
+    The strong ETag is the hash of the PDF, so `If-None-Match` requests get
+    a 304 until the PDF changes. Single byte ranges are served with 206,
+    letting PDF viewers load the pages they show first.
+    """
+    _get_project(session, current_user, project_id)
+    cache = compiler_service.cache
+    pdf = cache.latest(str(project_id)) if cache else None
+    if pdf is None:
+        raise HTTPException(status_code=404, detail="Project has no compiled PDF")
+
+    etag = f'"{pdf.etag}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Private to the project's users and revalidated on every view
+        "Cache-Control": "private, no-cache",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (
+        tag.strip() for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = _byte_range(request.headers.get("range"), pdf.size)
+    # A range of an older version would not fit the client's copy
+    if byte_range and request.headers.get("if-range", etag) != etag:
+        byte_range = None
+    first, last = byte_range or (0, pdf.size - 1)
+    try:
+        with open(pdf.path, "rb") as f:
+            f.seek(first)
+            content = f.read(last - first + 1)
+    except FileNotFoundError:
+        # Evicted from the cache meanwhile
+        raise HTTPException(status_code=404, detail="Project has no compiled PDF")
+
+    if byte_range is None:
+        return Response(content=content, media_type="application/pdf", headers=headers)
+    headers["Content-Range"] = f"bytes {first}-{last}/{pdf.size}"
+    return Response(
+        content=content,
+        status_code=206,
+        media_type="application/pdf",
+        headers=headers,
+    )
+
+
+@router.get("/compile/jobs/{job_id}", response_model=CompileJobPublic)
+async def read_compile_job(current_user: CurrentUser, job_id: str, wait: float = 0):
+    """
+    Status of a compile job. With `wait` (seconds, at most 60) the request
+    is held until the job finishes or the time runs out.
+    """
+    job = _get_job(current_user, job_id)
+    if wait > 0:
+        await job.wait(min(wait, 60.0))
+    return _job_public(job)
+
+
+@router.get("/compile/jobs/{job_id}/pdf")
+def read_compile_job_pdf(current_user: CurrentUser, job_id: str):
+    """
+    PDF of a finished compile job.
+    """
+    return _job_pdf(_get_job(current_user, job_id))
+
+
+@router.get("/compile/jobs/{job_id}/events")
+async def stream_compile_job(current_user: CurrentUser, job_id: str):
+    """
+    Server-sent events of a compile job, replayed from the start for late
+    joiners: `status` (the job) first and once it is done, `log` with the
+    compiler's output lines as they are produced, `pass` when pdflatex
+    starts another pass, outdating the diagnostics sent so far, and
+    `diagnostic` for each error or warning found.
+    """
+    job = _get_job(current_user, job_id)
+
+    async def events():
+        yield _sse("status", _job_public(job))
+        async for kind, payload in job.log.follow():
+            if kind == "log":
+                yield _sse("log", {"lines": payload})
+            elif kind == "pass":
+                yield _sse("pass", {"pass": payload})
+            else:
+                yield _sse("diagnostic", payload.to_dict())
+        await job.wait()
+        yield _sse("status", _job_public(job))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
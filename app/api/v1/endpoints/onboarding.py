@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 from langchain_core.messages import HumanMessage
+from app.agents.checkpointer import onboarding_checkpointer
+from app.agents.dates import deadline_parser
+from app.agents.intent import intent_classifier
 from app.agents.onboarding import onboarding_graph
+from app.core.llm import llm_cache
 
 from app.api.deps import SessionDep, CurrentUser
 from app.models.project import Project
@@ -122,8 +127,26 @@ class ChatResponse(BaseModel):
     )
 
 
+async def _run_until_disconnected(http_request: Request, coro) -> Any:
+    """
+    Awaits `coro`, cancelling it (and the LLM generation it waits on) if the
+    client disconnects first.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=1.0)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        task.cancel()
+
+
 @router.post("/chat", response_model=ChatResponse)
-async def chat_onboarding(request: ChatRequest):
+async def chat_onboarding(request: ChatRequest, http_request: Request):
     """
     Chat with the Onboarding Agent.
     """
@@ -145,9 +168,11 @@ async def chat_onboarding(request: ChatRequest):
     config = {"configurable": {"thread_id": request.conversation_id}}
 
     try:
-        # Use invoke for synchronous execution (simpler for now)
+        # Nodes await the LLM, so other requests are served meanwhile
         # For streaming, we'd use astream_events
-        result = await onboarding_graph.ainvoke(initial_state, config=config)
+        result = await _run_until_disconnected(
+            http_request, onboarding_graph.ainvoke(initial_state, config=config)
+        )
 
         last_message = result["messages"][-1]
         response_content = (
@@ -171,5 +196,23 @@ async def chat_onboarding(request: ChatRequest):
             structured_data=structured_data if structured_data else None,
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/stats")
+def read_onboarding_stats(current_user: CurrentUser):
+    """
+    Local intent classification, deadline parsing, LLM cache and
+    conversation checkpoint counters of this worker.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return {
+        "intent": intent_classifier.get_stats(),
+        "deadline_parser": deadline_parser.get_stats(),
+        "llm_cache": llm_cache.get_stats(),
+        "checkpointer": onboarding_checkpointer.get_stats(),
+    }
@@ -1,8 +1,10 @@
 import uuid
-from typing import Any
+from typing import Any, Callable, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException
+from anyio import from_thread
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
 from sqlmodel import select
 
 from app.api.deps import SessionDep, CurrentUser
@@ -14,7 +16,19 @@ from app.models.project_member import (
     ProjectMemberCreate,
     ProjectMemberPublic,
 )
+from app.models.project_file import (
+    MAIN_FILE,
+    ProjectFile,
+    ProjectFileCreate,
+    ProjectFilePublic,
+    ProjectFileSummary,
+    normalize_file_path,
+)
+from app.models.project_asset import ProjectAsset, ProjectAssetPublic
 from app.models.user import User
+from app.services.asset_store import AssetTooLarge, asset_store
+from app.services.collaboration import collaboration_service
+from app.services.document_store import document_store
 
 router = APIRouter()
 
@@ -93,9 +107,24 @@ def read_project(
         if not member:
             raise HTTPException(status_code=403, detail="Not a member of this project")
 
+    document_store.materialize_content(session, project)
     return project
 
 
+def _replace_documents(
+    project_id: uuid.UUID, path: Optional[str], replace: Callable[[], None]
+):
+    """
+    Runs `replace`, which resets the stored state of a file (of every file
+    when `path` is None) and commits, while its live editor rooms are held
+    closed, then disconnects their clients. Neither the rooms nor clients
+    reconnecting meanwhile can save the old state on top of the new one.
+    """
+    from_thread.run(
+        collaboration_service.discard_rooms, str(project_id), path, replace
+    )
+
+
 @router.put("/{id}", response_model=ProjectPublic)
 def update_project(
     *,
@@ -117,11 +146,20 @@ def update_project(
                 raise HTTPException(status_code=403, detail="Not enough permissions")
 
     update_data = project_in.model_dump(exclude_unset=True)
-    project.sqlmodel_update(update_data)
-    project.updated_at = datetime.utcnow()
 
-    session.add(project)
-    session.commit()
+    def save():
+        if "content" in update_data:
+            # Replacing the text invalidates the stored Yjs state
+            document_store.reset(session, project.id)
+        project.sqlmodel_update(update_data)
+        project.updated_at = datetime.utcnow()
+        session.add(project)
+        session.commit()
+
+    if "content" in update_data:
+        _replace_documents(project.id, MAIN_FILE, save)
+    else:
+        save()
     session.refresh(project)
     return project
 
@@ -139,8 +177,25 @@ def delete_project(
     if project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    session.delete(project)
-    session.commit()
+    assets = session.exec(
+        select(ProjectAsset).where(ProjectAsset.project_id == project.id)
+    ).all()
+    blobs = {asset.sha256 for asset in assets}
+
+    def delete():
+        document_store.reset(session, project.id, path=None)
+        for project_file in session.exec(
+            select(ProjectFile).where(ProjectFile.project_id == project.id)
+        ).all():
+            session.delete(project_file)
+        for asset in assets:
+            session.delete(asset)
+        session.delete(project)
+        session.commit()
+
+    _replace_documents(project.id, None, delete)
+    for sha256 in blobs:
+        asset_store.release(session, sha256)
     return project
 
 
@@ -273,3 +328,228 @@ def read_members(
             )
 
     return result
+
+
+def _get_project_for_files(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID, write: bool = False
+) -> Project:
+    project = session.get(Project, id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if not current_user.is_superuser and project.owner_id != current_user.id:
+        member = session.get(ProjectMember, (id, current_user.id))
+        if not member:
+            raise HTTPException(status_code=403, detail="Not a member of this project")
+        if write and member.role not in [ProjectRole.OWNER, ProjectRole.EDITOR]:
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+    return project
+
+
+def _find_file(session: SessionDep, id: uuid.UUID, path: str):
+    statement = select(ProjectFile).where(
+        ProjectFile.project_id == id, ProjectFile.path == path
+    )
+    return session.exec(statement).first()
+
+
+def _validated_path(path: str) -> str:
+    try:
+        return normalize_file_path(path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{id}/files", response_model=list[ProjectFileSummary])
+def read_files(*, session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+    """
+    List the files of a project, main file first.
+    """
+    project = _get_project_for_files(session, current_user, id)
+    statement = (
+        select(ProjectFile)
+        .where(ProjectFile.project_id == id)
+        .order_by(ProjectFile.path)
+    )
+    files = [ProjectFileSummary(path=MAIN_FILE, updated_at=project.updated_at)]
+    for project_file in session.exec(statement).all():
+        files.append(
+            ProjectFileSummary(
+                path=project_file.path, updated_at=project_file.updated_at
+            )
+        )
+    return files
+
+
+@router.post("/{id}/files", response_model=ProjectFilePublic)
+def create_file(
+    *,
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    file_in: ProjectFileCreate,
+) -> Any:
+    """
+    Add a file to a project. Its contents are edited through the file's
+    editor websocket.
+    """
+    _get_project_for_files(session, current_user, id, write=True)
+    if (
+        file_in.path == MAIN_FILE
+        or _find_file(session, id, file_in.path)
+        or _find_asset(session, id, file_in.path)
+    ):
+        raise HTTPException(status_code=400, detail="File already exists")
+
+    project_file = ProjectFile.model_validate(file_in, update={"project_id": id})
+    # Leftovers of a deleted file with the same path must not be replayed
+    document_store.reset(session, id, project_file.path)
+    session.add(project_file)
+    session.commit()
+    session.refresh(project_file)
+    return project_file
+
+
+@router.get("/{id}/files/{path:path}", response_model=ProjectFilePublic)
+def read_file(
+    *, session: SessionDep, current_user: CurrentUser, id: uuid.UUID, path: str
+) -> Any:
+    """
+    Get a file of a project with its current content.
+    """
+    project = _get_project_for_files(session, current_user, id)
+    path = _validated_path(path)
+    files = document_store.read_files(session, project)
+    if path not in files:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if path == MAIN_FILE:
+        updated_at = project.updated_at
+    else:
+        updated_at = _find_file(session, id, path).updated_at
+    return ProjectFilePublic(path=path, content=files[path], updated_at=updated_at)
+
+
+@router.delete("/{id}/files/{path:path}", response_model=Any)
+def delete_file(
+    *, session: SessionDep, current_user: CurrentUser, id: uuid.UUID, path: str
+) -> Any:
+    """
+    Delete a file of a project. The main file cannot be deleted.
+    """
+    _get_project_for_files(session, current_user, id, write=True)
+    path = _validated_path(path)
+    if path == MAIN_FILE:
+        raise HTTPException(status_code=400, detail="The main file cannot be deleted")
+
+    project_file = _find_file(session, id, path)
+    if not project_file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    def delete():
+        document_store.reset(session, id, path)
+        session.delete(project_file)
+        session.commit()
+
+    _replace_documents(id, path, delete)
+    return {"status": "success"}
+
+
+def _find_asset(session: SessionDep, id: uuid.UUID, path: str):
+    statement = select(ProjectAsset).where(
+        ProjectAsset.project_id == id, ProjectAsset.path == path
+    )
+    return session.exec(statement).first()
+
+
+@router.get("/{id}/assets", response_model=list[ProjectAssetPublic])
+def read_assets(
+    *, session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Any:
+    """
+    List the uploaded assets (figures, bibliographies...) of a project.
+    """
+    _get_project_for_files(session, current_user, id)
+    statement = (
+        select(ProjectAsset)
+        .where(ProjectAsset.project_id == id)
+        .order_by(ProjectAsset.path)
+    )
+    return session.exec(statement).all()
+
+
+@router.put("/{id}/assets/{path:path}", response_model=ProjectAssetPublic)
+async def upload_asset(
+    *,
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    path: str,
+    request: Request,
+) -> Any:
+    """
+    Upload an asset to a project, replacing the one at `path` if any. The
+    request body is the raw file content, streamed to the asset store;
+    identical files are stored once across all projects.
+    """
+    _get_project_for_files(session, current_user, id, write=True)
+    path = _validated_path(path)
+    if path == MAIN_FILE or _find_file(session, id, path):
+        raise HTTPException(status_code=400, detail="A text file has this path")
+
+    try:
+        sha256, size = await asset_store.put_stream(request.stream())
+    except AssetTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    asset = _find_asset(session, id, path)
+    replaced = asset.sha256 if asset else None
+    if asset is None:
+        asset = ProjectAsset(project_id=id, path=path, sha256=sha256, size=size)
+    asset.sha256 = sha256
+    asset.size = size
+    asset.content_type = request.headers.get("content-type")
+    asset.updated_at = datetime.utcnow()
+    session.add(asset)
+    session.commit()
+    session.refresh(asset)
+    if replaced and replaced != sha256:
+        asset_store.release(session, replaced)
+    return asset
+
+
+@router.get("/{id}/assets/{path:path}")
+def read_asset(
+    *, session: SessionDep, current_user: CurrentUser, id: uuid.UUID, path: str
+) -> Any:
+    """
+    Download an asset of a project.
+    """
+    _get_project_for_files(session, current_user, id)
+    asset = _find_asset(session, id, _validated_path(path))
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    return FileResponse(
+        asset_store.path(asset.sha256),
+        media_type=asset.content_type or "application/octet-stream",
+        filename=asset.path.rsplit("/", 1)[-1],
+    )
+
+
+@router.delete("/{id}/assets/{path:path}", response_model=Any)
+def delete_asset(
+    *, session: SessionDep, current_user: CurrentUser, id: uuid.UUID, path: str
+) -> Any:
+    """
+    Delete an asset of a project. Its content stays stored while other
+    projects use it.
+    """
+    _get_project_for_files(session, current_user, id, write=True)
+    asset = _find_asset(session, id, _validated_path(path))
+    if not asset:
+        raise HTTPException(status_code=404, detail="Asset not found")
+
+    sha256 = asset.sha256
+    session.delete(asset)
+    session.commit()
+    asset_store.release(session, sha256)
+    return {"status": "success"}
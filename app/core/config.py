@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import field_validator, AnyHttpUrl
-from typing import List, Union
+from typing import Dict, List, Union
 
 
 class Settings(BaseSettings):
@@ -28,10 +28,92 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str | None = None
     GEMINI_MODEL: str = "gemini-2.0-flash"
 
+    # LLM reply cache: in memory for the most recent entries, on disk for all.
+    # Only the prompt types listed here are cached, for that many seconds
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_DIR: str = "data/llm-cache"
+    LLM_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    LLM_CACHE_MEMORY_ENTRIES: int = 1024
+    LLM_CACHE_TTLS: Dict[str, float] = {
+        "onboarding.intent": 7 * 24 * 3600,
+        "onboarding.deadline": 24 * 3600,
+    }
+
+    # Onboarding agent: generations awaited at once, and how long each may take
+    ONBOARDING_LLM_CONCURRENCY: int = 4
+    ONBOARDING_LLM_TIMEOUT_SECONDS: float = 60.0
+    # Conversations are kept in the database, bounded per thread, and deleted
+    # once idle for the TTL
+    ONBOARDING_CHECKPOINT_TTL_SECONDS: float = 7 * 24 * 3600
+    ONBOARDING_CHECKPOINTS_PER_THREAD: int = 3
+    ONBOARDING_CHECKPOINT_MAX_BYTES: int = 256 * 1024
+    ONBOARDING_CHECKPOINT_PRUNE_INTERVAL_SECONDS: float = 600.0
+    # Messages classified locally when at least this confident (or more, after
+    # calibration); the LLM's classifications of the others are logged here to
+    # train the local model, keeping the latest ONBOARDING_INTENT_MAX_EXAMPLES
+    ONBOARDING_INTENT_MIN_CONFIDENCE: float = 0.95
+    ONBOARDING_INTENT_EXAMPLES_PATH: str | None = "data/onboarding/intents.jsonl"
+    ONBOARDING_INTENT_MAX_EXAMPLES: int = 5000
+
     # MCP Configuration
     MCP_SERVER_PYTHON_PATH: str = "python3"
     MCP_SERVER_SCRIPT_PATH: str | None = None
 
+    # Collaboration Configuration
+    COLLAB_SAVE_DEBOUNCE_SECONDS: float = 2.0
+    COLLAB_FLUSH_INTERVAL_SECONDS: float = 1.0
+    COLLAB_MAX_STALENESS_SECONDS: float = 30.0
+    COLLAB_COMPACT_EVERY_UPDATES: int = 200
+    COLLAB_ROOM_IDLE_SECONDS: float = 300.0
+    COLLAB_MEMORY_BUDGET_BYTES: int = 256 * 1024 * 1024
+    COLLAB_EVICTION_INTERVAL_SECONDS: float = 30.0
+    # Outbound messages buffered per websocket before coalescing kicks in
+    COLLAB_CLIENT_QUEUE_SIZE: int = 256
+    COLLAB_CLIENT_MAX_LAG_SECONDS: float = 10.0
+    # Updates served to joiners after the cached state before it is re-encoded
+    COLLAB_STATE_CACHE_MAX_TAIL: int = 64
+    # The full state is sent to joiners as one message, as a Yjs update cannot
+    # be cut into valid parts; larger ones are logged, see the editor endpoints
+    COLLAB_SYNC_MESSAGE_WARN_BYTES: int = 4 * 1024 * 1024
+    # Shutdown drain and warm restart
+    COLLAB_SHUTDOWN_TIMEOUT_SECONDS: float = 10.0
+    COLLAB_SHUTDOWN_BATCH_SIZE: int = 25
+    COLLAB_PREWARM_ROOMS: bool = False
+    COLLAB_HOT_ROOMS_PATH: str = "/tmp/sciagent-hot-rooms.json"
+    COLLAB_PREWARM_LIMIT: int = 50
+    COLLAB_PREWARM_CONCURRENCY: int = 4
+    # "none" (single worker), "inprocess" or "unix" (several workers on one host)
+    COLLAB_RELAY_BACKEND: str = "none"
+    COLLAB_RELAY_SOCKET_PATH: str = "/tmp/sciagent-collab.sock"
+
+    # Compiler Configuration
+    COMPILE_CACHE_DIR: str = "/tmp/sciagent-compile-cache"
+    COMPILE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # "docker" (warm containers of the compiler image) or "local" (host pdflatex)
+    COMPILER_BACKEND: str = "docker"
+    # Next to ASSET_STORE_DIR by default, so that assets can be hardlinked
+    COMPILER_WORK_ROOT: str = "data/compile"
+    COMPILER_POOL_SIZE: int = 2
+    COMPILER_WORKER_MAX_JOBS: int = 200
+    COMPILER_HEALTHCHECK_INTERVAL_SECONDS: float = 60.0
+    # Compiles waiting for a worker before new ones are rejected with a retry hint
+    COMPILE_QUEUE_SIZE: int = 20
+    COMPILE_MAX_JOBS_PER_USER: int = 2
+    COMPILE_JOB_RETENTION_SECONDS: float = 300.0
+    # Per-project build directories reused across compiles
+    COMPILE_MAX_PASSES: int = 4
+    COMPILE_MAX_BUILD_DIRS: int = 100
+    COMPILE_BUILD_DIR_TTL_SECONDS: float = 6 * 3600
+    # Uploaded figures and bibliographies, deduplicated by hash. Compiles
+    # hardlink them when this is on the same filesystem as COMPILER_WORK_ROOT
+    ASSET_STORE_DIR: str = "data/assets"
+    ASSET_MAX_BYTES: int = 50 * 1024 * 1024
+    # Unused assets uploaded more recently may be about to be referenced
+    ASSET_RELEASE_GRACE_SECONDS: float = 300.0
+    # Background compiles after collaboration saves, at most one per interval
+    COMPILE_ON_SAVE: bool = False
+    COMPILE_ON_SAVE_INTERVAL_SECONDS: float = 30.0
+
     # Custom validator to parse CORS from string or list
     @property
     def cors_origins(self) -> list[str]:
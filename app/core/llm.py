@@ -1,23 +1,123 @@
-from typing import Optional
+import asyncio
+from typing import Any, Optional
+from langchain_core.messages import AIMessage
 from app.core.config import settings
+from app.services.llm_cache import LLMCache, llm_cache_key
+
+LLM_TEMPERATURE = 0.3
+
+llm_cache = LLMCache(
+    settings.LLM_CACHE_DIR,
+    settings.LLM_CACHE_MAX_BYTES,
+    settings.LLM_CACHE_MEMORY_ENTRIES,
+)
+
+
+def _cached_reply(content: str) -> AIMessage:
+    return AIMessage(content=content, response_metadata={"cached": True})
+
+
+class CachedChatModel:
+    """
+    Wraps a chat model to answer repeated prompts from an LLMCache.
+
+    Calls opt in by passing the prompt's type as `cache_as`, and are cached
+    for that type's TTL in LLM_CACHE_TTLS. Calls without one, or of a type
+    without a TTL (creative generations), always reach the model. Cached
+    replies come back as an AIMessage holding the content only, marked with
+    `response_metadata["cached"]`. Everything else is delegated to the
+    wrapped model.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        model_name: str,
+        temperature: float,
+        cache: Optional[LLMCache] = None,
+    ):
+        self.model = model
+        self.model_name = model_name
+        self.temperature = temperature
+        self.cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+    def _key(self, messages: Any, cache_as: Optional[str]) -> Optional[str]:
+        if self.cache is None or cache_as not in settings.LLM_CACHE_TTLS:
+            return None
+        return llm_cache_key(messages, self.model_name, self.temperature, cache_as)
+
+    def invoke(self, messages: Any, cache_as: Optional[str] = None, **kwargs):
+        key = self._key(messages, cache_as)
+        if key is not None:
+            content = self.cache.get(key)
+            if content is not None:
+                return _cached_reply(content)
+        response = self.model.invoke(messages, **kwargs)
+        if key is not None and isinstance(response.content, str):
+            self.cache.put(key, response.content, settings.LLM_CACHE_TTLS[cache_as])
+        return response
+
+    async def acached(
+        self, messages: Any, cache_as: Optional[str] = None
+    ) -> Optional[AIMessage]:
+        """The cached reply to `messages`, or None if it must be generated."""
+        key = self._key(messages, cache_as)
+        if key is None:
+            return None
+        content = self.cache.get_memory(key)
+        if content is None:
+            content = await asyncio.to_thread(self.cache.get_disk, key)
+        return _cached_reply(content) if content is not None else None
+
+    async def ainvoke(
+        self,
+        messages: Any,
+        cache_as: Optional[str] = None,
+        lookup: bool = True,
+        **kwargs,
+    ):
+        """
+        Async `invoke`. Callers that already missed with `acached` pass
+        `lookup=False`, so the reply is generated and cached without looking
+        it up again.
+        """
+        if lookup:
+            cached = await self.acached(messages, cache_as)
+            if cached is not None:
+                return cached
+        response = await self.model.ainvoke(messages, **kwargs)
+        key = self._key(messages, cache_as)
+        if key is not None and isinstance(response.content, str):
+            await asyncio.to_thread(
+                self.cache.put, key, response.content, settings.LLM_CACHE_TTLS[cache_as]
+            )
+        return response
 
 
 def get_llm():
     """
     Returns the configured LLM instance.
     Supports both Ollama and Google GenAI (Gemini) based on configuration.
+    Repeated prompts can be served from the LLM cache, see CachedChatModel.
     """
+    cache = llm_cache if settings.LLM_CACHE_ENABLED else None
     if settings.GEMINI_API_KEY:
         try:
             from langchain_google_genai import ChatGoogleGenerativeAI
 
-            return ChatGoogleGenerativeAI(
+            model = ChatGoogleGenerativeAI(
                 model=settings.GEMINI_MODEL,
                 google_api_key=settings.GEMINI_API_KEY,
-                temperature=0.3,
+                temperature=LLM_TEMPERATURE,
                 max_retries=5,
                 convert_system_message_to_human=True,  # Sometimes needed for older models, but harmless
             )
+            return CachedChatModel(
+                model, settings.GEMINI_MODEL, LLM_TEMPERATURE, cache
+            )
         except ImportError:
             print("WARNING: langchain_google_genai not installed. Fallback to Ollama?")
             raise
@@ -25,6 +125,9 @@ def get_llm():
     # Fallback to Ollama if no API key
     from langchain_ollama import ChatOllama
 
-    return ChatOllama(
-        base_url=settings.OLLAMA_BASE_URL, model=settings.OLLAMA_MODEL, temperature=0.3
+    model = ChatOllama(
+        base_url=settings.OLLAMA_BASE_URL,
+        model=settings.OLLAMA_MODEL,
+        temperature=LLM_TEMPERATURE,
     )
+    return CachedChatModel(model, settings.OLLAMA_MODEL, LLM_TEMPERATURE, cache)
@@ -1,11 +1,34 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # Trigger reload
+from app.agents.checkpointer import onboarding_checkpointer
+from app.agents.intent import intent_classifier
 from app.api.api import api_router
 from app.core.config import settings
+from app.services.collaboration import collaboration_service
+from app.services.compiler import compiler_service
+from app.services.precompile import precompiler
 
-app = FastAPI(title="SciAgent Backend", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await collaboration_service.startup()
+    precompiler.start()
+    onboarding_checkpointer.start()
+    await asyncio.to_thread(intent_classifier.train)
+    yield
+    await onboarding_checkpointer.stop()
+    await precompiler.stop()
+    # Save what is still buffered in live rooms before the process exits
+    await collaboration_service.shutdown()
+    # Stop the warm compiler workers
+    await compiler_service.shutdown()
+
+
+app = FastAPI(title="SciAgent Backend", version="1.0.0", lifespan=lifespan)
 
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
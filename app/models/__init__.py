@@ -4,3 +4,7 @@ from .template import Template
 from .project_member import ProjectMember, ProjectRole
 from .project_task import ProjectTask, ProjectTaskCreate, ProjectTaskUpdate, TaskStatus
 from .audit_log import ProjectAuditLog
+from .document import ProjectDocumentUpdate, ProjectDocumentSnapshot
+from .project_file import ProjectFile, ProjectFileCreate, ProjectFilePublic
+from .project_asset import ProjectAsset, ProjectAssetPublic
+from .onboarding_checkpoint import OnboardingCheckpoint, OnboardingCheckpointWrite
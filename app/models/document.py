@@ -0,0 +1,26 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel, Column, LargeBinary
+from .project_file import MAIN_FILE
+
+
+class ProjectDocumentUpdate(SQLModel, table=True):
+    """Append-only log of binary Yjs updates for one file of a project."""
+
+    __tablename__ = "project_document_updates"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    project_id: uuid.UUID = Field(foreign_key="projects.id", index=True)
+    path: str = Field(default=MAIN_FILE)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ProjectDocumentSnapshot(SQLModel, table=True):
+    """Compacted Yjs state of a project file (all updates up to compaction)."""
+
+    __tablename__ = "project_document_snapshots"
+    project_id: uuid.UUID = Field(foreign_key="projects.id", primary_key=True)
+    path: str = Field(default=MAIN_FILE, primary_key=True)
+    state: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Optional
+from sqlmodel import Field, SQLModel, Column, LargeBinary
+
+
+class OnboardingCheckpoint(SQLModel, table=True):
+    """A saved state of an onboarding conversation (a LangGraph thread)."""
+
+    __tablename__ = "onboarding_checkpoints"
+    thread_id: str = Field(primary_key=True)
+    checkpoint_ns: str = Field(default="", primary_key=True)
+    # Time-ordered, the latest checkpoint of a thread has the highest id
+    checkpoint_id: str = Field(primary_key=True)
+    parent_checkpoint_id: Optional[str] = None
+    # Serializer type tags and payloads of the checkpoint and its metadata
+    type: str
+    checkpoint: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    meta_type: str
+    meta: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    size: int
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class OnboardingCheckpointWrite(SQLModel, table=True):
+    """A pending write of a task, recorded against its checkpoint."""
+
+    __tablename__ = "onboarding_checkpoint_writes"
+    thread_id: str = Field(primary_key=True)
+    checkpoint_ns: str = Field(default="", primary_key=True)
+    checkpoint_id: str = Field(primary_key=True)
+    task_id: str = Field(primary_key=True)
+    idx: int = Field(primary_key=True)
+    channel: str
+    type: str
+    value: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+    task_path: str = ""
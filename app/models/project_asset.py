@@ -0,0 +1,28 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field, SQLModel
+
+
+class ProjectAssetBase(SQLModel):
+    path: str
+    # SHA-256 of the content, the key of the blob in the asset store
+    sha256: str = Field(index=True)
+    size: int
+    content_type: Optional[str] = None
+
+
+class ProjectAsset(ProjectAssetBase, table=True):
+    """An uploaded binary file of a project, e.g. a figure or a .bib file."""
+
+    __tablename__ = "project_assets"
+    __table_args__ = (UniqueConstraint("project_id", "path"),)
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    project_id: uuid.UUID = Field(foreign_key="projects.id", index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ProjectAssetPublic(ProjectAssetBase):
+    updated_at: datetime
@@ -0,0 +1,56 @@
+import posixpath
+import uuid
+from datetime import datetime
+from typing import Optional
+from pydantic import field_validator
+from sqlalchemy import UniqueConstraint
+from sqlmodel import Field, SQLModel
+
+# The main file of a project lives in `Project.content`
+MAIN_FILE = "main.tex"
+
+
+def normalize_file_path(path: str) -> str:
+    """
+    Returns `path` as a clean relative POSIX path, raising ValueError for
+    paths that are empty or would escape the project directory.
+    """
+    path = path.strip()
+    if not path or path.startswith("/") or "\\" in path:
+        raise ValueError(f"Invalid file path: {path!r}")
+    normalized = posixpath.normpath(path)
+    if normalized == "." or normalized.split("/")[0] == "..":
+        raise ValueError(f"Invalid file path: {path!r}")
+    return normalized
+
+
+class ProjectFileBase(SQLModel):
+    path: str
+    content: Optional[str] = None
+
+
+class ProjectFile(ProjectFileBase, table=True):
+    """A file of a project other than its main file."""
+
+    __tablename__ = "project_files"
+    __table_args__ = (UniqueConstraint("project_id", "path"),)
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    project_id: uuid.UUID = Field(foreign_key="projects.id", index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ProjectFileCreate(ProjectFileBase):
+    @field_validator("path")
+    @classmethod
+    def validate_path(cls, v: str) -> str:
+        return normalize_file_path(v)
+
+
+class ProjectFileSummary(SQLModel):
+    path: str
+    updated_at: datetime
+
+
+class ProjectFilePublic(ProjectFileSummary):
+    content: Optional[str] = None
@@ -1,5 +1,34 @@
+from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel
 
 
 class CompileRequest(BaseModel):
     content: str
+
+
+class CompileDiagnostic(BaseModel):
+    # "error" or "warning"
+    severity: str
+    message: str
+    # Project file and line it refers to, when pdflatex reported them
+    file: Optional[str] = None
+    line: Optional[int] = None
+
+
+class CompileJobPublic(BaseModel):
+    id: str
+    project_id: str
+    status: str
+    # Jobs ahead of this one while it is queued
+    queue_position: Optional[int] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    # Job compiling a newer version of the project, when superseded
+    superseded_by: Optional[str] = None
+    # Draft compile of part of the project
+    preview: bool = False
+    # Errors and warnings of the latest pdflatex pass
+    diagnostics: List[CompileDiagnostic] = []
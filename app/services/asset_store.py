@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import AsyncIterator, Dict, Tuple, Union
+from uuid import UUID
+from sqlmodel import Session, select
+from app.core.config import settings
+from app.models.project_asset import ProjectAsset
+
+logger = logging.getLogger(__name__)
+
+
+class AssetRef:
+    """An uploaded file in a project's file tree, by the hash of its content."""
+
+    def __init__(self, sha256: str):
+        self.sha256 = sha256
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, AssetRef) and other.sha256 == self.sha256
+
+    def __hash__(self) -> int:
+        return hash(self.sha256)
+
+    def __repr__(self) -> str:
+        return f"AssetRef({self.sha256!r})"
+
+
+# A project's files to compile: path -> text, or AssetRef for uploads
+FileTree = Dict[str, Union[str, AssetRef]]
+
+
+class AssetTooLarge(Exception):
+    """An upload went past the store's size limit."""
+
+
+class AssetStore:
+    """
+    Uploaded files, stored once per content hash under `root` however many
+    projects or paths use them.
+
+    Blobs are read-only and never rewritten, so build directories hardlink
+    them instead of copying (see `link`), which takes the same time for any
+    file size when `root` and COMPILER_WORK_ROOT share a filesystem. Only
+    `put_stream` is async; call the other methods with `asyncio.to_thread`.
+
+    An upload stores (or finds) its blob before the request commits the
+    row referencing it, so blobs uploaded less than `release_grace` seconds
+    ago are not removed, see `release`.
+    """
+
+    def __init__(self, root: str, max_bytes: int, release_grace: float = 0.0):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.release_grace = release_grace
+        # Unused blobs kept for their grace period -> when to check again
+        self._deferred: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+        self.links = 0
+        self.copies = 0
+
+    def path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    async def put_stream(self, chunks: AsyncIterator[bytes]) -> Tuple[str, int]:
+        """
+        Stores an upload as it arrives and returns its hash and size. Raises
+        AssetTooLarge once it goes past `max_bytes`.
+        """
+        tmp_dir = self.root / ".uploads"
+        await asyncio.to_thread(tmp_dir.mkdir, parents=True, exist_ok=True)
+        # In the store's filesystem, so the finished upload is renamed in place
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+
+        def write(f, chunk: bytes):
+            f.write(chunk)
+            digest.update(chunk)
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AssetTooLarge(
+                            f"Files are limited to {self.max_bytes} bytes"
+                        )
+                    await asyncio.to_thread(write, f, chunk)
+            sha256 = digest.hexdigest()
+            await asyncio.to_thread(self._commit, tmp_path, sha256)
+        finally:
+            Path(tmp_path).unlink(missing_ok=True)
+        return sha256, size
+
+    def _commit(self, tmp_path: str, sha256: str):
+        path = self.path(sha256)
+        try:
+            # The access time records the upload, see `release`; copies
+            # compare the modification time, which is kept
+            os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+            self.deduplicated += 1
+            return
+        except FileNotFoundError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Hardlinks share the blob's inode, read-only keeps compiles off it
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+        self.stored += 1
+
+    def link(self, sha256: str, dest: Path) -> None:
+        """
+        Makes `dest` a hardlink to the blob, copying it only when the two
+        are on different filesystems. No-op if `dest` already is the blob,
+        or a copy of it (same size and modification time, which copies
+        keep). Raises FileNotFoundError if the blob is missing.
+        """
+        blob = self.path(sha256)
+        try:
+            if os.path.samefile(blob, dest):
+                return
+            blob_stat, dest_stat = blob.stat(), dest.stat()
+            if (
+                blob_stat.st_size == dest_stat.st_size
+                and blob_stat.st_mtime_ns == dest_stat.st_mtime_ns
+            ):
+                return
+        except FileNotFoundError:
+            pass
+        blob_stat = blob.stat()
+        dest.unlink(missing_ok=True)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(blob, dest)
+            self.links += 1
+        except OSError:
+            # Cross-device: fall back to a private copy, stamped with the
+            # blob's modification time so the next compile can reuse it
+            shutil.copyfile(blob, dest)
+            os.utime(dest, ns=(blob_stat.st_atime_ns, blob_stat.st_mtime_ns))
+            self.copies += 1
+
+    def project_assets(
+        self, session: Session, project_id: UUID
+    ) -> Dict[str, AssetRef]:
+        """The assets of a project's file tree (path -> AssetRef)."""
+        assets = session.exec(
+            select(ProjectAsset).where(ProjectAsset.project_id == project_id)
+        ).all()
+        return {asset.path: AssetRef(asset.sha256) for asset in assets}
+
+    def release(self, session: Session, sha256: str) -> None:
+        """
+        Removes a blob that no project uses anymore, unless it was uploaded
+        within `release_grace` seconds: an upload that found it may not have
+        committed its reference yet. Such blobs are checked again by the
+        first release after their grace period.
+        """
+        now = time.time()
+        with self._lock:
+            due = {sha256} | {
+                digest for digest, at in self._deferred.items() if at <= now
+            }
+            for digest in due:
+                self._deferred.pop(digest, None)
+        for digest in due:
+            self._release(session, digest, now)
+
+    def _release(self, session: Session, sha256: str, now: float) -> None:
+        in_use = session.exec(
+            select(ProjectAsset.id).where(ProjectAsset.sha256 == sha256)
+        ).first()
+        if in_use is not None:
+            return
+        path = self.path(sha256)
+        try:
+            uploaded = path.stat().st_atime
+        except FileNotFoundError:
+            return
+        if now - uploaded < self.release_grace:
+            with self._lock:
+                self._deferred[sha256] = uploaded + self.release_grace
+            return
+        # Build directories keep their hardlinks until their next sync
+        path.unlink(missing_ok=True)
+        logger.info(f"Removed unused asset {sha256}")
+
+    def get_stats(self) -> dict:
+        return {
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "links": self.links,
+            "copies": self.copies,
+            "deferred_releases": len(self._deferred),
+        }
+
+
+asset_store = AssetStore(
+    settings.ASSET_STORE_DIR,
+    settings.ASSET_MAX_BYTES,
+    settings.ASSET_RELEASE_GRACE_SECONDS,
+)
@@ -1,36 +1,252 @@
 import asyncio
+import hashlib
+import json
 import logging
-from typing import Dict, Optional
-from uuid import UUID
+import os
+import time
+from functools import partial
+from typing import Callable, Dict, List, Tuple
 import y_py as Y
+from sqlalchemy.exc import IntegrityError
 from ypy_websocket.yroom import YRoom
-from sqlmodel import Session, select
-from app.db.session import engine
-from app.models.project import Project
+from ypy_websocket.yutils import (
+    YMessageType,
+    YSyncMessageType,
+    create_sync_step1_message,
+    create_sync_step2_message,
+    create_update_message,
+    read_message,
+)
+from app.core.config import settings
+from app.models.project_file import MAIN_FILE
+from app.services.document_store import (
+    EMPTY_UPDATE,
+    TEXT_NAME,
+    document_id,
+    document_store,
+)
+from app.services.relay import CollaborationRelay, get_relay
 
 logger = logging.getLogger(__name__)
 
 
-class CollaborationService:
+def _content_hash(room: YRoom) -> str:
+    return hashlib.sha256(str(room.ydoc.get_text(TEXT_NAME)).encode()).hexdigest()
+
+
+def _read_hot_rooms() -> List[str]:
+    try:
+        with open(settings.COLLAB_HOT_ROOMS_PATH) as f:
+            return json.load(f)[: settings.COLLAB_PREWARM_LIMIT]
+    except (OSError, ValueError):
+        return []
+
+
+def _write_hot_rooms(room_ids: List[str]):
+    """
+    Records `room_ids` (most recently active first) ahead of the rooms other
+    workers recorded, replacing the file atomically.
+    """
+    merged = list(dict.fromkeys(room_ids + _read_hot_rooms()))
+    tmp_path = f"{settings.COLLAB_HOT_ROOMS_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(merged[: settings.COLLAB_PREWARM_LIMIT], f)
+    os.replace(tmp_path, settings.COLLAB_HOT_ROOMS_PATH)
+
+
+class RoomLoadError(Exception):
+    """Raised to every joiner of a room whose document could not be loaded."""
+
+
+class RoomStats:
+    """Per-room bookkeeping for the write-behind flusher and eviction."""
+
+    def __init__(self):
+        self.clients = 0
+        self.last_activity = time.monotonic()
+        # Estimated from the encoded Yjs state, the live YDoc is a few times larger
+        self.resident_bytes = 0
+        # When the first unsaved change happened (None if clean) and the latest one
+        self.dirty_since: float | None = None
+        self.last_change = 0.0
+        self.saved_hash: str | None = None
+        # Outbound messages dropped or merged away for slow clients
+        self.dropped_messages = 0
+        self.lag_disconnects = 0
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def mark_dirty(self):
+        self.last_change = time.monotonic()
+        if self.dirty_since is None:
+            self.dirty_since = self.last_change
+
+
+class EncodedStateCache:
+    """
+    A room's encoded state as served to new joiners: one full-state sync
+    step 2 message, followed by the update messages observed since it was
+    encoded. Changes append to the tail instead of re-encoding the whole
+    document; the cache is invalidated once the tail grows past
+    COLLAB_STATE_CACHE_MAX_TAIL and rebuilt by the next joiner.
+    """
+
     def __init__(self):
+        self.base: bytes | None = None
+        self.tail: List[bytes] = []
+        self.hits = 0
+        self.builds = 0
+        # Builds past COLLAB_SYNC_MESSAGE_WARN_BYTES
+        self.oversized = 0
+
+    def invalidate(self):
+        self.base = None
+        self.tail = []
+
+    def append(self, message: bytes):
+        if self.base is None:
+            return
+        if len(self.tail) >= settings.COLLAB_STATE_CACHE_MAX_TAIL:
+            self.invalidate()
+        else:
+            self.tail.append(message)
+
+    def messages(self, ydoc: Y.YDoc) -> List[bytes]:
+        if self.base is None:
+            self.base = create_sync_step2_message(Y.encode_state_as_update(ydoc))
+            self.builds += 1
+            if len(self.base) > settings.COLLAB_SYNC_MESSAGE_WARN_BYTES:
+                self.oversized += 1
+                logger.warning(
+                    f"Initial sync message of {len(self.base)} bytes, past "
+                    f"COLLAB_SYNC_MESSAGE_WARN_BYTES; clients or proxies with a "
+                    f"smaller frame limit cannot join"
+                )
+        else:
+            self.hits += 1
+        return [self.base, *self.tail]
+
+
+class CollaborationService:
+    """
+    Rooms are keyed by document id (see `document_id`): one room per open
+    file, so only the files clients actually have open are loaded. The key
+    of a project's main file is the bare project id.
+    """
+
+    def __init__(self, store=document_store, relay: CollaborationRelay | None = None):
+        self.store = store
+        # Forwards updates to other workers serving the same projects, if any
+        self.relay = relay
+        self._relay_started = False
+        # Set while applying an update that came from another worker
+        self._applying_remote = False
+        # Only rooms whose document is loaded are published here
         self.rooms: Dict[str, YRoom] = {}
-        self.save_tasks: Dict[str, asyncio.Task] = {}
+        self.loading_tasks: Dict[str, asyncio.Task] = {}
+        self.room_stats: Dict[str, RoomStats] = {}
+        self.state_caches: Dict[str, EncodedStateCache] = {}
+        # Binary Yjs updates observed since the last save, per project
+        self.pending_updates: Dict[str, List[bytes]] = {}
+        # Number of log rows written since the last compaction, per project
+        self.log_sizes: Dict[str, int] = {}
+        self.evictions = {"idle": 0, "memory": 0}
+        self.skipped_saves = 0
+        self._flush_lock = asyncio.Lock()
+        # Projects whose stored state is being reset, see `discard_rooms`
+        self._resetting: Dict[str, asyncio.Event] = {}
+        self._flush_task: asyncio.Task | None = None
+        self._eviction_task: asyncio.Task | None = None
+        self._prewarm_task: asyncio.Task | None = None
+        # Called with the document ids of every write-behind save
+        self.save_listeners: List[Callable[[List[str]], None]] = []
 
-    def get_room(self, project_id: str) -> YRoom:
-        if project_id not in self.rooms:
+    async def get_room(self, project_id: str) -> YRoom:
+        """
+        Returns the loaded room for a project, creating it if needed.
+
+        Loading is single-flight: concurrent joiners await the same load task
+        and the room is only published once its document is ready. A failed
+        load raises in every waiter instead of serving an empty document.
+        Rooms of a project being reset wait for the new state, see
+        `discard_rooms`.
+        """
+        self._ensure_background_tasks()
+        project = project_id.partition("/")[0]
+        while project in self._resetting:
+            await self._resetting[project].wait()
+        room = self.rooms.get(project_id)
+        if room is not None:
+            self.room_stats[project_id].touch()
+            return room
+
+        task = self.loading_tasks.get(project_id)
+        if task is None:
             logger.info(f"Creating new YRoom for project {project_id}")
-            room = YRoom()
-            room.ready = False
-            self.rooms[project_id] = room
+            task = asyncio.create_task(self._open_room(project_id))
+            self.loading_tasks[project_id] = task
+            task.add_done_callback(partial(self._loading_done, project_id))
+        # Shielded so one joiner disconnecting does not cancel the others' load
+        return await asyncio.shield(task)
+
+    def _loading_done(self, project_id: str, task: asyncio.Task):
+        if self.loading_tasks.get(project_id) is task:
+            self.loading_tasks.pop(project_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to open room {project_id}: {task.exception()}")
+
+    async def _open_room(self, project_id: str) -> YRoom:
+        await self._ensure_relay()
 
-            # Start the room loop in background
-            asyncio.create_task(self._run_room(room, project_id))
+        # Not ready until loaded: YRoom only starts broadcasting
+        # document updates once `ready` is set to True.
+        room = YRoom(ready=False)
+        stats = RoomStats()
 
-            # Load content
-            asyncio.create_task(self._load_room_from_db(project_id))
-        return self.rooms[project_id]
+        await self._load_room_from_db(project_id, room, stats)
 
-    async def _run_room(self, room: YRoom, project_id: str):
+        # Start the room loop in background, failing the load if it stops
+        # before it started
+        run_task = asyncio.create_task(self._run_room(room, project_id))
+        started = asyncio.create_task(room.started.wait())
+        try:
+            await asyncio.wait({started, run_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            started.cancel()
+        if not room.started.is_set():
+            error = run_task.result()
+            raise RoomLoadError(f"Room {project_id} failed to start") from error
+
+        room.ready = True
+        # Setup save observer
+        room.ydoc.observe_after_transaction(partial(self._on_update, project_id, room))
+
+        stats.saved_hash = _content_hash(room)
+        self.rooms[project_id] = room
+        self.room_stats[project_id] = stats
+        self.state_caches[project_id] = EncodedStateCache()
+        logger.info(f"Room {project_id} is ready.")
+
+        if self.relay:
+            # Other workers may hold updates they have not saved yet
+            self.relay.subscribe(project_id)
+            self._request_peer_state(project_id, room)
+        return room
+
+    async def serve(self, project_id: str, room: YRoom, websocket):
+        """Serves a client on `room`, keeping the room's client count up to date."""
+        stats = self.room_stats.setdefault(project_id, RoomStats())
+        stats.clients += 1
+        stats.touch()
+        try:
+            await room.serve(websocket)
+        finally:
+            stats.clients -= 1
+            stats.touch()
+
+    async def _run_room(self, room: YRoom, project_id: str) -> Exception | None:
+        """Runs the room's loop, returns the exception that stopped it if any."""
         try:
             await room.start()
         except Exception as e:
@@ -40,87 +256,587 @@ class CollaborationService:
                     logger.error(f"Sub-exception {idx}: {sub_e}")
 
             # If room crashes, remove it so it can be recreated
-            self.rooms.pop(project_id, None)
+            if self.rooms.get(project_id) is room:
+                self.rooms.pop(project_id, None)
+                self.room_stats.pop(project_id, None)
+                self.state_caches.pop(project_id, None)
+            return e
+        return None
+
+    async def _load_room_from_db(self, project_id: str, room: YRoom, stats: RoomStats):
+        logger.info(f"Loading room state from DB for project {project_id}")
+        # Run blocking DB op in thread
+        state = await asyncio.to_thread(self.store.load, project_id)
+        if state is None:
+            raise RoomLoadError(f"Document {project_id} not found")
+
+        if state.has_binary_state:
+            # Replay snapshot + tail of the update log
+            if state.snapshot:
+                Y.apply_update(room.ydoc, state.snapshot)
+                stats.resident_bytes += len(state.snapshot)
+            for update in state.updates:
+                Y.apply_update(room.ydoc, update)
+                stats.resident_bytes += len(update)
+            self.log_sizes[project_id] = len(state.updates)
+            logger.info(
+                f"Loaded project {project_id} from snapshot + "
+                f"{len(state.updates)} updates"
+            )
+        elif state.content:
+            # Legacy project without binary state: seed the YText from text.
+            # The seed is built in a scratch doc and only becomes the room's
+            # state if no other worker seeded this project first.
+            seed_doc = Y.YDoc()
+
+            # We do this in a transaction
+            def init_transaction(txn):
+                ytext = txn.get_text(TEXT_NAME)
+                ytext.extend(txn, state.content)
+
+            seed_doc.transact(init_transaction)
+
+            # Persist the seeded state right away, later updates build on
+            # the items created by this insert.
+            seeded = await asyncio.to_thread(
+                self.store.seed, project_id, Y.encode_state_as_update(seed_doc)
+            )
+            Y.apply_update(room.ydoc, seeded)
+            self.log_sizes[project_id] = 0
+            stats.resident_bytes = len(seeded)
+            logger.info(f"Loaded content for project {project_id} from text into YDoc")
+
+    def _on_update(
+        self, project_id: str, room: YRoom, event: Y.AfterTransactionEvent
+    ):
+        update = event.get_update()
+        if update == EMPTY_UPDATE:
+            return
+        if self.rooms.get(project_id) is not room:
+            # Discarded, its clients are being disconnected
+            return
+        stats = self.room_stats.get(project_id)
+        message = create_update_message(update)
+        cache = self.state_caches.get(project_id)
+        if cache:
+            cache.append(message)
+        if self._applying_remote:
+            # Persisted by the worker it originated from
+            if stats:
+                stats.resident_bytes += len(update)
+            return
+
+        if stats:
+            stats.touch()
+            stats.mark_dirty()
+            stats.resident_bytes += len(update)
+        self.pending_updates.setdefault(project_id, []).append(update)
+        if self.relay:
+            self.relay.publish(project_id, message)
+
+    def initial_sync_messages(self, project_id: str) -> List[bytes]:
+        """
+        Messages that bring a client with an empty document up to date,
+        served from the room's encoded state cache.
+        """
+        room = self.rooms.get(project_id)
+        cache = self.state_caches.get(project_id)
+        if room is None or cache is None:
+            return []
+        return cache.messages(room.ydoc)
+
+    def live_files(self, project_id: str, files: Dict[str, str]) -> Dict[str, str]:
+        """
+        Replaces the stored text of the files open in a room with the room's
+        live text, which may not have been saved yet.
+        """
+        for path in files:
+            room = self.rooms.get(document_id(project_id, path))
+            if room and room.ready:
+                files[path] = str(room.ydoc.get_text(TEXT_NAME))
+                logger.info(f"Using the live text of {path} in project {project_id}")
+        return files
+
+    # --- Cross-process relay ---
+
+    async def _ensure_relay(self):
+        if self.relay and not self._relay_started:
+            self._relay_started = True
+            self.relay.on_connected = self._resync_rooms
+            await self.relay.start(self._on_relay_message)
+
+    def _request_peer_state(self, project_id: str, room: YRoom):
+        state_vector = Y.encode_state_vector(room.ydoc)
+        self.relay.publish(project_id, create_sync_step1_message(state_vector))
 
-    async def _load_room_from_db(self, project_id: str):
-        room = self.rooms[project_id]
+    def _resync_rooms(self):
+        for project_id, room in self.rooms.items():
+            self._request_peer_state(project_id, room)
 
+    def _on_relay_message(self, project_id: str, message: bytes):
+        """Handles a Yjs sync message published by another worker."""
+        room = self.rooms.get(project_id)
+        if room is None or message[0] != YMessageType.SYNC:
+            return
+
+        payload = read_message(message[2:])
+        if message[1] == YSyncMessageType.SYNC_STEP1:
+            # A peer joined: send it whatever it is missing
+            update = Y.encode_state_as_update(room.ydoc, payload)
+            if update != EMPTY_UPDATE:
+                self.relay.publish(project_id, create_sync_step2_message(update))
+        elif payload != EMPTY_UPDATE:
+            self._applying_remote = True
+            try:
+                Y.apply_update(room.ydoc, payload)
+            finally:
+                self._applying_remote = False
+
+    # --- Write-behind persistence ---
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.COLLAB_FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush(self._due_for_flush())
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    def _due_for_flush(self) -> List[str]:
+        """
+        Dirty rooms that have been quiet for the debounce period, or that have
+        been dirty for longer than the staleness bound while edits keep coming.
+        """
+        now = time.monotonic()
+        return [
+            project_id
+            for project_id, stats in self.room_stats.items()
+            if stats.dirty_since is not None
+            and (
+                now - stats.last_change >= settings.COLLAB_SAVE_DEBOUNCE_SECONDS
+                or now - stats.dirty_since >= settings.COLLAB_MAX_STALENESS_SECONDS
+            )
+        ]
+
+    async def flush(self, project_ids: List[str], force: bool = False):
+        """
+        Writes the pending updates of `project_ids` in a single transaction.
+
+        Documents whose text hash is unchanged since their last save are
+        skipped unless `force` is set; their updates stay buffered and go out
+        with the next real change. Rooms that reached the compaction threshold
+        are compacted in the same transaction. If the transaction fails, the
+        documents are written one by one, see `_write_each`.
+        """
+        async with self._flush_lock:
+            batch, states, hashes = self._collect_batch(project_ids, force)
+            saved = await self._write_batch(batch, states, hashes) if batch else []
+            if saved:
+                for listener in self.save_listeners:
+                    try:
+                        listener(saved)
+                    except Exception as e:
+                        logger.error(f"Save listener failed: {e}")
+
+    def _collect_batch(self, project_ids: List[str], force: bool):
+        """Takes the pending updates of the rooms to save, see `flush`."""
+        batch: Dict[str, List[bytes]] = {}
+        states: Dict[str, bytes] = {}
+        hashes: Dict[str, str] = {}
+
+        for project_id in project_ids:
+            room = self.rooms.get(project_id)
+            stats = self.room_stats.get(project_id)
+            if room is None or stats is None:
+                continue
+            # Forced saves also take the updates left by skipped saves
+            if stats.dirty_since is None and not (
+                force and self.pending_updates.get(project_id)
+            ):
+                continue
+            stats.dirty_since = None
+
+            content_hash = _content_hash(room)
+            if content_hash == stats.saved_hash and not force:
+                self.skipped_saves += 1
+                continue
+
+            updates = self.pending_updates.pop(project_id, [])
+            if not updates:
+                continue
+            batch[project_id] = updates
+            hashes[project_id] = content_hash
+
+            log_size = self.log_sizes.get(project_id, 0) + len(updates)
+            if log_size >= settings.COLLAB_COMPACT_EVERY_UPDATES:
+                states[project_id] = Y.encode_state_as_update(room.ydoc)
+
+        return batch, states, hashes
+
+    async def _write_batch(
+        self,
+        batch: Dict[str, List[bytes]],
+        states: Dict[str, bytes],
+        hashes: Dict[str, str],
+    ) -> List[str]:
+        """Saves a batch taken by `_collect_batch`, returns the ids saved."""
         try:
-            logger.info(f"Loading room content from DB for project {project_id}")
-            # Run blocking DB op in thread
-            initial_content = await asyncio.to_thread(
-                self._fetch_content_sync, project_id
+            await asyncio.to_thread(self.store.write_batch, batch, states)
+            saved, rejected = list(batch), []
+        except Exception as e:
+            logger.error(f"Failed to save {len(batch)} projects: {e}")
+            saved, rejected = await asyncio.to_thread(self._write_each, batch, states)
+
+        for project_id, updates in batch.items():
+            if project_id in saved or project_id in rejected:
+                continue
+            # Keep them for the next flush, ahead of anything observed meanwhile
+            self.pending_updates[project_id] = updates + self.pending_updates.get(
+                project_id, []
             )
-            logger.info(
-                f"Fetched content for {project_id}: {len(initial_content) if initial_content else 0} chars"
+            stats = self.room_stats.get(project_id)
+            if stats:
+                stats.mark_dirty()
+        if not saved:
+            return saved
+
+        logger.info(
+            f"Saved {sum(len(batch[p]) for p in saved)} updates for {len(saved)} "
+            f"projects ({len([p for p in saved if p in states])} compacted)"
+        )
+        for project_id in saved:
+            stats = self.room_stats.get(project_id)
+            if stats:
+                stats.saved_hash = hashes[project_id]
+            if project_id in states:
+                self.log_sizes[project_id] = 0
+                if stats:
+                    stats.resident_bytes = len(states[project_id])
+            else:
+                self.log_sizes[project_id] = self.log_sizes.get(project_id, 0) + len(
+                    batch[project_id]
+                )
+        return saved
+
+    def _write_each(
+        self, batch: Dict[str, List[bytes]], states: Dict[str, bytes]
+    ) -> Tuple[List[str], List[str]]:
+        """
+        Writes the documents of a failed batch one at a time, so one bad
+        document does not hold back the others. Returns the ids saved and
+        the ids rejected by the database (e.g. of a deleted project), whose
+        updates are dropped instead of failing every later flush. Blocking.
+        """
+        saved: List[str] = []
+        rejected: List[str] = []
+        for project_id, updates in batch.items():
+            state = {project_id: states[project_id]} if project_id in states else {}
+            try:
+                self.store.write_batch({project_id: updates}, state)
+                saved.append(project_id)
+            except IntegrityError as e:
+                logger.warning(
+                    f"Dropping {len(updates)} updates of {project_id}, "
+                    f"the database rejected them: {e}"
+                )
+                rejected.append(project_id)
+            except Exception as e:
+                logger.error(f"Failed to save project {project_id}: {e}")
+        return saved, rejected
+
+    # --- Startup and shutdown ---
+
+    async def startup(self):
+        """Pre-warms the rooms that were hot before the last shutdown, if enabled."""
+        if not settings.COLLAB_PREWARM_ROOMS:
+            return
+        room_ids = await asyncio.to_thread(_read_hot_rooms)
+        if room_ids:
+            # In the background, so the app starts serving right away;
+            # clients joining a room being pre-warmed share its load
+            self._prewarm_task = asyncio.create_task(self.prewarm(room_ids))
+
+    async def prewarm(self, room_ids: List[str]):
+        """Loads `room_ids` from storage, a few at a time."""
+        semaphore = asyncio.Semaphore(settings.COLLAB_PREWARM_CONCURRENCY)
+
+        async def load(project_id: str):
+            async with semaphore:
+                try:
+                    await self.get_room(project_id)
+                except Exception as e:
+                    logger.warning(f"Could not pre-warm room {project_id}: {e}")
+
+        await asyncio.gather(*(load(project_id) for project_id in room_ids))
+        logger.info(f"Pre-warmed {len(self.rooms)} of {len(room_ids)} rooms")
+
+    async def shutdown(self, timeout: float | None = None):
+        """
+        Stops the background loops and drains every room with unsaved updates,
+        several batches in parallel, giving up after `timeout` seconds
+        (COLLAB_SHUTDOWN_TIMEOUT_SECONDS by default). Also records the
+        resident rooms for the next startup's pre-warm.
+        """
+        if timeout is None:
+            timeout = settings.COLLAB_SHUTDOWN_TIMEOUT_SECONDS
+        for task in (self._flush_task, self._eviction_task, self._prewarm_task):
+            if task:
+                task.cancel()
+
+        if settings.COLLAB_PREWARM_ROOMS and self.rooms:
+            hot = sorted(
+                self.rooms,
+                key=lambda project_id: self.room_stats[project_id].last_activity,
+                reverse=True,
+            )
+            try:
+                await asyncio.to_thread(_write_hot_rooms, hot)
+            except OSError as e:
+                logger.warning(f"Could not record hot rooms: {e}")
+
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Shutdown drain timed out after {timeout}s, "
+                f"some rooms may not have been saved"
             )
 
-            if initial_content:
-                # Initialize YText with content if document is empty
-                # We do this in a transaction
-                def init_transaction(txn):
-                    ytext = txn.get_text("codemirror")
-                    if len(ytext) == 0:
-                        ytext.extend(txn, initial_content)
-
-                room.ydoc.transact(init_transaction)
-                logger.info(
-                    f"Loaded content for project {project_id} from DB into YDoc"
+        if self.relay and self._relay_started:
+            await self.relay.stop()
+
+    async def _drain(self):
+        async with self._flush_lock:
+            # Including rooms whose last saves were skipped as unchanged
+            unsaved = list(self.pending_updates)
+            batch, states, hashes = self._collect_batch(unsaved, force=True)
+            if not batch:
+                return
+
+            logger.info(f"Draining {len(batch)} dirty rooms before shutdown")
+            project_ids = list(batch)
+            size = settings.COLLAB_SHUTDOWN_BATCH_SIZE
+            await asyncio.gather(
+                *(
+                    self._write_batch(
+                        {pid: batch[pid] for pid in chunk},
+                        {pid: states[pid] for pid in chunk if pid in states},
+                        {pid: hashes[pid] for pid in chunk},
+                    )
+                    for chunk in (
+                        project_ids[i : i + size]
+                        for i in range(0, len(project_ids), size)
+                    )
                 )
-        except Exception as e:
-            logger.error(f"Error loading project {project_id} from DB: {e}")
+            )
 
-        # Mark room as ready for connections
-        room.ready = True
-        logger.info(f"Room {project_id} marked as ready.")
+    # --- Eviction ---
 
-        # Setup save observer
-        ytext = room.ydoc.get_text("codemirror")
-        ytext.observe(lambda event: self._schedule_save(project_id))
+    def _ensure_background_tasks(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        if self._eviction_task is None or self._eviction_task.done():
+            self._eviction_task = asyncio.create_task(self._eviction_loop())
+
+    async def _eviction_loop(self):
+        while True:
+            await asyncio.sleep(settings.COLLAB_EVICTION_INTERVAL_SECONDS)
+            try:
+                await self.evict_rooms()
+            except Exception as e:
+                logger.error(f"Room eviction failed: {e}")
 
-    def _schedule_save(self, project_id: str):
-        # Debounce logic: Cancel existing task if pending
-        if project_id in self.save_tasks:
-            self.save_tasks[project_id].cancel()
+    async def evict_rooms(self):
+        """
+        Closes rooms without clients that have been idle for longer than
+        COLLAB_ROOM_IDLE_SECONDS, then closes the least recently active
+        clientless rooms until the resident total fits the memory budget.
+        Rooms with connected clients are never evicted.
+        """
+        now = time.monotonic()
+        idle = [
+            project_id
+            for project_id, stats in self.room_stats.items()
+            if stats.clients == 0
+            and now - stats.last_activity > settings.COLLAB_ROOM_IDLE_SECONDS
+        ]
+        for project_id in idle:
+            logger.info(f"Evicting idle room {project_id}")
+            if await self.close_room(project_id):
+                self.evictions["idle"] += 1
 
-        # Schedule new save
-        self.save_tasks[project_id] = asyncio.create_task(
-            self._debounce_save(project_id)
+        resident = self.resident_bytes
+        if resident <= settings.COLLAB_MEMORY_BUDGET_BYTES:
+            return
+
+        # Least recently used first
+        candidates = sorted(
+            (
+                (stats.last_activity, project_id)
+                for project_id, stats in self.room_stats.items()
+                if stats.clients == 0
+            ),
         )
+        for _, project_id in candidates:
+            if resident <= settings.COLLAB_MEMORY_BUDGET_BYTES:
+                break
+            stats = self.room_stats.get(project_id)
+            if not stats or stats.clients > 0:
+                continue
+            logger.info(
+                f"Evicting room {project_id} to fit memory budget "
+                f"({resident} > {settings.COLLAB_MEMORY_BUDGET_BYTES} bytes)"
+            )
+            size = stats.resident_bytes
+            if await self.close_room(project_id):
+                resident -= size
+                self.evictions["memory"] += 1
+
+    async def close_room(self, project_id: str) -> bool:
+        """
+        Flushes pending updates for a room, stops it and drops it from memory.
+        Returns False (and keeps the room) if the flush failed or a client
+        showed up while flushing.
+        """
+        room = self.rooms.get(project_id)
+        stats = self.room_stats.get(project_id)
+        if room is None or stats is None:
+            return False
+        seen_activity = stats.last_activity
+
+        await self.flush([project_id], force=True)
 
-    async def _debounce_save(self, project_id: str):
+        if (
+            project_id in self.pending_updates
+            or stats.clients > 0
+            or stats.last_activity != seen_activity
+        ):
+            logger.info(f"Keeping room {project_id}, it changed while flushing")
+            return False
+
+        self.rooms.pop(project_id, None)
+        self.room_stats.pop(project_id, None)
+        self.state_caches.pop(project_id, None)
+        self.log_sizes.pop(project_id, None)
+        if self.relay:
+            self.relay.unsubscribe(project_id)
         try:
-            await asyncio.sleep(2.0)  # 2s debounce
-            await self._save_room_to_db(project_id)
-        except asyncio.CancelledError:
+            room.stop()
+        except RuntimeError:
+            # Room loop never started or already stopped
             pass
-        finally:
-            self.save_tasks.pop(project_id, None)
+        return True
 
-    async def _save_room_to_db(self, project_id: str):
-        room = self.rooms.get(project_id)
-        if not room:
-            return
+    async def discard_rooms(
+        self,
+        project_id: str,
+        path: str | None = MAIN_FILE,
+        reset: Callable[[], None] | None = None,
+    ):
+        """
+        Replaces the stored state of a file (of every file of the project
+        when `path` is None) under its live rooms: runs `reset`, the
+        blocking write of the new state and its commit, in a thread, then
+        drops the rooms without saving them and disconnects their clients,
+        which reconnect to a room loaded from the new state.
 
-        content = str(room.ydoc.get_text("codemirror"))
-        await asyncio.to_thread(self._save_content_sync, project_id, content)
+        No room of the project is loaded until `reset` has returned, and no
+        flush runs meanwhile, so neither a client reconnecting early nor a
+        live room can append old updates to the new state. If `reset` raises,
+        the rooms are kept.
+        """
 
-    def _fetch_content_sync(self, project_id: str) -> Optional[str]:
-        with Session(engine) as session:
-            project = session.get(Project, UUID(project_id))
-            return project.content if project else None
+        def affected(room_id: str) -> bool:
+            if path is None:
+                return room_id == project_id or room_id.startswith(f"{project_id}/")
+            return room_id == document_id(project_id, path)
 
-    def _save_content_sync(self, project_id: str, content: str):
+        while project_id in self._resetting:
+            await self._resetting[project_id].wait()
+        done = self._resetting[project_id] = asyncio.Event()
         try:
-            with Session(engine) as session:
-                project = session.get(Project, UUID(project_id))
-                if project:
-                    project.content = content
-                    session.add(project)
-                    session.commit()
-                    logger.info(f"Saved project {project_id} content to DB")
-        except Exception as e:
-            logger.error(f"Failed to save project {project_id}: {e}")
+            # Loads in flight read the old state, they are dropped as well
+            loading = [
+                task
+                for room_id, task in self.loading_tasks.items()
+                if affected(room_id)
+            ]
+            await asyncio.gather(*loading, return_exceptions=True)
+
+            async with self._flush_lock:
+                if reset is not None:
+                    await asyncio.to_thread(reset)
+                rooms = []
+                for room_id in [room_id for room_id in self.rooms if affected(room_id)]:
+                    room = self.rooms.pop(room_id)
+                    self.room_stats.pop(room_id, None)
+                    self.state_caches.pop(room_id, None)
+                    self.pending_updates.pop(room_id, None)
+                    self.log_sizes.pop(room_id, None)
+                    logger.info(f"Discarding room {room_id}, its document was replaced")
+                    if self.relay:
+                        self.relay.unsubscribe(room_id)
+                    rooms.append(room)
+        finally:
+            del self._resetting[project_id]
+            done.set()
+
+        for room in rooms:
+            for client in list(room.clients):
+                disconnect = getattr(client, "disconnect", None)
+                if disconnect:
+                    await disconnect(1012)  # service restart: reconnect
+            try:
+                room.stop()
+            except RuntimeError:
+                # Room loop never started or already stopped
+                pass
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(stats.resident_bytes for stats in self.room_stats.values())
+
+    def get_stats(self) -> dict:
+        return {
+            "rooms": len(self.rooms),
+            "clients": sum(stats.clients for stats in self.room_stats.values()),
+            "resident_bytes": self.resident_bytes,
+            "evictions_idle": self.evictions["idle"],
+            "evictions_memory": self.evictions["memory"],
+            "dirty_rooms": sum(
+                1 for stats in self.room_stats.values() if stats.dirty_since
+            ),
+            "skipped_saves": self.skipped_saves,
+            "dropped_messages": sum(
+                stats.dropped_messages for stats in self.room_stats.values()
+            ),
+            "lag_disconnects": sum(
+                stats.lag_disconnects for stats in self.room_stats.values()
+            ),
+            "state_cache_hits": sum(cache.hits for cache in self.state_caches.values()),
+            "state_cache_builds": sum(
+                cache.builds for cache in self.state_caches.values()
+            ),
+            "oversized_initial_syncs": sum(
+                cache.oversized for cache in self.state_caches.values()
+            ),
+            "room_details": {
+                project_id: self._room_details(project_id, room)
+                for project_id, room in self.rooms.items()
+            },
+        }
+
+    def _room_details(self, project_id: str, room: YRoom) -> dict:
+        stats = self.room_stats.get(project_id) or RoomStats()
+        depths = [getattr(client, "queue_depth", 0) for client in room.clients]
+        return {
+            "clients": stats.clients,
+            "resident_bytes": stats.resident_bytes,
+            "queue_depth": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "dropped_messages": stats.dropped_messages,
+            "lag_disconnects": stats.lag_disconnects,
+        }
 
 
-collaboration_service = CollaborationService()
+collaboration_service = CollaborationService(relay=get_relay())
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.models.project_file import normalize_file_path
+from app.services.asset_store import AssetRef, AssetStore, FileTree
+
+logger = logging.getLogger(__name__)
+
+# Intermediate files whose changes call for another pdflatex pass
+RERUN_SUFFIXES = (".aux", ".toc", ".lof", ".lot", ".out", ".nav", ".snm")
+# Sources written by the previous compile, so deleted files can be removed
+MANIFEST = ".sources.json"
+BIB_DIGEST = ".bib-digest"
+# Previews build next to the project's directory, never in it
+PREVIEW_SUFFIX = "-preview"
+
+
+def preview_build(project_id: str) -> str:
+    """Name of the build directory of a project's previews."""
+    return f"{project_id}{PREVIEW_SUFFIX}"
+
+
+class BuildDirectories:
+    """
+    One build directory per project, kept across compiles so pdflatex can
+    reuse the .aux/.toc/.bbl files of the previous run.
+
+    Directories unused for `ttl` seconds, or beyond the `max_dirs` most
+    recently used, are evicted. Only one compile may use a directory at a
+    time (see `lock`). `sync`, `aux_digest`, `bibtex_needed` and `clean`
+    are blocking; call them with `asyncio.to_thread`.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        max_dirs: int,
+        ttl: float,
+        assets: Optional[AssetStore] = None,
+    ):
+        self.root = root
+        # Where the AssetRef files of the trees come from
+        self.assets = assets
+        self.max_dirs = max_dirs
+        self.ttl = ttl
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.evictions = 0
+
+    def path(self, project_id: str) -> Path:
+        return self.root / project_id
+
+    def lock(self, project_id: str) -> asyncio.Lock:
+        return self._locks.setdefault(project_id, asyncio.Lock())
+
+    def sync(self, project_id: str, files: FileTree) -> Path:
+        """
+        Brings the project's build directory up to date with `files`.
+        Unchanged sources are left untouched and sources that are no longer
+        in the tree are removed. Assets are hardlinked from the asset store.
+        Raises ValueError for an invalid path or a missing asset.
+        """
+        build_dir = self.path(project_id)
+        build_dir.mkdir(parents=True, exist_ok=True)
+        paths = [normalize_file_path(path) for path in files]
+
+        manifest = build_dir / MANIFEST
+        try:
+            previous = set(json.loads(manifest.read_text()))
+        except (FileNotFoundError, ValueError):
+            previous = set()
+        for path in previous - set(paths):
+            (build_dir / path).unlink(missing_ok=True)
+
+        for path, content in zip(paths, files.values()):
+            source = build_dir / path
+            if isinstance(content, AssetRef):
+                self._link_asset(content, source)
+                continue
+            try:
+                if source.read_text() == content:
+                    continue
+            except (FileNotFoundError, UnicodeDecodeError):
+                pass
+            source.parent.mkdir(parents=True, exist_ok=True)
+            # Never write through a hardlink into the asset store
+            source.unlink(missing_ok=True)
+            source.write_text(content)
+        manifest.write_text(json.dumps(paths))
+
+        # A PDF left by the previous compile must not pass for this one's
+        (build_dir / "main.pdf").unlink(missing_ok=True)
+        os.utime(build_dir)
+        return build_dir
+
+    def seed_aux(self, build_dir: Path, source_id: str):
+        """
+        Copies the intermediate files of the `source_id` build into
+        `build_dir`, e.g. the last full build's cross-references for a
+        preview, which only recompiles part of the document. The source is
+        only read, and a build running there meanwhile can at worst leave
+        the copy with stale references.
+        """
+        source = self.path(source_id)
+        if not source.is_dir():
+            return
+        for path in source.rglob("*"):
+            if path.suffix not in RERUN_SUFFIXES + (".bbl",) or not path.is_file():
+                continue
+            dest = build_dir / path.relative_to(source)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                shutil.copyfile(path, dest)
+            except FileNotFoundError:
+                continue
+
+    def _link_asset(self, asset: AssetRef, dest: Path):
+        if self.assets is None:
+            raise ValueError("Assets are not available for compiles")
+        try:
+            self.assets.link(asset.sha256, dest)
+        except FileNotFoundError:
+            raise ValueError(f"Missing asset {dest.name}, upload it again")
+
+    def aux_digest(self, build_dir: Path) -> Dict[str, str]:
+        """Hashes of the intermediate files that feed the next pass."""
+        digest = {}
+        for path in build_dir.rglob("*"):
+            if path.suffix in RERUN_SUFFIXES and path.is_file():
+                digest[str(path.relative_to(build_dir))] = hashlib.sha256(
+                    path.read_bytes()
+                ).hexdigest()
+        return digest
+
+    def bibtex_needed(self, build_dir: Path) -> bool:
+        """
+        Whether bibtex has to (re)run: the document has a bibliography and
+        its citations, style or .bib files changed since bibtex last ran.
+        """
+        try:
+            aux = (build_dir / "main.aux").read_text(errors="replace")
+        except FileNotFoundError:
+            return False
+        lines = [
+            line
+            for line in aux.splitlines()
+            if line.startswith(("\\citation", "\\bibdata", "\\bibstyle"))
+        ]
+        if not any(line.startswith("\\bibdata") for line in lines):
+            return False
+
+        digest = hashlib.sha256("\n".join(lines).encode())
+        for bib in sorted(build_dir.rglob("*.bib")):
+            digest.update(bib.read_bytes())
+        digest_file = build_dir / BIB_DIGEST
+        if (
+            digest_file.exists()
+            and digest_file.read_text() == digest.hexdigest()
+            and (build_dir / "main.bbl").exists()
+        ):
+            return False
+        digest_file.write_text(digest.hexdigest())
+        return True
+
+    def clean(self, build_dir: Path):
+        """Removes intermediate files, e.g. after a failed compile left them broken."""
+        for path in build_dir.rglob("*"):
+            if path.suffix in RERUN_SUFFIXES + (".bbl",) and path.is_file():
+                path.unlink(missing_ok=True)
+        (build_dir / BIB_DIGEST).unlink(missing_ok=True)
+
+    def _cold_dirs(self, now: float) -> List[Path]:
+        if not self.root.exists():
+            return []
+        entries = []
+        for path in self.root.iterdir():
+            if path.name.startswith(".") or not path.is_dir():
+                continue
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        entries.sort(reverse=True)
+        return [
+            path
+            for index, (mtime, path) in enumerate(entries)
+            if index >= self.max_dirs or now - mtime > self.ttl
+        ]
+
+    async def evict(self, now: Optional[float] = None):
+        """Removes cold build directories, skipping the ones in use."""
+        cold = await asyncio.to_thread(self._cold_dirs, now or time.time())
+        doomed = []
+        for path in cold:
+            lock = self._locks.get(path.name)
+            if lock and lock.locked():
+                continue
+            # Moved aside right away, so a compile starting meanwhile gets a
+            # fresh directory instead of one being deleted
+            self._locks.pop(path.name, None)
+            trash = path.with_name(f".evicted-{uuid.uuid4().hex}")
+            try:
+                path.rename(trash)
+            except FileNotFoundError:
+                continue
+            doomed.append(trash)
+            self.evictions += 1
+            logger.info(f"Evicted build directory {path.name}")
+
+        for trash in doomed:
+            await asyncio.to_thread(shutil.rmtree, trash, True)
+
+    def get_stats(self) -> dict:
+        count = (
+            sum(
+                1
+                for path in self.root.iterdir()
+                if path.is_dir() and not path.name.startswith(".")
+            )
+            if self.root.exists()
+            else 0
+        )
+        return {"dirs": count, "evictions": self.evictions}
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+from app.services.asset_store import AssetRef, FileTree
+from app.services.disk_tier import DiskTier
+
+
+def compile_key(
+    files: FileTree, image: str, options: Dict[str, str]
+) -> str:
+    """
+    Hash of everything that determines a compile's output: the source tree,
+    the compiler image and the compile options. Assets count by their hash.
+    """
+    digest = hashlib.sha256()
+    for name, value in [("image", image), *sorted(options.items())]:
+        digest.update(f"{name}={value}\0".encode())
+    for path in sorted(files):
+        if isinstance(files[path], AssetRef):
+            digest.update(f"{path}\0asset\0{files[path].sha256}\0".encode())
+            continue
+        content = files[path].encode()
+        digest.update(f"{path}\0{len(content)}\0".encode())
+        digest.update(content)
+    return digest.hexdigest()
+
+
+class CachedPdf:
+    """A project's latest compiled PDF, as stored in the compile cache."""
+
+    def __init__(self, path: Path, etag: str, size: int):
+        self.path = path
+        # SHA-256 of the PDF itself
+        self.etag = etag
+        self.size = size
+
+
+class CompileCache:
+    """
+    Compiled PDFs on local disk, one file per compile key, evicted least
+    recently used first once the total size exceeds `max_bytes` (see
+    `DiskTier`).
+
+    Recency is the file's mtime, bumped on every hit, so the cache survives
+    restarts. Each project also points to its latest compiled PDF, see
+    `set_latest`. Methods are blocking; call them with `asyncio.to_thread`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.disk = DiskTier(directory, ".pdf", max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def _latest_path(self, project_id: str) -> Path:
+        return self.directory / "latest" / f"{project_id}.json"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.disk.path(key)
+        try:
+            data = path.read_bytes()
+            self.disk.touch(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: str, pdf: bytes) -> None:
+        self.disk.write(key, pdf)
+
+    def set_latest(self, project_id: str, key: str, pdf: bytes) -> None:
+        """Records the PDF cached under `key` as the project's latest."""
+        path = self._latest_path(project_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pointer = {"key": key, "etag": hashlib.sha256(pdf).hexdigest()}
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(pointer, f)
+        os.replace(tmp_path, path)
+
+    def latest(self, project_id: str) -> Optional[CachedPdf]:
+        """
+        The project's latest compiled PDF, or None if it was never compiled
+        or has been evicted since. Counts as a use of the PDF.
+        """
+        try:
+            pointer = json.loads(self._latest_path(project_id).read_text())
+            path = self.disk.path(pointer["key"])
+            self.disk.touch(path)
+            size = path.stat().st_size
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        return CachedPdf(path, pointer["etag"], size)
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.disk.evictions,
+            "size_bytes": self.disk.size_bytes,
+        }
@@ -0,0 +1,391 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+from fastapi import HTTPException
+from app.services.compile_log import CompileLog
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+# Replaced by a compile of a newer version of the project
+SUPERSEDED = "superseded"
+
+# run(project_id, files, log, preview) -> PDF bytes
+CompileRunner = Callable[[str, Dict[str, str], CompileLog, bool], Awaitable[bytes]]
+
+
+class CompileQueueFull(Exception):
+    """A compile was rejected; the client may retry after `retry_after` seconds."""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class CompileJob:
+    def __init__(
+        self,
+        project_id: str,
+        user_id: Optional[uuid.UUID],
+        files: Dict[str, str],
+        key: str,
+        background: bool = False,
+        preview: bool = False,
+    ):
+        self.id = uuid.uuid4().hex
+        self.project_id = project_id
+        # Requester, charged for the job; None for background compiles
+        self.user_id = user_id
+        # Users who submitted these sources and may read the job
+        self.users: Set[uuid.UUID] = {user_id} if user_id else set()
+        # Background compiles only warm the cache and give way to the others
+        self.background = background
+        # Fast draft compiles, coalesced and superseded apart from full ones
+        self.preview = preview
+        # Compile key of the sources, see compile_key
+        self.key = key
+        # Dropped once the job has run
+        self.files: Optional[Dict[str, str]] = files
+        self.status = QUEUED
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.pdf: Optional[bytes] = None
+        self.error: Optional[str] = None
+        # HTTP status of the failure, as raised by the compiler
+        self.error_status: Optional[int] = None
+        self.superseded_by: Optional[str] = None
+        # Compiler output and diagnostics, closed once the job is done
+        self.log = CompileLog()
+        self._task: Optional[asyncio.Task] = None
+        self._done = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED, SUPERSEDED)
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the job to finish; returns whether it did."""
+        try:
+            await asyncio.wait_for(self._done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.done
+
+
+class CompileQueue:
+    """
+    Compile jobs run by `concurrency` runner tasks, in submission order.
+
+    A project has at most one unfinished job: submitting the same sources
+    again returns that job, while newer sources supersede it, cancelling
+    it (and killing its compiler process) if it is already running.
+
+    Preview and full compiles of a project are separate flights: a preview
+    never supersedes a full compile, nor the other way round.
+
+    Background jobs run only when no interactive job is waiting, and a
+    running one is cancelled when an interactive job would otherwise wait
+    for a runner. They never supersede interactive jobs.
+
+    At most `max_queued` jobs wait, and a user has at most `max_per_user`
+    jobs queued or running; past that `submit` raises CompileQueueFull with
+    a retry hint estimated from recent compile times. Finished jobs are kept
+    for `retention` seconds so clients can poll for their result.
+    """
+
+    def __init__(
+        self,
+        run: CompileRunner,
+        concurrency: int,
+        max_queued: int,
+        max_per_user: int,
+        retention: float,
+    ):
+        self.run = run
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.retention = retention
+        self.jobs: Dict[str, CompileJob] = {}
+        self._pending: Deque[CompileJob] = deque()
+        self._background: Deque[CompileJob] = deque()
+        self._has_jobs = asyncio.Event()
+        self._runners: List[asyncio.Task] = []
+        self._durations: Deque[float] = deque(maxlen=20)
+        self.submitted = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self.preempted = 0
+        # Finished on submission, see `completed`
+        self.completed_jobs = 0
+
+    def submit(
+        self,
+        project_id: str,
+        user_id: Optional[uuid.UUID],
+        files: Dict[str, str],
+        key: str,
+        background: bool = False,
+        preview: bool = False,
+    ) -> Optional[CompileJob]:
+        """
+        Queues a compile, see the class docstring. Returns None for a
+        background compile that was not queued.
+        """
+        self._prune()
+        stale = []
+        for job in self.jobs.values():
+            # Superseded jobs still running are being cancelled
+            if (
+                job.project_id == project_id
+                and job.preview == preview
+                and not job.done
+                and not job.superseded_by
+            ):
+                if job.key == key:
+                    self.coalesced += 1
+                    if user_id:
+                        job.users.add(user_id)
+                    if job.background and not background:
+                        self._promote(job)
+                    return job
+                if background and not job.background:
+                    return None
+                stale.append(job)
+
+        queue = self._background if background else self._pending
+        queued = sum(1 for job in queue if job not in stale)
+        if queued >= self.max_queued:
+            self.rejected += 1
+            if background:
+                return None
+            raise CompileQueueFull("Compile queue is full", self.retry_after())
+        active = sum(
+            1
+            for job in self.jobs.values()
+            if user_id
+            and job.user_id == user_id
+            and not job.done
+            and not job.superseded_by
+            and job not in stale
+        )
+        if active >= self.max_per_user:
+            self.rejected += 1
+            raise CompileQueueFull(
+                f"At most {self.max_per_user} compiles per user at a time",
+                self.retry_after(),
+            )
+
+        job = CompileJob(project_id, user_id, files, key, background, preview)
+        self.jobs[job.id] = job
+        for old in stale:
+            self._supersede(old, job)
+        queue.append(job)
+        self.submitted += 1
+        self._ensure_runners()
+        self._has_jobs.set()
+        if not background:
+            self._preempt()
+        return job
+
+    def completed(
+        self,
+        project_id: str,
+        user_id: Optional[uuid.UUID],
+        key: str,
+        pdf: bytes,
+        preview: bool = False,
+    ) -> CompileJob:
+        """
+        Records a job for sources whose PDF is already known, e.g. from the
+        compile cache: it is finished on creation, without taking a queue
+        slot, and supersedes the project's unfinished job.
+        """
+        self._prune()
+        job = CompileJob(project_id, user_id, None, key, preview=preview)
+        job.status = SUCCEEDED
+        job.started_at = job.finished_at = job.created_at
+        job.pdf = pdf
+        job.log.close()
+        job._done.set()
+        for old in list(self.jobs.values()):
+            if (
+                old.project_id == project_id
+                and old.preview == preview
+                and not old.done
+                and not old.superseded_by
+            ):
+                self._supersede(old, job)
+        self.jobs[job.id] = job
+        self.completed_jobs += 1
+        return job
+
+    def _supersede(self, job: CompileJob, newer: CompileJob):
+        job.superseded_by = newer.id
+        self.superseded += 1
+        if job.status == RUNNING:
+            # _execute finishes it once the compile is cancelled
+            job._task.cancel()
+            return
+        (self._background if job.background else self._pending).remove(job)
+        job.status = SUPERSEDED
+        job.finished_at = datetime.utcnow()
+        job.files = None
+        job.log.close()
+        job._done.set()
+
+    def _promote(self, job: CompileJob):
+        """Makes a background job interactive, as someone now waits for it."""
+        job.background = False
+        if job.status == QUEUED:
+            self._background.remove(job)
+            self._pending.append(job)
+            self._preempt()
+
+    def _preempt(self):
+        """Cancels a background compile if interactive jobs wait for a runner."""
+        running = [job for job in self.jobs.values() if job.status == RUNNING]
+        if not self._pending or len(running) < self.concurrency:
+            return
+        for job in running:
+            if job.background and not job.superseded_by and not job._task.done():
+                logger.info(f"Preempting background compile {job.id}")
+                self.preempted += 1
+                job._task.cancel()
+                return
+
+    async def latest(self, job: CompileJob) -> CompileJob:
+        """Waits for a job, following it to its replacement if superseded."""
+        await job.wait()
+        while job.status == SUPERSEDED and job.superseded_by in self.jobs:
+            job = self.jobs[job.superseded_by]
+            await job.wait()
+        return job
+
+    def get(self, job_id: str) -> Optional[CompileJob]:
+        self._prune()
+        return self.jobs.get(job_id)
+
+    def position(self, job: CompileJob) -> Optional[int]:
+        """Number of jobs ahead of a queued job."""
+        if job in self._pending:
+            return self._pending.index(job)
+        if job in self._background:
+            return len(self._pending) + self._background.index(job)
+        return None
+
+    def retry_after(self) -> int:
+        average = (
+            sum(self._durations) / len(self._durations) if self._durations else 5.0
+        )
+        waves = len(self._pending) / self.concurrency + 1
+        return max(1, math.ceil(average * waves))
+
+    def _prune(self):
+        now = datetime.utcnow()
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.done and (now - job.finished_at).total_seconds() > self.retention
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def _live_runners(self) -> List[asyncio.Task]:
+        # Runners of another event loop (one that has been closed) never run again
+        loop = asyncio.get_running_loop()
+        return [
+            task
+            for task in self._runners
+            if not task.done() and task.get_loop() is loop
+        ]
+
+    def _ensure_runners(self):
+        self._runners = self._live_runners()
+        while len(self._runners) < self.concurrency:
+            self._runners.append(asyncio.create_task(self._run_jobs()))
+
+    async def _run_jobs(self):
+        while True:
+            while not self._pending and not self._background:
+                self._has_jobs.clear()
+                await self._has_jobs.wait()
+            queue = self._pending or self._background
+            await self._execute(queue.popleft())
+
+    async def _execute(self, job: CompileJob):
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+        started = time.monotonic()
+        # Its own task, so superseding the job cancels the compile only
+        job._task = asyncio.create_task(
+            self.run(job.project_id, job.files, job.log, job.preview)
+        )
+        try:
+            job.pdf = await job._task
+            job.status = SUCCEEDED
+        except HTTPException as e:
+            job.status = FAILED
+            job.error, job.error_status = e.detail, e.status_code
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # The runner itself is stopping
+                job._task.cancel()
+                job.status = FAILED
+                job.error, job.error_status = "Compile cancelled", 503
+                raise
+            if job.superseded_by:
+                job.status = SUPERSEDED
+            else:
+                job.status = FAILED
+                job.error, job.error_status = "Compile preempted", 503
+        except Exception as e:
+            logger.error(f"Compile job {job.id} failed: {e}")
+            job.status = FAILED
+            job.error, job.error_status = str(e), 500
+        finally:
+            if job.status != SUPERSEDED and not job.background:
+                self._durations.append(time.monotonic() - started)
+            job.finished_at = datetime.utcnow()
+            job.files = None
+            job.log.close()
+            job._done.set()
+
+    async def close(self):
+        self._runners = self._live_runners()
+        for task in self._runners:
+            task.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
+        while self._pending or self._background:
+            job = (self._pending or self._background).popleft()
+            job.status = FAILED
+            job.error, job.error_status = "Compile cancelled", 503
+            job.finished_at = datetime.utcnow()
+            job.log.close()
+            job._done.set()
+
+    def get_stats(self) -> dict:
+        return {
+            "queued": len(self._pending),
+            "background_queued": len(self._background),
+            "running": sum(1 for job in self.jobs.values() if job.status == RUNNING),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+            "superseded": self.superseded,
+            "preempted": self.preempted,
+            "completed_on_submit": self.completed_jobs,
+            "retry_after": self.retry_after(),
+        }
@@ -0,0 +1,238 @@
+import asyncio
+import re
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+ERROR = "error"
+WARNING = "warning"
+
+# TeX wraps its terminal output at max_print_line (79) characters
+MAX_PRINT_LINE = 79
+
+# With -file-line-error: "./chapters/intro.tex:12: Undefined control sequence."
+FILE_LINE_ERROR = re.compile(
+    r"^(?P<file>\.?/?[^:\s]+\.\w+):(?P<line>\d+): (?P<message>.*)"
+)
+# Errors reported without a location, e.g. "! Emergency stop."
+TEX_ERROR = re.compile(r"^! (?P<message>.*)")
+# "l.12 \foo" locates the preceding "!" error
+ERROR_CONTEXT = re.compile(r"^l\.(?P<line>\d+)")
+WARNING_START = re.compile(
+    r"^(?:LaTeX(?: \w+)?|Package [\w.-]+|Class [\w.-]+|pdfTeX) warning:"
+    r"\s*(?P<message>.*)",
+    re.IGNORECASE,
+)
+WARNING_CONTINUATION = re.compile(r"^\([\w.-]+\)\s+(?P<message>.*)")
+INPUT_LINE = re.compile(r"on input line (?P<line>\d+)")
+BAD_BOX = re.compile(
+    r"^(?P<message>(?:Over|Under)full \\[hv]box .*?)"
+    r"(?: (?:in paragraph|in alignment|detected) at lines? (?P<line>\d+)(?:--\d+)?)?$"
+)
+# Files opened and closed by TeX show up as "(./file.tex" and ")"
+FILE_TOKEN = re.compile(r"\((?P<file>\.?/[^\s()]+)|(?P<open>\()|(?P<close>\))")
+
+
+class Diagnostic:
+    """An error or warning of a compile, located in a project file if known."""
+
+    def __init__(
+        self,
+        severity: str,
+        message: str,
+        file: Optional[str] = None,
+        line: Optional[int] = None,
+    ):
+        self.severity = severity
+        self.message = message
+        self.file = file
+        self.line = line
+
+    def to_dict(self) -> dict:
+        return {
+            "severity": self.severity,
+            "message": self.message,
+            "file": self.file,
+            "line": self.line,
+        }
+
+
+def _project_path(path: Optional[str]) -> Optional[str]:
+    """Paths are reported relative to the build directory, like the editor's."""
+    if path is None:
+        return None
+    return path[2:] if path.startswith("./") else path
+
+
+class LogParser:
+    """
+    Turns pdflatex terminal output into diagnostics, one line at a time.
+    Keeps the stack of files TeX has open to locate warnings, and joins the
+    lines TeX wrapped. Not thread-safe; `feed` is meant to be run with
+    `asyncio.to_thread` by one reader.
+    """
+
+    def __init__(self):
+        self._files: List[Optional[str]] = []
+        self._partial = ""
+        # A "!" error waiting for its "l.<n>" line
+        self._error: Optional[Diagnostic] = None
+        # A warning whose message may continue on "(package)  ..." lines
+        self._warning: Optional[Diagnostic] = None
+
+    @property
+    def current_file(self) -> Optional[str]:
+        for path in reversed(self._files):
+            if path is not None:
+                return _project_path(path)
+        return None
+
+    def feed(self, lines: List[str]) -> List[Diagnostic]:
+        diagnostics: List[Diagnostic] = []
+        for line in lines:
+            if len(line) == MAX_PRINT_LINE:
+                self._partial += line
+                continue
+            line, self._partial = self._partial + line, ""
+            diagnostics.extend(self._parse_line(line))
+        return diagnostics
+
+    def close(self) -> List[Diagnostic]:
+        """Returns what is still pending once the output ended."""
+        diagnostics = self.feed([""]) if self._partial else []
+        for pending in (self._error, self._warning):
+            if pending:
+                diagnostics.append(pending)
+        self._error = self._warning = None
+        return diagnostics
+
+    def _parse_line(self, line: str) -> List[Diagnostic]:
+        diagnostics: List[Diagnostic] = []
+        if self._warning:
+            match = WARNING_CONTINUATION.match(line)
+            if match:
+                self._warning.message += f" {match.group('message').strip()}"
+                self._locate_warning(self._warning, line)
+                return diagnostics
+            diagnostics.append(self._warning)
+            self._warning = None
+
+        if self._error:
+            match = ERROR_CONTEXT.match(line)
+            if match:
+                if self._error.line is None:
+                    self._error.line = int(match.group("line"))
+                diagnostics.append(self._error)
+                self._error = None
+                return diagnostics
+
+        match = FILE_LINE_ERROR.match(line)
+        if match:
+            diagnostics.extend(self._flush_error())
+            self._error = Diagnostic(
+                ERROR,
+                match.group("message").strip(),
+                _project_path(match.group("file")),
+                int(match.group("line")),
+            )
+            return diagnostics
+
+        match = TEX_ERROR.match(line)
+        if match:
+            diagnostics.extend(self._flush_error())
+            self._error = Diagnostic(
+                ERROR, match.group("message").strip(), self.current_file
+            )
+            return diagnostics
+
+        match = WARNING_START.match(line)
+        if match:
+            self._warning = Diagnostic(
+                WARNING, match.group("message").strip(), self.current_file
+            )
+            self._locate_warning(self._warning, line)
+            return diagnostics
+
+        match = BAD_BOX.match(line)
+        if match:
+            diagnostics.append(
+                Diagnostic(
+                    WARNING,
+                    match.group("message"),
+                    self.current_file,
+                    int(match.group("line")) if match.group("line") else None,
+                )
+            )
+            return diagnostics
+
+        self._track_files(line)
+        return diagnostics
+
+    def _flush_error(self) -> List[Diagnostic]:
+        error, self._error = self._error, None
+        return [error] if error else []
+
+    def _locate_warning(self, warning: Diagnostic, line: str):
+        match = INPUT_LINE.search(line)
+        if match:
+            warning.line = int(match.group("line"))
+
+    def _track_files(self, line: str):
+        for match in FILE_TOKEN.finditer(line):
+            if match.group("file"):
+                self._files.append(match.group("file"))
+            elif match.group("open"):
+                self._files.append(None)
+            elif self._files:
+                self._files.pop()
+
+
+class CompileLog:
+    """
+    The output of a compile as it is produced: log lines and, for each
+    pdflatex pass, the diagnostics parsed from it. Readers `follow` the log
+    from the start, so joining late replays what was missed.
+    """
+
+    def __init__(self):
+        # ("log", [lines]), ("pass", number) and ("diagnostic", Diagnostic)
+        self.events: List[Tuple[str, Any]] = []
+        self.passes = 0
+        # Diagnostics of the latest pass, earlier passes are outdated
+        self.diagnostics: List[Diagnostic] = []
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def begin_pass(self):
+        self.passes += 1
+        self.diagnostics = []
+        self._append(("pass", self.passes))
+
+    def write(self, lines: List[str], diagnostics: List[Diagnostic]):
+        if lines:
+            self._append(("log", lines))
+        for diagnostic in diagnostics:
+            self.diagnostics.append(diagnostic)
+            self._append(("diagnostic", diagnostic))
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _append(self, event: Tuple[str, Any]):
+        self.events.append(event)
+        self._wake()
+
+    def _wake(self):
+        # Wakes every current reader; later ones wait on a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Tuple[str, Any]]:
+        """Yields every event of the log until it is closed."""
+        sent = 0
+        while True:
+            while sent < len(self.events):
+                sent += 1
+                yield self.events[sent - 1]
+            if self.closed:
+                return
+            await self._changed.wait()
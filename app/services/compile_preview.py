@@ -0,0 +1,114 @@
+import posixpath
+import re
+from typing import List, Optional, Set
+from app.models.project_file import MAIN_FILE, normalize_file_path
+from app.services.asset_store import FileTree
+
+BEGIN_DOCUMENT = re.compile(r"\\begin\s*\{document\}")
+END_DOCUMENT = re.compile(r"\\end\s*\{document\}")
+INCLUDE = re.compile(r"\\include\s*\{([^}]+)\}")
+HEADING = re.compile(r"^\s*\\(?:part|chapter|section)\*?\s*[\[{]")
+# Images are drawn as boxes instead of being loaded and embedded
+DRAFT_OPTIONS = r"\PassOptionsToPackage{draft}{graphicx}"
+
+
+def _include_name(path: str) -> str:
+    """`\\include` name of a file: its path without the .tex extension."""
+    return path[:-4] if path.endswith(".tex") else path
+
+
+def _spelling(name: str, included: Set[str]) -> Optional[str]:
+    """
+    How the main file spells the `\\include` of `name`, which
+    `\\includeonly` has to repeat, or None if it does not include it.
+    """
+    for spelling in (name, f"./{name}"):
+        if spelling in included:
+            return spelling
+    return None
+
+
+class PreviewSelection:
+    """
+    What a preview compile keeps of a project: the `include`d chapters, or
+    the part of the document around the cursor. With neither, the whole
+    document is previewed. See `apply`.
+    """
+
+    def __init__(
+        self,
+        include: Optional[List[str]] = None,
+        cursor_file: Optional[str] = None,
+        cursor_line: Optional[int] = None,
+    ):
+        # Raises ValueError for paths escaping the project
+        self.include = [normalize_file_path(path) for path in include or []]
+        self.cursor_file = normalize_file_path(cursor_file) if cursor_file else None
+        self.cursor_line = cursor_line
+
+    def apply(self, files: FileTree) -> FileTree:
+        """
+        Returns the tree to compile for the preview: graphics in draft mode
+        and either an `\\includeonly` of the selected chapters, or, with the
+        cursor in the main file, only the section around it. Lines are never
+        added or removed, so diagnostics keep pointing at the editor's lines.
+        """
+        main = files.get(MAIN_FILE)
+        if not isinstance(main, str):
+            return files
+        lines = main.splitlines(keepends=True)
+        begin = next(
+            (i for i, line in enumerate(lines) if BEGIN_DOCUMENT.search(line)), None
+        )
+        if begin is None:
+            return files
+
+        chapters = self._chapters(main)
+        if chapters is not None:
+            lines[begin] = f"\\includeonly{{{','.join(chapters)}}}" + lines[begin]
+        elif self.cursor_file == MAIN_FILE and self.cursor_line:
+            lines = self._around_cursor(lines, begin)
+        # On the first line, so line numbers stay the same
+        lines[0] = DRAFT_OPTIONS + lines[0]
+        return {**files, MAIN_FILE: "".join(lines)}
+
+    def _chapters(self, main: str) -> Optional[List[str]]:
+        """`\\include` names to keep, or None to keep every chapter."""
+        included = {name.strip() for name in INCLUDE.findall(main)}
+        if self.include:
+            names = [_include_name(path) for path in self.include]
+            return [_spelling(name, included) or name for name in names]
+        if self.cursor_file and self.cursor_file != MAIN_FILE:
+            spelling = _spelling(_include_name(self.cursor_file), included)
+            if spelling is not None:
+                return [spelling]
+            # A file \input by a chapter: keep its directory's chapters
+            folder = posixpath.dirname(self.cursor_file)
+            nearby = sorted(
+                name
+                for name in included
+                if posixpath.dirname(name.removeprefix("./")) == folder
+            )
+            return nearby or None
+        return None
+
+    def _around_cursor(self, lines: List[str], begin: int) -> List[str]:
+        """Blanks the body outside the section holding `cursor_line`."""
+        end = next(
+            (
+                i
+                for i in range(len(lines) - 1, begin, -1)
+                if END_DOCUMENT.search(lines[i])
+            ),
+            len(lines),
+        )
+        cursor = self.cursor_line - 1
+        if not begin < cursor < end:
+            return lines
+        headings = [i for i in range(begin + 1, end) if HEADING.match(lines[i])]
+        start = max((i for i in headings if i <= cursor), default=begin + 1)
+        stop = min((i for i in headings if i > cursor), default=end)
+        return [
+            line if i <= begin or start <= i < stop or i >= end else "\n"
+            for i, line in enumerate(lines)
+        ]
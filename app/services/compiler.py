@@ -1,85 +1,348 @@
+import asyncio
+import logging
 import subprocess
-import tempfile
 import os
 import shutil
+import uuid
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from fastapi import HTTPException
+from app.core.config import settings
+from app.services.asset_store import AssetStore, FileTree, asset_store
+from app.models.project_file import MAIN_FILE
+from app.services.compile_builds import BuildDirectories, preview_build
+from app.services.compile_cache import CompileCache, compile_key
+from app.services.compile_jobs import CompileJob, CompileQueue
+from app.services.compile_log import CompileLog, LogParser
+from app.services.compile_preview import PreviewSelection
+from app.services.compiler_pool import (
+    JOB_PID_FILE,
+    CompilerWorker,
+    DockerWorker,
+    LocalWorker,
+    WorkerPool,
+    job_command,
+)
+
+logger = logging.getLogger(__name__)
 
 
 class CompilerService:
-    def __init__(self, docker_image: str = "ghcr.io/xu-cheng/texlive-small"):
+    def __init__(
+        self,
+        docker_image: str = "ghcr.io/xu-cheng/texlive-small",
+        cache: Optional[CompileCache] = None,
+        pool: Optional[WorkerPool] = None,
+        work_root: Optional[str] = None,
+        assets: Optional[AssetStore] = None,
+    ):
         self.docker_image = docker_image
+        # Job directories live here, so pooled containers can see them (the
+        # same absolute path is mounted in the containers)
+        self.work_root = Path(work_root or settings.COMPILER_WORK_ROOT).resolve()
+        self.builds = BuildDirectories(
+            self.work_root / "builds",
+            max_dirs=settings.COMPILE_MAX_BUILD_DIRS,
+            ttl=settings.COMPILE_BUILD_DIR_TTL_SECONDS,
+            assets=assets or asset_store,
+        )
+        self.passes = 0
+        self.pool = pool or WorkerPool(
+            self._new_worker,
+            size=settings.COMPILER_POOL_SIZE,
+            max_jobs=settings.COMPILER_WORKER_MAX_JOBS,
+            health_interval=settings.COMPILER_HEALTHCHECK_INTERVAL_SECONDS,
+        )
+        # Compiled PDFs by compile key, if caching is enabled
+        self.cache = cache
+        self.options = {"engine": "pdflatex", "interaction": "nonstopmode"}
+        # Background compiles, one runner per pool worker
+        self.queue = CompileQueue(
+            self.compile_project,
+            concurrency=self.pool.size,
+            max_queued=settings.COMPILE_QUEUE_SIZE,
+            max_per_user=settings.COMPILE_MAX_JOBS_PER_USER,
+            retention=settings.COMPILE_JOB_RETENTION_SECONDS,
+        )
 
-    async def compile_project(self, project_id: str, content: str) -> bytes:
+    async def submit(
+        self,
+        project_id: str,
+        user_id: Optional[uuid.UUID],
+        files: FileTree,
+        background: bool = False,
+        preview: Optional[PreviewSelection] = None,
+    ) -> Optional[CompileJob]:
         """
-        Compiles LaTeX content into a PDF using a Docker container.
+        Queues a compile and returns its job right away: the project's
+        pending job when it is for the same sources, otherwise a new one
+        superseding it. Raises CompileQueueFull when the queue or the
+        user's quota is full.
+
+        Sources found in the compile cache take no queue slot: the job
+        returned is already finished with the cached PDF.
+
+        Background compiles only warm the cache; they return None instead
+        of raising, or of replacing an interactive compile.
+
+        With `preview`, only the selected part of the project is compiled,
+        in a single pass with graphics in draft mode, and the PDF is not
+        recorded as the project's latest.
         """
-        # Create a temporary directory for this compilation job
-        with tempfile.TemporaryDirectory() as temp_dir:
-            work_dir = Path(temp_dir)
-
-            # Write content to main.tex
-            tex_file = work_dir / "main.tex"
-            tex_file.write_text(content)
-
-            # Ensure output directory exists (implicitly done by tempfile)
-
-            # Docker command to run pdflatex
-            # Mounting temp_dir to /workdir in container
-            # Running as current user to avoid permission issues (optional, but good practice)
-            cmd = [
-                "docker",
-                "run",
-                "--rm",
-                "-v",
-                f"{str(work_dir)}:/workdir",
-                "-w",
-                "/workdir",
-                self.docker_image,
-                "pdflatex",
-                "-interaction=nonstopmode",
-                "main.tex",
-            ]
+        if preview is not None:
+            files = preview.apply(files)
+        key = compile_key(files, self.docker_image, self.options)
 
-            try:
-                # Run the command
-                process = subprocess.run(
-                    cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    check=False,  # We handle return code manually
+        pdf = await asyncio.to_thread(self.cache.get, key) if self.cache else None
+        if pdf is not None:
+            if preview is None:
+                await asyncio.to_thread(self.cache.set_latest, project_id, key, pdf)
+            if background:
+                return None
+            return self.queue.completed(
+                project_id, user_id, key, pdf, preview is not None
+            )
+
+        return self.queue.submit(
+            project_id, user_id, files, key, background, preview is not None
+        )
+
+    async def compile_project(
+        self,
+        project_id: str,
+        files: FileTree,
+        log: Optional[CompileLog] = None,
+        preview: bool = False,
+    ) -> bytes:
+        """
+        Compiles a project's file tree (path -> text or uploaded asset) into
+        a PDF using a Docker container. `main.tex` is the root document.
+
+        Unchanged sources are served from the compile cache without running
+        the compiler again, and the PDF is recorded there as the project's
+        latest unless it is a `preview` (see `submit`). The compiler's output
+        and the diagnostics parsed from it are written to `log` as they are
+        produced.
+        """
+        if MAIN_FILE not in files:
+            raise HTTPException(status_code=400, detail=f"{MAIN_FILE} is missing.")
+
+        if self.cache is None:
+            return await self._compile(project_id, files, log, preview)
+
+        key = compile_key(files, self.docker_image, self.options)
+        pdf = await asyncio.to_thread(self.cache.get, key)
+        if pdf is None:
+            pdf = await self._compile(project_id, files, log, preview)
+            await asyncio.to_thread(self.cache.put, key, pdf)
+        if not preview:
+            # Served by the project's PDF endpoint
+            await asyncio.to_thread(self.cache.set_latest, project_id, key, pdf)
+        return pdf
+
+    def _new_worker(self) -> CompilerWorker:
+        if settings.COMPILER_BACKEND == "local":
+            return LocalWorker()
+        return DockerWorker(self.docker_image, str(self.work_root))
+
+    async def shutdown(self):
+        await self.queue.close()
+        await self.pool.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "cache": self.cache.get_stats() if self.cache else None,
+            "pool": self.pool.get_stats(),
+            "queue": self.queue.get_stats(),
+            "builds": {**self.builds.get_stats(), "passes": self.passes},
+        }
+
+    async def _run(
+        self,
+        worker: CompilerWorker,
+        build_dir: Path,
+        args: List[str],
+        log: Optional[CompileLog] = None,
+        parser: Optional[LogParser] = None,
+    ) -> Tuple[int, bytes, bytes]:
+        # A PID file left by the previous job must not be mistaken for this one's
+        pid_file = build_dir / JOB_PID_FILE
+        pid_file.unlink(missing_ok=True)
+        # Run the command without blocking the event loop
+        process = await asyncio.create_subprocess_exec(
+            *worker.command(build_dir, job_command(args)),
+            cwd=build_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.gather(
+                self._read_output(process.stdout, log, parser),
+                process.stderr.read(),
+            )
+            await process.wait()
+        except asyncio.CancelledError:
+            # The build directory stays locked until the job is really gone
+            stop = asyncio.ensure_future(self._stop(worker, build_dir, process))
+            while not stop.done():
+                try:
+                    await asyncio.shield(stop)
+                except asyncio.CancelledError:
+                    pass
+            raise
+        pid_file.unlink(missing_ok=True)
+        return process.returncode, stdout, stderr
+
+    async def _stop(
+        self, worker: CompilerWorker, build_dir: Path, process
+    ) -> None:
+        """Stops a cancelled job where it runs, then its local client."""
+        if not await asyncio.to_thread(worker.terminate, build_dir):
+            logger.warning(f"Could not stop the compile job in {build_dir}")
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+    async def _read_output(
+        self,
+        stream: asyncio.StreamReader,
+        log: Optional[CompileLog],
+        parser: Optional[LogParser],
+    ) -> bytes:
+        """
+        Reads a compiler's stdout to the end, writing each chunk's complete
+        lines to `log` as soon as they arrive, along with the diagnostics
+        `parser` finds in them. Parsing runs in a thread.
+        """
+        output = bytearray()
+        partial = b""
+        while True:
+            chunk = await stream.read(64 * 1024)
+            output += chunk
+            if log is None:
+                if not chunk:
+                    break
+                continue
+
+            *lines, partial = (partial + chunk).split(b"\n")
+            if not chunk and partial:
+                lines.append(partial)
+            text = [line.decode(errors="replace").rstrip("\r") for line in lines]
+            diagnostics = []
+            if parser and text:
+                diagnostics = await asyncio.to_thread(parser.feed, text)
+            if parser and not chunk:
+                diagnostics += parser.close()
+            log.write(text, diagnostics)
+            if not chunk:
+                break
+        return bytes(output)
+
+    async def _run_passes(
+        self,
+        worker: CompilerWorker,
+        build_dir: Path,
+        log: Optional[CompileLog],
+        preview: bool = False,
+    ) -> Tuple[int, bytes, bytes]:
+        """
+        Runs pdflatex until its intermediate files stop changing, running
+        bibtex in between when the citations changed, like latexmk does.
+        With the previous run's files in place, an edit that moves no
+        reference needs a single pass.
+
+        Only the diagnostics of the last pass are kept in `log`, as earlier
+        passes report references that later ones resolve. Previews stop after
+        the first pass, reusing whatever the last full build left behind.
+        """
+        args = [
+            "pdflatex",
+            "-interaction=nonstopmode",
+            "-file-line-error",
+            MAIN_FILE,
+        ]
+        before = await asyncio.to_thread(self.builds.aux_digest, build_dir)
+        for _ in range(settings.COMPILE_MAX_PASSES):
+            if log is not None:
+                log.begin_pass()
+            result = await self._run(worker, build_dir, args, log, LogParser())
+            self.passes += 1
+            if preview or not (build_dir / "main.pdf").exists():
+                break
+
+            after = await asyncio.to_thread(self.builds.aux_digest, build_dir)
+            rerun = after != before
+            if await asyncio.to_thread(self.builds.bibtex_needed, build_dir):
+                await self._run(
+                    worker, build_dir, ["bibtex", Path(MAIN_FILE).stem], log
                 )
+                rerun = True
+            if not rerun:
+                break
+            before = after
+        return result
+
+    async def _compile(
+        self,
+        project_id: str,
+        files: FileTree,
+        log: Optional[CompileLog],
+        preview: bool = False,
+    ) -> bytes:
+        # Compiles reuse the project's build directory, one at a time.
+        # Previews have their own, so their partial .aux files never reach
+        # the next full build
+        build_id = preview_build(project_id) if preview else project_id
+        async with self.builds.lock(build_id):
+            try:
+                build_dir = await asyncio.to_thread(self.builds.sync, build_id, files)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if preview:
+                # Cross-references of the last full build
+                await asyncio.to_thread(self.builds.seed_aux, build_dir, project_id)
+
+            try:
+                # Run pdflatex on a warm worker (long-lived container or the
+                # local TeX installation) instead of starting a container per job
+                async with self.pool.worker() as worker:
+                    returncode, stdout, stderr = await self._run_passes(
+                        worker, build_dir, log, preview
+                    )
 
                 # Check if PDF was created regardless of return code
                 # Pdflatex often returns non-zero on warnings
-                pdf_file = work_dir / "main.pdf"
+                pdf_file = build_dir / "main.pdf"
                 if pdf_file.exists() and pdf_file.stat().st_size > 0:
                     return pdf_file.read_bytes()
 
-                if process.returncode != 0:
+                # The next compile must not start from a broken .aux
+                await asyncio.to_thread(self.builds.clean, build_dir)
+                if returncode != 0:
                     # Compilation failed AND no PDF
-                    error_log = process.stdout.decode() + "\n" + process.stderr.decode()
+                    error_log = stdout.decode() + "\n" + stderr.decode()
                     print(f"Compilation Error: {error_log}")
                     raise HTTPException(
                         status_code=400,
                         detail=f"Compilation Failed:\n{error_log[-1000:]}",
                     )
 
-                # Check if PDF was created
-                pdf_file = work_dir / "main.pdf"
-                if not pdf_file.exists():
-                    raise HTTPException(
-                        status_code=500, detail="PDF file was not generated."
-                    )
-
-                return pdf_file.read_bytes()
+                raise HTTPException(
+                    status_code=500, detail="PDF file was not generated."
+                )
 
             except Exception as e:
-                # Cleanup is handled by TemporaryDirectory, but re-raise exception
                 if isinstance(e, HTTPException):
                     raise e
                 raise HTTPException(status_code=500, detail=f"System Error: {str(e)}")
 
+            finally:
+                await self.builds.evict()
+
 
 # Singleton instance
-compiler_service = CompilerService()
+compiler_service = CompilerService(
+    cache=CompileCache(settings.COMPILE_CACHE_DIR, settings.COMPILE_CACHE_MAX_BYTES)
+)
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import shutil
+import subprocess
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Where a job records its PID, in its work dir (see `job_command`)
+JOB_PID_FILE = ".job.pid"
+# Stops the job whose PID file is $0 and waits for it to exit, killing it if
+# it ignores SIGTERM. Gives up after about 10 seconds.
+TERMINATE_SCRIPT = """
+i=0
+while [ ! -s "$0" ] && [ $i -lt 20 ]; do sleep 0.1; i=$((i+1)); done
+pid=$(cat "$0" 2>/dev/null) || exit 0
+kill -TERM "$pid" 2>/dev/null || exit 0
+i=0
+while kill -0 "$pid" 2>/dev/null; do
+    [ $i -eq 30 ] && kill -KILL "$pid" 2>/dev/null
+    [ $i -ge 100 ] && exit 1
+    sleep 0.1
+    i=$((i+1))
+done
+"""
+
+
+def job_command(args: List[str]) -> List[str]:
+    """
+    `args` run through a shell that records its PID in JOB_PID_FILE, then
+    becomes the job, so `terminate` can find it where the job runs.
+    """
+    return ["sh", "-c", 'echo $$ > "$0" && exec "$@"', JOB_PID_FILE, *args]
+
+
+class CompilerWorker:
+    """
+    A long-lived environment that runs TeX jobs. Jobs run in directories
+    under the pool's work root, which every worker can see at the same path.
+    """
+
+    def __init__(self):
+        self.jobs_run = 0
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def is_healthy(self) -> bool:
+        return True
+
+    def command(self, work_dir: Path, args: List[str]) -> List[str]:
+        """Command line that runs `args` (e.g. pdflatex ...) inside `work_dir`."""
+        raise NotImplementedError
+
+    def terminate(self, work_dir: Path) -> bool:
+        """
+        Stops the `job_command` running in `work_dir` and waits until it has
+        exited. Killing the local client process is not enough: with docker,
+        that only stops `docker exec` and leaves the job running in the
+        container. Blocking; returns False if the job could not be stopped.
+        """
+        try:
+            process = subprocess.run(
+                self.command(work_dir, ["sh", "-c", TERMINATE_SCRIPT, JOB_PID_FILE]),
+                cwd=work_dir,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=30,
+                check=False,
+            )
+        except subprocess.TimeoutExpired:
+            return False
+        return process.returncode == 0
+
+
+class LocalWorker(CompilerWorker):
+    """Runs the TeX installation of the host."""
+
+    def is_healthy(self) -> bool:
+        return shutil.which("pdflatex") is not None
+
+    def command(self, work_dir: Path, args: List[str]) -> List[str]:
+        return args
+
+
+class DockerWorker(CompilerWorker):
+    """
+    A container started once and kept running; jobs are sent to it with
+    `docker exec`, so they skip container startup.
+    """
+
+    def __init__(self, image: str, work_root: str):
+        super().__init__()
+        self.image = image
+        self.work_root = work_root
+        self.container: Optional[str] = None
+
+    def start(self) -> None:
+        name = f"sciagent-tex-{uuid.uuid4().hex[:12]}"
+        process = subprocess.run(
+            [
+                "docker",
+                "run",
+                "-d",
+                "--rm",
+                "--name",
+                name,
+                "-v",
+                f"{self.work_root}:{self.work_root}",
+                "--entrypoint",
+                "sleep",
+                self.image,
+                "infinity",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"Could not start compiler container: {process.stderr.decode()}"
+            )
+        self.container = name
+        logger.info(f"Started compiler container {name}")
+
+    def stop(self) -> None:
+        if self.container:
+            subprocess.run(
+                ["docker", "rm", "-f", self.container],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=False,
+            )
+            logger.info(f"Stopped compiler container {self.container}")
+            self.container = None
+
+    def is_healthy(self) -> bool:
+        if not self.container:
+            return False
+        try:
+            process = subprocess.run(
+                ["docker", "exec", self.container, "true"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=10,
+                check=False,
+            )
+        except subprocess.TimeoutExpired:
+            return False
+        return process.returncode == 0
+
+    def command(self, work_dir: Path, args: List[str]) -> List[str]:
+        return ["docker", "exec", "-w", str(work_dir), self.container, *args]
+
+
+class WorkerPool:
+    """
+    Up to `size` warm workers, started on demand. A worker is recycled
+    (stopped and replaced on the next demand) after `max_jobs` jobs, or
+    when it fails a health check, which runs after a failed job and every
+    `health_interval` seconds for idle workers.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], CompilerWorker],
+        size: int,
+        max_jobs: int,
+        health_interval: float,
+    ):
+        self.factory = factory
+        self.size = size
+        self.max_jobs = max_jobs
+        self.health_interval = health_interval
+        # Notified whenever a worker becomes idle or a slot frees up
+        self._available = asyncio.Condition()
+        self._idle: List[CompilerWorker] = []
+        # Started workers, idle or busy, plus the ones being started
+        self._workers: List[CompilerWorker] = []
+        self._starting = 0
+        self._health_task: Optional[asyncio.Task] = None
+        self.jobs = 0
+        self.recycled = 0
+        self.unhealthy = 0
+
+    @asynccontextmanager
+    async def worker(self):
+        """Borrows a worker for one job."""
+        worker = await self.acquire()
+        failed = False
+        try:
+            yield worker
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            await self.release(worker, failed)
+
+    async def acquire(self) -> CompilerWorker:
+        self._ensure_health_checks()
+        async with self._available:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if len(self._workers) + self._starting < self.size:
+                    self._starting += 1
+                    break
+                await self._available.wait()
+
+        worker = self.factory()
+        try:
+            await asyncio.to_thread(worker.start)
+        except BaseException:
+            async with self._available:
+                self._starting -= 1
+                self._available.notify()
+            raise
+        async with self._available:
+            self._starting -= 1
+            self._workers.append(worker)
+        return worker
+
+    async def release(self, worker: CompilerWorker, failed: bool = False):
+        self.jobs += 1
+        worker.jobs_run += 1
+        if worker.jobs_run >= self.max_jobs:
+            await self._recycle(worker)
+        elif failed and not await asyncio.to_thread(worker.is_healthy):
+            self.unhealthy += 1
+            await self._recycle(worker)
+        else:
+            async with self._available:
+                self._idle.append(worker)
+                self._available.notify()
+
+    async def _recycle(self, worker: CompilerWorker):
+        async with self._available:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self.recycled += 1
+            # Lets a waiter start a replacement
+            self._available.notify()
+        await asyncio.to_thread(worker.stop)
+
+    def _ensure_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"Compiler worker health check failed: {e}")
+
+    async def check_health(self):
+        """Checks the idle workers and recycles the unhealthy ones."""
+        async with self._available:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            if await asyncio.to_thread(worker.is_healthy):
+                async with self._available:
+                    self._idle.append(worker)
+                    self._available.notify()
+            else:
+                logger.warning("Recycling unhealthy compiler worker")
+                self.unhealthy += 1
+                await self._recycle(worker)
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+        workers, self._workers, self._idle = self._workers, [], []
+        for worker in workers:
+            await asyncio.to_thread(worker.stop)
+
+    def get_stats(self) -> dict:
+        return {
+            "size": self.size,
+            "workers": len(self._workers),
+            "idle": len(self._idle),
+            "jobs": self.jobs,
+            "recycled": self.recycled,
+            "unhealthy": self.unhealthy,
+        }
@@ -0,0 +1,97 @@
+import logging
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DiskTier:
+    """
+    Cache entries stored as `<key><suffix>` files in a directory, evicted
+    least recently used first once they take more than `max_bytes`.
+
+    Recency is the file's mtime (see `touch`), so entries survive restarts.
+    The total size is counted once, on first use, and then kept up to date
+    by `write` and `remove`: the directory is only walked again when the
+    total goes over `max_bytes`, which also corrects any drift from other
+    processes sharing the directory. Methods are blocking and thread-safe.
+    """
+
+    def __init__(self, directory: str, suffix: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def touch(self, path: Path) -> None:
+        """Marks an entry as used. Raises FileNotFoundError if it is gone."""
+        os.utime(path)
+
+    def write(self, key: str, data: bytes) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(key)
+        # Written under a temporary name so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self._lock:
+            self._count()
+            try:
+                replaced = path.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - replaced
+            if self._size <= self.max_bytes:
+                return
+            self._evict()
+
+    def remove(self, path: Path) -> None:
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            self._count()
+            return self._size
+
+    def _entries(self) -> List[Tuple[float, int, Path]]:
+        entries = []
+        for path in self.directory.glob(f"*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _count(self) -> None:
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+
+    def _evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+            logger.info(f"Evicted {path.name} from {self.directory}")
+        self._size = total
@@ -0,0 +1,331 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+import y_py as Y
+from sqlalchemy import delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from app.db.session import engine as default_engine
+from app.models.document import ProjectDocumentSnapshot, ProjectDocumentUpdate
+from app.models.project import Project
+from app.models.project_file import MAIN_FILE, ProjectFile
+
+logger = logging.getLogger(__name__)
+
+# Name of the shared YText the editor binds to
+TEXT_NAME = "codemirror"
+
+# Yjs encodes a transaction that changed nothing as an empty update
+EMPTY_UPDATE = b"\x00\x00"
+
+
+def document_id(project_id, path: str = MAIN_FILE) -> str:
+    """
+    Key of one file's document, used for rooms and store calls. The main file
+    is keyed by the bare project id, so existing clients keep working.
+    """
+    if path == MAIN_FILE:
+        return str(project_id)
+    return f"{project_id}/{path}"
+
+
+def parse_document_id(doc_id: str) -> Tuple[UUID, str]:
+    project_id, _, path = doc_id.partition("/")
+    return UUID(project_id), path or MAIN_FILE
+
+
+class DocumentState:
+    """Everything needed to rebuild a project's YDoc."""
+
+    def __init__(
+        self,
+        snapshot: Optional[bytes] = None,
+        updates: Optional[List[bytes]] = None,
+        content: Optional[str] = None,
+    ):
+        self.snapshot = snapshot
+        self.updates = updates or []
+        # Legacy plain-text content, only used when no binary state exists yet
+        self.content = content
+
+    @property
+    def has_binary_state(self) -> bool:
+        return self.snapshot is not None or len(self.updates) > 0
+
+
+class DocumentStore:
+    """
+    Persists project files as a Yjs snapshot plus an append-only update log.
+
+    Every file is a separate document identified by `document_id`. Its text
+    is materialized into `Project.content` for the main file and into
+    `ProjectFile.content` for the others.
+
+    Edits only append their (small) binary update, so write volume scales with
+    the edit size. The log is periodically compacted into a new snapshot, which
+    is also when `Project.content` is rebuilt from the merged state.
+
+    All methods are blocking and meant to be run with `asyncio.to_thread`.
+    YDocs are not sendable between threads, so only encoded bytes cross the
+    boundary and any YDoc used here is created inside the calling thread.
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine or default_engine
+
+    def load(self, doc_id: str) -> Optional[DocumentState]:
+        """Returns None if the project or file does not exist."""
+        project_id, path = parse_document_id(doc_id)
+        with Session(self.engine) as session:
+            owner = self._text_owner(session, project_id, path)
+            if not owner:
+                return None
+
+            snapshot = session.get(ProjectDocumentSnapshot, (project_id, path))
+            updates = session.exec(
+                select(ProjectDocumentUpdate.data)
+                .where(
+                    ProjectDocumentUpdate.project_id == project_id,
+                    ProjectDocumentUpdate.path == path,
+                )
+                .order_by(ProjectDocumentUpdate.id)
+            ).all()
+            return DocumentState(
+                snapshot=snapshot.state if snapshot else None,
+                updates=list(updates),
+                content=owner.content,
+            )
+
+    def _text_owner(self, session: Session, project_id: UUID, path: str):
+        """The row holding the materialized text of a file."""
+        if path == MAIN_FILE:
+            return session.get(Project, project_id)
+        return session.exec(
+            select(ProjectFile).where(
+                ProjectFile.project_id == project_id, ProjectFile.path == path
+            )
+        ).first()
+
+    def append_updates(self, doc_id: str, updates: List[bytes]) -> None:
+        self.write_batch({doc_id: updates})
+
+    def write_batch(
+        self,
+        updates: Dict[str, List[bytes]],
+        states: Optional[Dict[str, bytes]] = None,
+    ) -> None:
+        """
+        Appends the updates of many documents in one transaction and compacts
+        the documents listed in `states` (document id -> in-memory state).
+        """
+        with Session(self.engine) as session:
+            for doc_id, doc_updates in updates.items():
+                project_id, path = parse_document_id(doc_id)
+                for data in doc_updates:
+                    if data == EMPTY_UPDATE:
+                        continue
+                    session.add(
+                        ProjectDocumentUpdate(
+                            project_id=project_id, path=path, data=data
+                        )
+                    )
+            for doc_id, state in (states or {}).items():
+                project_id, path = parse_document_id(doc_id)
+                self.compact_in_session(session, project_id, state, path)
+            session.commit()
+
+    def seed(self, doc_id: str, state: bytes) -> bytes:
+        """
+        Stores `state` as the first snapshot of a document that has no binary
+        state yet and returns it. If another writer got there first, returns
+        the existing state instead, so concurrent seeds from the same text do
+        not end up merged into a duplicated document.
+        """
+        project_id, path = parse_document_id(doc_id)
+        try:
+            with Session(self.engine) as session:
+                existing = self._encoded_state(session, project_id, path)
+                if existing is not None:
+                    return existing
+                session.add(
+                    ProjectDocumentSnapshot(
+                        project_id=project_id, path=path, state=state
+                    )
+                )
+                session.commit()
+                return state
+        except IntegrityError:
+            with Session(self.engine) as session:
+                return self._encoded_state(session, project_id, path)
+
+    def _merged_doc(
+        self, session: Session, project_id: UUID, path: str
+    ) -> Optional[Y.YDoc]:
+        """The stored snapshot and update log of a file, merged in a YDoc."""
+        snapshot = session.get(ProjectDocumentSnapshot, (project_id, path))
+        updates = session.exec(
+            select(ProjectDocumentUpdate.data)
+            .where(
+                ProjectDocumentUpdate.project_id == project_id,
+                ProjectDocumentUpdate.path == path,
+            )
+            .order_by(ProjectDocumentUpdate.id)
+        ).all()
+        if snapshot is None and not updates:
+            return None
+
+        ydoc = Y.YDoc()
+        if snapshot:
+            Y.apply_update(ydoc, snapshot.state)
+        for data in updates:
+            Y.apply_update(ydoc, data)
+        return ydoc
+
+    def _encoded_state(
+        self, session: Session, project_id: UUID, path: str
+    ) -> Optional[bytes]:
+        ydoc = self._merged_doc(session, project_id, path)
+        return None if ydoc is None else Y.encode_state_as_update(ydoc)
+
+    def compact(self, doc_id: str, state: Optional[bytes] = None) -> None:
+        project_id, path = parse_document_id(doc_id)
+        with Session(self.engine) as session:
+            self.compact_in_session(session, project_id, state, path)
+            session.commit()
+
+    def compact_in_session(
+        self,
+        session: Session,
+        project_id: UUID,
+        state: Optional[bytes] = None,
+        path: str = MAIN_FILE,
+    ) -> Optional[str]:
+        """
+        Merges the stored snapshot, the update log and `state` (the caller's
+        in-memory state, if any) into a new snapshot, drops the merged log rows
+        and rewrites the file's materialized text. Returns the rebuilt content.
+
+        Only the log rows read here are deleted, so updates appended
+        concurrently by another writer survive until the next compaction.
+        """
+        owner = self._text_owner(session, project_id, path)
+        if not owner:
+            return None
+
+        snapshot = session.get(ProjectDocumentSnapshot, (project_id, path))
+        rows = session.exec(
+            select(ProjectDocumentUpdate.id, ProjectDocumentUpdate.data)
+            .where(
+                ProjectDocumentUpdate.project_id == project_id,
+                ProjectDocumentUpdate.path == path,
+            )
+            .order_by(ProjectDocumentUpdate.id)
+        ).all()
+
+        if snapshot is None and not rows and state is None:
+            # Nothing binary to merge, content is already authoritative
+            return owner.content
+
+        ydoc = Y.YDoc()
+        if snapshot:
+            Y.apply_update(ydoc, snapshot.state)
+        if state:
+            Y.apply_update(ydoc, state)
+        for _, data in rows:
+            Y.apply_update(ydoc, data)
+
+        merged = Y.encode_state_as_update(ydoc)
+        content = str(ydoc.get_text(TEXT_NAME))
+
+        if snapshot is None:
+            snapshot = ProjectDocumentSnapshot(
+                project_id=project_id, path=path, state=merged
+            )
+        else:
+            snapshot.state = merged
+            snapshot.updated_at = datetime.utcnow()
+        session.add(snapshot)
+
+        if rows:
+            session.exec(
+                delete(ProjectDocumentUpdate).where(
+                    ProjectDocumentUpdate.id.in_([row_id for row_id, _ in rows])
+                )
+            )
+
+        owner.content = content
+        owner.updated_at = datetime.utcnow()
+        session.add(owner)
+
+        logger.info(
+            f"Compacted {len(rows)} updates for {path} of project {project_id} "
+            f"into a {len(merged)} byte snapshot"
+        )
+        return content
+
+    def materialize_content(self, session: Session, project: Project) -> None:
+        """
+        Lazily brings `project.content` (the main file) up to date with the
+        update log. No-op when there is no uncompacted tail.
+        """
+        pending = session.exec(
+            select(func.count(ProjectDocumentUpdate.id)).where(
+                ProjectDocumentUpdate.project_id == project.id,
+                ProjectDocumentUpdate.path == MAIN_FILE,
+            )
+        ).one()
+        if pending == 0:
+            return
+
+        self.compact_in_session(session, project.id)
+        session.commit()
+        session.refresh(project)
+
+    def read_files(self, session: Session, project: Project) -> Dict[str, str]:
+        """
+        Returns the file tree of `project` (path -> content), with the text
+        of files that have an uncompacted update log rebuilt from their
+        binary state. Nothing is written: compaction is left to the
+        collaboration service's flushes.
+        """
+        files = {MAIN_FILE: project.content or ""}
+        for project_file in session.exec(
+            select(ProjectFile).where(ProjectFile.project_id == project.id)
+        ).all():
+            files[project_file.path] = project_file.content or ""
+
+        pending = session.exec(
+            select(ProjectDocumentUpdate.path)
+            .where(ProjectDocumentUpdate.project_id == project.id)
+            .distinct()
+        ).all()
+        for path in pending:
+            if path not in files:
+                continue
+            ydoc = self._merged_doc(session, project.id, path)
+            files[path] = str(ydoc.get_text(TEXT_NAME))
+        return files
+
+    def reset(
+        self, session: Session, project_id: UUID, path: Optional[str] = MAIN_FILE
+    ) -> None:
+        """
+        Drops the binary state of a file (of every file when `path` is None),
+        e.g. after its content was replaced through the REST API. The next
+        room load starts from text.
+        """
+        updates = delete(ProjectDocumentUpdate).where(
+            ProjectDocumentUpdate.project_id == project_id
+        )
+        snapshots = delete(ProjectDocumentSnapshot).where(
+            ProjectDocumentSnapshot.project_id == project_id
+        )
+        if path is not None:
+            updates = updates.where(ProjectDocumentUpdate.path == path)
+            snapshots = snapshots.where(ProjectDocumentSnapshot.path == path)
+        session.exec(updates)
+        session.exec(snapshots)
+
+
+document_store = DocumentStore()
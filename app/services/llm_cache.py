@@ -0,0 +1,128 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional, Sequence, Tuple
+from app.services.disk_tier import DiskTier
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    """Prompts differing only in whitespace or Unicode form share an entry."""
+    return WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def llm_cache_key(
+    messages: Sequence[Any], model: str, temperature: float, prompt_type: str
+) -> str:
+    """Hash of a prompt's normalized messages and the model answering it."""
+    digest = hashlib.sha256()
+    for name, value in [
+        ("model", model),
+        ("temperature", temperature),
+        ("type", prompt_type),
+    ]:
+        digest.update(f"{name}={value}\0".encode())
+    for message in messages:
+        role = getattr(message, "type", "human")
+        content = getattr(message, "content", message)
+        if not isinstance(content, str):
+            content = json.dumps(content, sort_keys=True, default=str)
+        digest.update(f"{role}\0{_normalize(content)}\0".encode())
+    return digest.hexdigest()
+
+
+class LLMCache:
+    """
+    LLM replies by prompt key: the `memory_entries` most recently used in
+    memory, and all of them on local disk, evicted least recently used first
+    once they take more than `max_bytes` (see `DiskTier`). Entries expire
+    after the TTL they were stored with.
+
+    The memory tier is safe to use from the event loop; the disk methods
+    are blocking and meant to be run with `asyncio.to_thread`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, memory_entries: int):
+        self.disk = DiskTier(directory, ".json", max_bytes)
+        self.memory_entries = memory_entries
+        # key -> (expires at, content)
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def evictions(self) -> int:
+        return self.disk.evictions
+
+    def get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return entry[1]
+
+    def get_disk(self, key: str) -> Optional[str]:
+        path = self.disk.path(key)
+        try:
+            entry = json.loads(path.read_text())
+            expires, content = entry["expires"], entry["content"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        if expires <= time.time():
+            self.disk.remove(path)
+            self.misses += 1
+            return None
+        try:
+            self.disk.touch(path)
+        except FileNotFoundError:
+            # Evicted meanwhile, the content read is still good
+            pass
+        self.disk_hits += 1
+        self.put_memory(key, content, expires)
+        return content
+
+    def get(self, key: str) -> Optional[str]:
+        content = self.get_memory(key)
+        return content if content is not None else self.get_disk(key)
+
+    def put_memory(self, key: str, content: str, expires: float) -> None:
+        with self._lock:
+            self._memory[key] = (expires, content)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def put_disk(self, key: str, content: str, expires: float) -> None:
+        entry = {"expires": expires, "content": content}
+        self.disk.write(key, json.dumps(entry).encode())
+
+    def put(self, key: str, content: str, ttl: float) -> None:
+        expires = time.time() + ttl
+        self.put_memory(key, content, expires)
+        self.put_disk(key, content, expires)
+
+    def get_stats(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size_bytes": self.disk.size_bytes,
+            "memory_entries": len(self._memory),
+        }
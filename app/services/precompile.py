@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional
+from sqlmodel import Session
+from app.core.config import settings
+from app.models.project import Project
+from app.services.asset_store import FileTree, asset_store
+from app.services.collaboration import CollaborationService, collaboration_service
+from app.services.compiler import CompilerService, compiler_service
+from app.services.document_store import document_store, parse_document_id
+
+logger = logging.getLogger(__name__)
+
+
+class Precompiler:
+    """
+    Queues a background compile of a project after the collaboration service
+    saved one of its documents, so that the PDF is usually cached by the time
+    someone asks for it. Enabled with COMPILE_ON_SAVE.
+
+    A project is precompiled at most once every `interval` seconds: a save
+    arriving sooner schedules one compile for the end of the interval, which
+    picks up the sources as they are by then. Background compiles give way
+    to interactive ones, see `CompileQueue`.
+    """
+
+    def __init__(
+        self,
+        collaboration: CollaborationService,
+        compiler: CompilerService,
+        store=document_store,
+        interval: Optional[float] = None,
+    ):
+        self.collaboration = collaboration
+        self.compiler = compiler
+        self.store = store
+        if interval is None:
+            interval = settings.COMPILE_ON_SAVE_INTERVAL_SECONDS
+        self.interval = interval
+        # When each project was last submitted, and its scheduled precompile
+        self._last_submit: Dict[str, float] = {}
+        self._scheduled: Dict[str, asyncio.Task] = {}
+        self.submitted = 0
+        self.skipped = 0
+
+    def start(self):
+        """Starts listening to collaboration saves, if enabled."""
+        if not settings.COMPILE_ON_SAVE:
+            return
+        if self.on_saved not in self.collaboration.save_listeners:
+            self.collaboration.save_listeners.append(self.on_saved)
+
+    async def stop(self):
+        if self.on_saved in self.collaboration.save_listeners:
+            self.collaboration.save_listeners.remove(self.on_saved)
+        tasks = list(self._scheduled.values())
+        self._scheduled.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def on_saved(self, doc_ids: List[str]):
+        """Save listener, schedules a precompile of each saved project."""
+        now = time.monotonic()
+        # Past its interval, a project saves as if it was never submitted
+        for project_id, last in list(self._last_submit.items()):
+            if last + self.interval <= now:
+                del self._last_submit[project_id]
+        for project_id in {str(parse_document_id(doc_id)[0]) for doc_id in doc_ids}:
+            if project_id in self._scheduled:
+                # Its precompile has not started yet and will see this save
+                continue
+            last = self._last_submit.get(project_id)
+            delay = 0.0 if last is None else max(0.0, last + self.interval - now)
+            self._scheduled[project_id] = asyncio.create_task(
+                self._precompile(project_id, delay)
+            )
+
+    async def _precompile(self, project_id: str, delay: float):
+        await asyncio.sleep(delay)
+        # Saves from now on schedule the next precompile
+        self._scheduled.pop(project_id, None)
+        self._last_submit[project_id] = time.monotonic()
+        try:
+            files = await asyncio.to_thread(self._load_files, project_id)
+            if files is None:
+                # Deleted
+                self._last_submit.pop(project_id, None)
+                return
+            # Files open in a room may have changed since the save
+            files = self.collaboration.live_files(project_id, files)
+            job = await self.compiler.submit(project_id, None, files, background=True)
+        except Exception as e:
+            logger.warning(f"Could not precompile project {project_id}: {e}")
+            return
+
+        if job is None:
+            # Already compiled, an interactive compile is in flight, or the
+            # queue is full
+            self.skipped += 1
+        else:
+            self.submitted += 1
+
+    def _load_files(self, project_id: str) -> Optional[FileTree]:
+        with Session(self.store.engine) as session:
+            project = session.get(Project, uuid.UUID(project_id))
+            if project is None:
+                return None
+            # Read-only: the flusher that just saved compacts the log
+            files = self.store.read_files(session, project)
+            files.update(asset_store.project_assets(session, project.id))
+            return files
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": settings.COMPILE_ON_SAVE,
+            "scheduled": len(self._scheduled),
+            "rate_limited": len(self._last_submit),
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+        }
+
+
+# Singleton instance
+precompiler = Precompiler(collaboration_service, compiler_service)
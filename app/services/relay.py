@@ -0,0 +1,249 @@
+import asyncio
+import fcntl
+import logging
+import os
+import struct
+from typing import Callable, Dict, Optional, Set
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# handler(project_id, message) receives Yjs sync messages from other processes
+RelayHandler = Callable[[str, bytes], None]
+
+
+class CollaborationRelay:
+    """
+    Forwards Yjs sync/update messages between processes serving the same
+    project, so rooms for one project in different workers converge.
+
+    `publish` is synchronous (it is called from YDoc observers) and never
+    delivers a message back to the relay that published it.
+    """
+
+    def __init__(self):
+        self.handler: Optional[RelayHandler] = None
+        # Called after (re)connecting, so rooms can ask peers for missed state
+        self.on_connected: Optional[Callable[[], None]] = None
+        self.subscriptions: Set[str] = set()
+
+    async def start(self, handler: RelayHandler):
+        self.handler = handler
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, project_id: str):
+        self.subscriptions.add(project_id)
+
+    def unsubscribe(self, project_id: str):
+        self.subscriptions.discard(project_id)
+
+    def publish(self, project_id: str, message: bytes):
+        raise NotImplementedError
+
+    def _deliver(self, project_id: str, message: bytes):
+        if self.handler and project_id in self.subscriptions:
+            try:
+                self.handler(project_id, message)
+            except Exception as e:
+                logger.error(f"Relay handler failed for project {project_id}: {e}")
+
+
+class InProcessRelay(CollaborationRelay):
+    """Relays between services living in the same process (tests, dev)."""
+
+    _peers: Set["InProcessRelay"] = set()
+
+    async def start(self, handler: RelayHandler):
+        await super().start(handler)
+        InProcessRelay._peers.add(self)
+
+    async def stop(self):
+        InProcessRelay._peers.discard(self)
+
+    def publish(self, project_id: str, message: bytes):
+        loop = asyncio.get_running_loop()
+        for peer in InProcessRelay._peers:
+            if peer is not self and project_id in peer.subscriptions:
+                loop.call_soon(peer._deliver, project_id, message)
+
+
+# Frame: kind, project id length, payload length, project id, payload
+_HEADER = struct.Struct(">BHI")
+_SUBSCRIBE = 0
+_UNSUBSCRIBE = 1
+_MESSAGE = 2
+
+
+def _frame(kind: int, project_id: str, payload: bytes = b"") -> bytes:
+    key = project_id.encode()
+    return _HEADER.pack(kind, len(key), len(payload)) + key + payload
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    kind, key_len, payload_len = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    project_id = (await reader.readexactly(key_len)).decode()
+    payload = await reader.readexactly(payload_len)
+    return kind, project_id, payload
+
+
+class UnixSocketRelay(CollaborationRelay):
+    """
+    Relays between the workers of one host over a Unix socket, without any
+    outside service.
+
+    The first worker to take an exclusive lock on `<path>.lock` becomes the
+    hub and listens on `path`; the others connect to it. The hub routes each
+    message to the workers subscribed to its project. If the hub exits, its
+    lock is released and the remaining workers elect a new one.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock_file = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Hub side: connected workers and the projects they subscribed to
+        self._peers: Dict[asyncio.StreamWriter, Set[str]] = {}
+        # Worker side: connection to the hub
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    @property
+    def is_hub(self) -> bool:
+        return self._server is not None
+
+    async def start(self, handler: RelayHandler):
+        await super().start(handler)
+        await self._connect_or_serve()
+
+    async def stop(self):
+        self._stopped = True
+        if self._reader_task:
+            self._reader_task.cancel()
+        if self._writer:
+            self._writer.close()
+        if self._server:
+            self._server.close()
+            for writer in list(self._peers):
+                writer.close()
+            self._peers.clear()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _connect_or_serve(self):
+        while not self._stopped:
+            if self._try_lock():
+                if os.path.exists(self.path):
+                    # Left behind by a hub that died
+                    os.unlink(self.path)
+                self._server = await asyncio.start_unix_server(
+                    self._serve_peer, path=self.path
+                )
+                logger.info(f"Collaboration relay serving as hub on {self.path}")
+                break
+
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # Hub elected but not listening yet
+                await asyncio.sleep(0.05)
+                continue
+
+            self._writer = writer
+            for project_id in self.subscriptions:
+                writer.write(_frame(_SUBSCRIBE, project_id))
+            self._reader_task = asyncio.create_task(self._read_from_hub(reader))
+            logger.info(f"Collaboration relay connected to hub on {self.path}")
+            break
+
+        if self.on_connected and not self._stopped:
+            self.on_connected()
+
+    def _try_lock(self) -> bool:
+        if self._lock_file is None:
+            self._lock_file = open(f"{self.path}.lock", "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    async def _read_from_hub(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                kind, project_id, payload = await _read_frame(reader)
+                if kind == _MESSAGE:
+                    self._deliver(project_id, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+        self._writer = None
+        if not self._stopped:
+            logger.warning("Collaboration relay lost its hub, reconnecting")
+            await self._connect_or_serve()
+
+    async def _serve_peer(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        if self._stopped:
+            # Accepted just before the hub stopped
+            writer.close()
+            return
+        subscriptions: Set[str] = set()
+        self._peers[writer] = subscriptions
+        try:
+            while True:
+                kind, project_id, payload = await _read_frame(reader)
+                if kind == _SUBSCRIBE:
+                    subscriptions.add(project_id)
+                elif kind == _UNSUBSCRIBE:
+                    subscriptions.discard(project_id)
+                elif kind == _MESSAGE:
+                    self._route(project_id, payload, sender=writer)
+                    self._deliver(project_id, payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._peers.pop(writer, None)
+            writer.close()
+
+    def _route(self, project_id: str, payload: bytes, sender=None):
+        frame = _frame(_MESSAGE, project_id, payload)
+        for writer, subscriptions in self._peers.items():
+            if writer is not sender and project_id in subscriptions:
+                writer.write(frame)
+
+    def subscribe(self, project_id: str):
+        super().subscribe(project_id)
+        if self._writer:
+            self._writer.write(_frame(_SUBSCRIBE, project_id))
+
+    def unsubscribe(self, project_id: str):
+        super().unsubscribe(project_id)
+        if self._writer:
+            self._writer.write(_frame(_UNSUBSCRIBE, project_id))
+
+    def publish(self, project_id: str, message: bytes):
+        if self.is_hub:
+            self._route(project_id, message)
+        elif self._writer:
+            self._writer.write(_frame(_MESSAGE, project_id, message))
+        # Otherwise we are between hubs; peers resync once reconnected
+
+
+def get_relay() -> Optional[CollaborationRelay]:
+    """Returns the relay configured by COLLAB_RELAY_BACKEND, or None."""
+    backend = settings.COLLAB_RELAY_BACKEND
+    if backend == "none":
+        return None
+    if backend == "inprocess":
+        return InProcessRelay()
+    if backend == "unix":
+        return UnixSocketRelay(settings.COLLAB_RELAY_SOCKET_PATH)
+    raise ValueError(f"Unknown COLLAB_RELAY_BACKEND: {backend}")
@@ -1,4 +1,17 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+import y_py as Y
 from fastapi.testclient import TestClient
+from ypy_websocket.yutils import (
+    YMessageType,
+    create_sync_step1_message,
+    create_update_message,
+    read_message,
+)
+from app.api.v1.endpoints.editor import FastAPIwebsocketAdapter
+from app.services.collaboration import RoomStats
+from app.services.document_store import TEXT_NAME
 from app.core.config import settings
 from app.api.v1.endpoints.projects import create_project
 from app.models.project import Project
@@ -69,3 +82,214 @@ def test_websocket_connect(client: TestClient):
         # So we should NOT receive anything back if we are the only one.
         # Let's connect a second client to verify broadcast
         pass
+
+
+class SlowWebSocket:
+    """Websocket whose sends block until `unblock` is set."""
+
+    def __init__(self):
+        self.sent = []
+        self.unblock = asyncio.Event()
+        self.close_code = None
+        self.url = SimpleNamespace(path="/ws/test")
+        self.incoming = []
+
+    async def send_bytes(self, message: bytes):
+        await self.unblock.wait()
+        self.sent.append(message)
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+        # As slow to close as to read
+        await self.unblock.wait()
+
+    async def receive_bytes(self) -> bytes:
+        if not self.incoming:
+            raise RuntimeError("disconnected")
+        return self.incoming.pop(0)
+
+
+def edit(ydoc: Y.YDoc, text: str) -> bytes:
+    ytext = ydoc.get_text(TEXT_NAME)
+    updates = []
+    ydoc.observe_after_transaction(lambda e: updates.append(e.get_update()))
+    with ydoc.begin_transaction() as txn:
+        ytext.extend(txn, text)
+    return create_update_message(updates[-1])
+
+
+@pytest.mark.asyncio
+async def test_slow_client_queue_coalesces_updates(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_CLIENT_QUEUE_SIZE", 3)
+    ydoc = Y.YDoc()
+    stats = RoomStats()
+    websocket = SlowWebSocket()
+    adapter = FastAPIwebsocketAdapter(websocket, ydoc, stats)
+
+    for word in ["a", "b", "c", "d", "e"]:
+        # Returns immediately even though the client is not reading
+        await asyncio.wait_for(adapter.send(edit(ydoc, word)), timeout=1)
+    assert adapter.queue_depth <= 3
+    assert stats.dropped_messages > 0
+
+    websocket.unblock.set()
+    for _ in range(20):
+        await asyncio.sleep(0)
+    assert adapter.queue_depth == 0
+
+    # Whatever was merged away, the client ends up with the full document
+    client_doc = Y.YDoc()
+    for message in websocket.sent:
+        assert message[0] == YMessageType.SYNC
+        Y.apply_update(client_doc, read_message(message[2:]))
+    assert str(client_doc.get_text(TEXT_NAME)) == "abcde"
+    await adapter.close()
+
+
+@pytest.mark.asyncio
+async def test_lagging_client_is_disconnected(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_CLIENT_MAX_LAG_SECONDS", 0.0)
+    ydoc = Y.YDoc()
+    stats = RoomStats()
+    websocket = SlowWebSocket()
+    adapter = FastAPIwebsocketAdapter(websocket, ydoc, stats)
+
+    await adapter.send(edit(ydoc, "a"))
+    await asyncio.sleep(0.01)
+    # Returns without waiting for the socket to close
+    await asyncio.wait_for(adapter.send(edit(ydoc, "b")), timeout=0.1)
+
+    await asyncio.sleep(0)
+    assert websocket.close_code == 1013
+    assert stats.lag_disconnects == 1
+    assert adapter.queue_depth == 0
+    websocket.unblock.set()
+
+
+@pytest.mark.asyncio
+async def test_fresh_joiner_is_answered_from_initial_sync():
+    websocket = SlowWebSocket()
+    websocket.unblock.set()
+    cached = [b"cached-state", b"cached-tail"]
+    adapter = FastAPIwebsocketAdapter(websocket, initial_sync=lambda: cached)
+
+    resync = create_sync_step1_message(Y.encode_state_vector(Y.YDoc()))
+    websocket.incoming = [
+        resync,
+        create_sync_step1_message(b"\x01\x02\x03"),
+    ]
+
+    # The empty-state sync step 1 never reaches the room
+    message = await adapter.__anext__()
+    assert read_message(message[2:]) == b"\x01\x02\x03"
+
+    await asyncio.sleep(0)
+    assert websocket.sent == cached
+    await adapter.close()
+
+
+def test_compile_jobs(client: TestClient, monkeypatch):
+    from unittest.mock import AsyncMock
+    from app.api.v1.endpoints import editor
+    from app.main import app
+    from app.services.compiler import CompilerService
+
+    service = CompilerService()
+    service._compile = AsyncMock(return_value=b"%PDF-1.4 job")
+    monkeypatch.setattr(editor, "compiler_service", service)
+
+    headers = {
+        "Authorization": f"Bearer {get_auth_token(client, 'jobs@example.com', 'password123')}"
+    }
+    project_id = client.post(
+        f"{settings.API_V1_STR}/projects/",
+        headers=headers,
+        json={"title": "Queued Project"},
+    ).json()["id"]
+    other_headers = {
+        "Authorization": f"Bearer {get_auth_token(client, 'other@example.com', 'password123')}"
+    }
+
+    # One event loop for the whole test, so the queue's runners survive
+    with TestClient(app) as live:
+        response = live.post(
+            f"{settings.API_V1_STR}/editor/{project_id}/compile?wait=false",
+            headers=headers,
+        )
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        response = live.get(
+            f"{settings.API_V1_STR}/editor/compile/jobs/{job_id}?wait=5",
+            headers=headers,
+        )
+        assert response.json()["status"] == "succeeded"
+        response = live.get(
+            f"{settings.API_V1_STR}/editor/compile/jobs/{job_id}/pdf", headers=headers
+        )
+        assert response.content == b"%PDF-1.4 job"
+        response = live.get(
+            f"{settings.API_V1_STR}/editor/compile/jobs/{job_id}",
+            headers=other_headers,
+        )
+        assert response.status_code == 404
+
+        # Waiting compiles return the PDF directly
+        response = live.post(
+            f"{settings.API_V1_STR}/editor/{project_id}/compile", headers=headers
+        )
+        assert response.content == b"%PDF-1.4 job"
+        assert response.headers["X-Compile-Job"]
+
+        service.queue.max_per_user = 0
+        response = live.post(
+            f"{settings.API_V1_STR}/editor/{project_id}/compile", headers=headers
+        )
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_project_pdf_validators_and_ranges(client: TestClient, monkeypatch, tmp_path):
+    from unittest.mock import AsyncMock
+    from app.api.v1.endpoints import editor
+    from app.services.compile_cache import CompileCache
+    from app.services.compiler import CompilerService
+
+    service = CompilerService(cache=CompileCache(str(tmp_path), 1024 * 1024))
+    service._compile = AsyncMock(return_value=b"%PDF-1.4 0123456789")
+    monkeypatch.setattr(editor, "compiler_service", service)
+
+    headers = {
+        "Authorization": f"Bearer {get_auth_token(client, 'pdf@example.com', 'password123')}"
+    }
+    project_id = client.post(
+        f"{settings.API_V1_STR}/projects/",
+        headers=headers,
+        json={"title": "Viewed Project"},
+    ).json()["id"]
+    url = f"{settings.API_V1_STR}/editor/{project_id}/pdf"
+    assert client.get(url, headers=headers).status_code == 404
+
+    client.post(f"{settings.API_V1_STR}/editor/{project_id}/compile", headers=headers)
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1.4 0123456789"
+    etag = response.headers["ETag"]
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304 and response.content == b""
+
+    response = client.get(url, headers={**headers, "Range": "bytes=9-12"})
+    assert response.status_code == 206
+    assert response.content == b"0123"
+    assert response.headers["Content-Range"] == "bytes 9-12/19"
+    response = client.get(url, headers={**headers, "Range": "bytes=-2"})
+    assert response.content == b"89"
+    # A range of another version gets the whole PDF
+    response = client.get(
+        url, headers={**headers, "Range": "bytes=0-3", "If-Range": '"old"'}
+    )
+    assert response.status_code == 200
+    response = client.get(url, headers={**headers, "Range": "bytes=100-"})
+    assert response.status_code == 416
@@ -154,3 +154,104 @@ def test_delete_project(client: TestClient):
         f"{settings.API_V1_STR}/projects/{project_id}", headers=headers
     )
     assert read_res.status_code == 404
+
+
+def test_project_files(client: TestClient):
+    email = "project_files@example.com"
+    password = "password123"
+    token = get_auth_token(client, email, password)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    create_res = client.post(
+        f"{settings.API_V1_STR}/projects/",
+        headers=headers,
+        json={"title": "Thesis", "content": "\\input{chapters/intro}"},
+    )
+    project_id = create_res.json()["id"]
+    files_url = f"{settings.API_V1_STR}/projects/{project_id}/files"
+
+    response = client.post(
+        files_url,
+        headers=headers,
+        json={"path": "chapters/intro.tex", "content": "Intro"},
+    )
+    assert response.status_code == 200
+    assert response.json()["path"] == "chapters/intro.tex"
+
+    # Duplicates and paths escaping the project are rejected
+    assert (
+        client.post(
+            files_url, headers=headers, json={"path": "chapters/intro.tex"}
+        ).status_code
+        == 400
+    )
+    assert (
+        client.post(files_url, headers=headers, json={"path": "../etc"}).status_code
+        == 422
+    )
+
+    listing = client.get(files_url, headers=headers).json()
+    assert [f["path"] for f in listing] == ["main.tex", "chapters/intro.tex"]
+
+    read_res = client.get(f"{files_url}/chapters/intro.tex", headers=headers)
+    assert read_res.json()["content"] == "Intro"
+    main_res = client.get(f"{files_url}/main.tex", headers=headers)
+    assert main_res.json()["content"] == "\\input{chapters/intro}"
+
+    assert (
+        client.delete(f"{files_url}/main.tex", headers=headers).status_code == 400
+    )
+    assert (
+        client.delete(f"{files_url}/chapters/intro.tex", headers=headers).status_code
+        == 200
+    )
+    assert (
+        client.get(f"{files_url}/chapters/intro.tex", headers=headers).status_code
+        == 404
+    )
+
+
+def test_project_assets(client: TestClient, monkeypatch, tmp_path):
+    from app.services.asset_store import asset_store
+
+    monkeypatch.setattr(asset_store, "root", tmp_path)
+    monkeypatch.setattr(asset_store, "release_grace", 0.0)
+    token = get_auth_token(client, "project_assets@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+    project_ids = [
+        client.post(
+            f"{settings.API_V1_STR}/projects/", headers=headers, json={"title": title}
+        ).json()["id"]
+        for title in ("Thesis", "Paper")
+    ]
+    urls = [f"{settings.API_V1_STR}/projects/{pid}/assets" for pid in project_ids]
+
+    png = b"\x89PNG figure"
+    for url in urls:
+        response = client.put(
+            f"{url}/figures/plot.png",
+            headers={**headers, "Content-Type": "image/png"},
+            content=png,
+        )
+        assert response.status_code == 200
+        assert response.json()["size"] == len(png)
+    # Stored once for both projects
+    assert len(list(tmp_path.glob("??/*"))) == 1
+
+    listing = client.get(urls[0], headers=headers).json()
+    assert [(a["path"], a["content_type"]) for a in listing] == [
+        ("figures/plot.png", "image/png")
+    ]
+    assert client.get(f"{urls[0]}/figures/plot.png", headers=headers).content == png
+    # Text files and assets share the project's paths
+    files_url = f"{settings.API_V1_STR}/projects/{project_ids[0]}/files"
+    response = client.post(
+        files_url, headers=headers, json={"path": "figures/plot.png"}
+    )
+    assert response.status_code == 400
+
+    # The content is kept while another project uses it
+    client.delete(f"{urls[0]}/figures/plot.png", headers=headers)
+    assert len(list(tmp_path.glob("??/*"))) == 1
+    client.delete(f"{urls[1]}/figures/plot.png", headers=headers)
+    assert list(tmp_path.glob("??/*")) == []
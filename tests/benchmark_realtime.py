@@ -0,0 +1,362 @@
+"""
+Load test for realtime collaboration.
+
+Starts the ASGI app in-process (uvicorn + a throwaway SQLite database),
+connects N simulated y_py clients spread over M rooms, makes every client
+edit at a fixed rate and reports:
+
+- propagation latency (p50/p99/max, ms) from an edit to its arrival at the
+  other clients of the room,
+- throughput (edits sent and updates delivered per second),
+- server memory per room (estimated resident Yjs state and process RSS),
+- DB write volume (statements and bytes bound to INSERT/UPDATE/DELETE).
+
+Results are printed as JSON tagged with the current commit, so runs can be
+compared across commits:
+
+    python -m tests.benchmark_realtime --clients 40 --rooms 10 --output run.json
+    python -m tests.benchmark_realtime --baseline run.json --max-regression 0.2
+
+With --baseline, the exit code is 1 if p99 latency, DB bytes written or
+memory per room regressed by more than --max-regression.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import y_py as Y
+
+TEXT_NAME = "codemirror"
+TOKEN = re.compile(r"\[(\d+):(\d+)\]")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=20, help="simulated clients")
+    parser.add_argument("--rooms", type=int, default=5, help="rooms (projects)")
+    parser.add_argument(
+        "--edit-rate", type=float, default=2.0, help="edits per second per client"
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument(
+        "--warmup", type=float, default=1.0, help="seconds before measuring"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the peak, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class WriteCounter:
+    """Counts the statements and bytes the app's engine writes."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.statements = {"INSERT": 0, "UPDATE": 0, "DELETE": 0}
+        self.bytes = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        kind = statement.lstrip().split(" ", 1)[0].upper()
+        if kind not in self.statements:
+            return
+        rows = parameters if executemany else [parameters]
+        size = 0
+        for row in rows:
+            values = row.values() if isinstance(row, dict) else row or ()
+            for value in values:
+                if isinstance(value, (bytes, str)):
+                    size += len(value)
+        with self._lock:
+            self.statements[kind] += 1
+            self.bytes += size
+
+    def as_dict(self) -> dict:
+        return {"statements": dict(self.statements), "bytes": self.bytes}
+
+
+class SimulatedClient:
+    """A y-websocket client with its own YDoc, editing at a fixed rate."""
+
+    def __init__(self, client_id: int, url: str, run: "BenchmarkRun"):
+        self.client_id = client_id
+        self.url = url
+        self.run = run
+        self.ydoc = Y.YDoc()
+        self.text = self.ydoc.get_text(TEXT_NAME)
+        self.text.observe(self._on_text_change)
+        # y_py cannot unsubscribe, so one observer captures every transaction
+        self.last_update = b""
+        self.ydoc.observe_after_transaction(self._on_transaction)
+        self.seq = 0
+
+    def _on_transaction(self, event):
+        self.last_update = event.get_update()
+
+    def _on_text_change(self, event):
+        now = time.perf_counter()
+        for change in event.delta:
+            inserted = change.get("insert")
+            if isinstance(inserted, str):
+                for author, seq in TOKEN.findall(inserted):
+                    if int(author) != self.client_id:
+                        self.run.delivered((int(author), int(seq)), now)
+
+    async def run_client(self, stop: asyncio.Event):
+        import websockets
+        from ypy_websocket.yutils import (
+            YMessageType,
+            YSyncMessageType,
+            create_sync_step1_message,
+            create_sync_step2_message,
+            create_update_message,
+            read_message,
+        )
+
+        async with websockets.connect(self.url, max_size=None) as ws:
+            await ws.send(create_sync_step1_message(Y.encode_state_vector(self.ydoc)))
+
+            async def receive():
+                async for message in ws:
+                    if message[0] != YMessageType.SYNC:
+                        continue
+                    payload = read_message(message[2:])
+                    if message[1] == YSyncMessageType.SYNC_STEP1:
+                        diff = Y.encode_state_as_update(self.ydoc, payload)
+                        await ws.send(create_sync_step2_message(diff))
+                    else:
+                        Y.apply_update(self.ydoc, payload)
+
+            receiver = asyncio.create_task(receive())
+            interval = 1.0 / self.run.args.edit_rate
+            # Spread the clients' edits over the interval
+            await asyncio.sleep(random.uniform(0, interval))
+            try:
+                while not stop.is_set():
+                    self.seq += 1
+                    token = f"[{self.client_id}:{self.seq}]"
+                    with self.ydoc.begin_transaction() as txn:
+                        self.text.insert(txn, len(self.text), token)
+                    self.run.sent((self.client_id, self.seq), time.perf_counter())
+                    await ws.send(create_update_message(self.last_update))
+                    await asyncio.sleep(interval)
+                # Let in-flight updates arrive
+                await asyncio.sleep(0.5)
+            finally:
+                receiver.cancel()
+
+
+class BenchmarkRun:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.measuring = False
+        self.sent_at = {}
+        self.latencies = []
+        self.edits_sent = 0
+        self.deliveries = 0
+
+    def sent(self, key, at: float):
+        if self.measuring:
+            self.sent_at[key] = at
+            self.edits_sent += 1
+
+    def delivered(self, key, at: float):
+        sent_at = self.sent_at.get(key)
+        if sent_at is not None:
+            self.latencies.append((at - sent_at) * 1000)
+            self.deliveries += 1
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    """Runs one benchmark against the app configured in this process."""
+    import uvicorn
+    from sqlmodel import Session, SQLModel
+    from app.db.session import engine
+    from app.main import app
+    from app.models.project import Project
+    from app.models.user import User
+    from app.services.collaboration import collaboration_service
+
+    random.seed(args.seed)
+    engine.echo = False
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        owner = User(email=f"bench-{time.time_ns()}@example.com", hashed_password="x")
+        session.add(owner)
+        projects = [
+            Project(title=f"Bench {i}", owner_id=owner.id, content="")
+            for i in range(args.rooms)
+        ]
+        session.add_all(projects)
+        session.commit()
+        project_ids = [str(project.id) for project in projects]
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", ws="auto")
+    )
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    run = BenchmarkRun(args)
+    writes = WriteCounter(engine)
+    rss_before = rss_bytes()
+    stop = asyncio.Event()
+    clients = [
+        SimulatedClient(
+            client_id,
+            f"ws://127.0.0.1:{port}/api/v1/editor/ws/"
+            f"{project_ids[client_id % args.rooms]}",
+            run,
+        )
+        for client_id in range(args.clients)
+    ]
+    tasks = [asyncio.create_task(client.run_client(stop)) for client in clients]
+
+    await asyncio.sleep(args.warmup)
+    run.measuring = True
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    run.measuring = False
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    stats = collaboration_service.get_stats()
+    rss_after = rss_bytes()
+    # Stops the app, whose shutdown drains the remaining writes
+    server.should_exit = True
+    await serve_task
+
+    latencies = sorted(run.latencies)
+    expected = run.edits_sent * max(args.clients / args.rooms - 1, 0)
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "clients": args.clients,
+            "rooms": args.rooms,
+            "edit_rate": args.edit_rate,
+            "duration": args.duration,
+            "python": sys.version.split()[0],
+        },
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+        "throughput": {
+            "edits_per_s": round(run.edits_sent / elapsed, 2),
+            "deliveries_per_s": round(run.deliveries / elapsed, 2),
+            "delivery_ratio": round(run.deliveries / expected, 4) if expected else 0,
+        },
+        "memory": {
+            "resident_bytes_per_room": stats["resident_bytes"]
+            // max(stats["rooms"], 1),
+            "rss_delta_bytes_per_room": (rss_after - rss_before) // args.rooms,
+        },
+        "db_writes": writes.as_dict(),
+    }
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Returns a message per metric that got worse by more than `max_regression`."""
+    metrics = [
+        ("latency_ms", "p99"),
+        ("memory", "resident_bytes_per_room"),
+        ("db_writes", "bytes"),
+    ]
+    regressions = []
+    for group, name in metrics:
+        before = baseline.get(group, {}).get(name)
+        after = results[group][name]
+        if before and after > before * (1 + max_regression):
+            regressions.append(
+                f"{group}.{name}: {before} -> {after} "
+                f"(+{(after / before - 1) * 100:.0f}%, "
+                f"baseline commit {baseline.get('commit')})"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+
+    # Configure the app before importing it: throwaway database, no relay
+    db_dir = tempfile.mkdtemp(prefix="sciagent-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_dir}/bench.db"
+    os.environ["COLLAB_RELAY_BACKEND"] = "none"
+    for name, value in {
+        "PROJECT_NAME": "SciAgent",
+        "SECRET_KEY": "benchmark",
+        "OLLAMA_BASE_URL": "http://localhost:11434",
+        "OLLAMA_MODEL": "benchmark",
+    }.items():
+        os.environ.setdefault(name, value)
+
+    try:
+        results = asyncio.run(run_benchmark(args))
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
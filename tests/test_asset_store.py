@@ -0,0 +1,100 @@
+import os
+import pytest
+from app.services.asset_store import AssetRef, AssetStore, AssetTooLarge
+from app.services.compile_builds import BuildDirectories
+from app.services.compile_cache import compile_key
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.asyncio
+async def test_uploads_are_stored_once_per_content(tmp_path):
+    store = AssetStore(str(tmp_path / "assets"), max_bytes=100)
+
+    sha256, size = await store.put_stream(stream(b"@article{x,", b" title={X}}"))
+    assert size == 22 and store.path(sha256).read_bytes() == b"@article{x, title={X}}"
+    assert await store.put_stream(stream(b"@article{x, title={X}}")) == (sha256, 22)
+    assert store.get_stats()["stored"] == 1
+    assert store.get_stats()["deduplicated"] == 1
+
+    with pytest.raises(AssetTooLarge):
+        await store.put_stream(stream(b"x" * 60, b"x" * 60))
+    # Nothing is left behind by the rejected upload
+    assert list((tmp_path / "assets" / ".uploads").iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_build_dirs_hardlink_assets(tmp_path):
+    store = AssetStore(str(tmp_path / "assets"), max_bytes=1024)
+    builds = BuildDirectories(tmp_path / "builds", 10, 3600, assets=store)
+    sha256, _ = await store.put_stream(stream(b"\x89PNG"))
+    files = {"main.tex": "\\includegraphics{fig.png}", "fig.png": AssetRef(sha256)}
+
+    build_dir = builds.sync("p1", files)
+    figure = build_dir / "fig.png"
+    assert os.path.samefile(figure, store.path(sha256))
+    builds.sync("p1", files)
+    assert store.get_stats()["links"] == 1
+
+    # Replacing an asset with text never writes into the store
+    builds.sync("p1", {**files, "fig.png": "text"})
+    assert figure.read_text() == "text"
+    assert store.path(sha256).read_bytes() == b"\x89PNG"
+
+    with pytest.raises(ValueError):
+        builds.sync("p1", {**files, "fig.png": AssetRef("0" * 64)})
+
+
+@pytest.mark.asyncio
+async def test_cross_device_copies_are_reused(tmp_path, monkeypatch):
+    store = AssetStore(str(tmp_path / "assets"), max_bytes=1024)
+    sha256, _ = await store.put_stream(stream(b"\x89PNG"))
+
+    def cross_device(src, dst):
+        raise OSError("Invalid cross-device link")
+
+    monkeypatch.setattr(os, "link", cross_device)
+    dest = tmp_path / "build" / "fig.png"
+    store.link(sha256, dest)
+    store.link(sha256, dest)
+    assert dest.read_bytes() == b"\x89PNG"
+    assert store.get_stats()["copies"] == 1
+
+    # A copy that was changed since is replaced
+    dest.write_bytes(b"\x89PNX")
+    store.link(sha256, dest)
+    assert dest.read_bytes() == b"\x89PNG"
+    assert store.get_stats()["copies"] == 2
+
+
+def test_compile_key_covers_assets():
+    files = {"main.tex": "A", "fig.png": AssetRef("a" * 64)}
+
+    assert compile_key(files, "i", {}) != compile_key(
+        {**files, "fig.png": AssetRef("b" * 64)}, "i", {}
+    )
+    assert compile_key(files, "i", {}) != compile_key(
+        {**files, "fig.png": "a" * 64}, "i", {}
+    )
+
+
+@pytest.mark.asyncio
+async def test_recently_uploaded_blobs_are_released_later(tmp_path, session):
+    store = AssetStore(str(tmp_path / "assets"), max_bytes=1024, release_grace=60)
+    sha256, _ = await store.put_stream(stream(b"%PDF figure"))
+    path = store.path(sha256)
+
+    # Uploaded again by a request that has not committed its row yet
+    os.utime(path, (1, path.stat().st_mtime))
+    await store.put_stream(stream(b"%PDF figure"))
+    store.release(session, sha256)
+    assert path.exists() and store.get_stats()["deferred_releases"] == 1
+
+    # Checked again by a release after the grace period
+    os.utime(path, (1, path.stat().st_mtime))
+    store._deferred[sha256] = 0
+    store.release(session, "0" * 64)
+    assert not path.exists() and store.get_stats()["deferred_releases"] == 0
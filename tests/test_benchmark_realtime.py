@@ -0,0 +1,56 @@
+import json
+import pytest
+import subprocess
+import sys
+from pathlib import Path
+from tests.benchmark_realtime import compare
+
+
+@pytest.mark.benchmark
+def test_benchmark_smoke():
+    # Own process, so the app is configured with the benchmark's database
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "tests.benchmark_realtime",
+            "--clients",
+            "3",
+            "--rooms",
+            "1",
+            "--duration",
+            "1",
+            "--warmup",
+            "0.5",
+        ],
+        capture_output=True,
+        text=True,
+        timeout=60,
+        cwd=Path(__file__).resolve().parent.parent,
+    )
+    assert process.returncode == 0, process.stderr
+    results = json.loads(process.stdout)
+
+    assert results["throughput"]["edits_per_s"] > 0
+    assert results["throughput"]["delivery_ratio"] > 0.9
+    assert results["latency_ms"]["p99"] >= results["latency_ms"]["p50"] > 0
+    assert results["db_writes"]["statements"]["INSERT"] > 0
+
+
+def test_compare_flags_regressions_only():
+    baseline = {
+        "commit": "abc123",
+        "latency_ms": {"p99": 10.0},
+        "memory": {"resident_bytes_per_room": 1000},
+        "db_writes": {"bytes": 5000},
+    }
+    results = {
+        "latency_ms": {"p99": 11.0},
+        "memory": {"resident_bytes_per_room": 900},
+        "db_writes": {"bytes": 8000},
+    }
+
+    regressions = compare(results, baseline, max_regression=0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("db_writes.bytes")
@@ -0,0 +1,397 @@
+import asyncio
+import threading
+import pytest
+import y_py as Y
+from sqlalchemy.exc import IntegrityError
+from ypy_websocket.yroom import YRoom
+from ypy_websocket.yutils import read_message
+from app.core.config import settings
+from app.services.collaboration import CollaborationService, RoomLoadError
+from app.services.document_store import TEXT_NAME, DocumentState
+
+
+class InMemoryStore:
+    """Stand-in for DocumentStore that keeps everything in a dict."""
+
+    def __init__(self):
+        self.updates = {}
+        self.snapshots = {}
+        self.loads = 0
+        self.batches = 0
+
+    def load(self, project_id):
+        self.loads += 1
+        if project_id == "missing":
+            return None
+        return DocumentState(
+            snapshot=self.snapshots.get(project_id),
+            updates=list(self.updates.get(project_id, [])),
+        )
+
+    def write_batch(self, updates, states=None):
+        self.batches += 1
+        for project_id, project_updates in updates.items():
+            self.updates.setdefault(project_id, []).extend(project_updates)
+        for project_id, state in (states or {}).items():
+            self.compact(project_id, state)
+
+    def seed(self, project_id, state):
+        return self.snapshots.setdefault(project_id, state)
+
+    def compact(self, project_id, state=None):
+        self.snapshots[project_id] = state
+        self.updates[project_id] = []
+
+
+async def open_room(service: CollaborationService, project_id: str):
+    return await service.get_room(project_id)
+
+
+def write(room, text: str):
+    ytext = room.ydoc.get_text(TEXT_NAME)
+    with room.ydoc.begin_transaction() as txn:
+        ytext.extend(txn, text)
+
+
+@pytest.mark.asyncio
+async def test_idle_room_is_flushed_and_evicted(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_ROOM_IDLE_SECONDS", 0.0)
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+
+    room = await open_room(service, "p1")
+    write(room, "hello")
+    assert service.get_stats()["resident_bytes"] > 0
+
+    await service.evict_rooms()
+
+    assert "p1" not in service.rooms
+    assert service.get_stats()["evictions_idle"] == 1
+    assert service.get_stats()["resident_bytes"] == 0
+    # Pending debounced updates were flushed before the room was dropped
+    assert len(store.updates["p1"]) == 1
+
+    reloaded = await open_room(service, "p1")
+    assert str(reloaded.ydoc.get_text(TEXT_NAME)) == "hello"
+
+
+@pytest.mark.asyncio
+async def test_rooms_with_clients_are_kept(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_ROOM_IDLE_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "COLLAB_MEMORY_BUDGET_BYTES", 0)
+    service = CollaborationService(store=InMemoryStore())
+
+    room = await open_room(service, "p1")
+    write(room, "busy")
+    service.room_stats["p1"].clients = 1
+
+    await service.evict_rooms()
+
+    assert "p1" in service.rooms
+    assert service.get_stats()["evictions_idle"] == 0
+    assert service.get_stats()["evictions_memory"] == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_budget_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_ROOM_IDLE_SECONDS", 3600.0)
+    service = CollaborationService(store=InMemoryStore())
+
+    old = await open_room(service, "old")
+    write(old, "x" * 100)
+    await asyncio.sleep(0.01)
+    new = await open_room(service, "new")
+    write(new, "y" * 100)
+
+    # Room for exactly one of them
+    budget = service.room_stats["new"].resident_bytes
+    monkeypatch.setattr(settings, "COLLAB_MEMORY_BUDGET_BYTES", budget)
+
+    await service.evict_rooms()
+
+    assert "old" not in service.rooms
+    assert "new" in service.rooms
+    assert service.get_stats()["evictions_memory"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_joiners_share_one_load():
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+
+    rooms = await asyncio.gather(*(open_room(service, "p1") for _ in range(5)))
+
+    assert all(room is rooms[0] for room in rooms)
+    assert rooms[0].ready
+    assert store.loads == 1
+
+
+@pytest.mark.asyncio
+async def test_load_failure_propagates_to_every_joiner():
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+
+    results = await asyncio.gather(
+        *(open_room(service, "missing") for _ in range(3)), return_exceptions=True
+    )
+
+    assert all(isinstance(result, RoomLoadError) for result in results)
+    assert store.loads == 1
+    assert "missing" not in service.rooms
+    assert "missing" not in service.loading_tasks
+
+
+@pytest.mark.asyncio
+async def test_room_that_fails_to_start_is_not_awaited_forever(monkeypatch):
+    async def crash(self):
+        raise RuntimeError("task group failed")
+
+    monkeypatch.setattr(YRoom, "start", crash)
+    service = CollaborationService(store=InMemoryStore())
+
+    with pytest.raises(RoomLoadError):
+        await asyncio.wait_for(open_room(service, "p1"), timeout=1)
+    assert "p1" not in service.rooms
+    assert "p1" not in service.loading_tasks
+
+
+@pytest.mark.asyncio
+async def test_flush_batches_settled_rooms_in_one_write(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SAVE_DEBOUNCE_SECONDS", 0.0)
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+
+    for project_id in ("p1", "p2", "p3"):
+        write(await open_room(service, project_id), project_id)
+
+    await service.flush(service._due_for_flush())
+
+    assert store.batches == 1
+    assert all(len(store.updates[p]) == 1 for p in ("p1", "p2", "p3"))
+    assert service._due_for_flush() == []
+
+
+@pytest.mark.asyncio
+async def test_unchanged_content_is_not_rewritten(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SAVE_DEBOUNCE_SECONDS", 0.0)
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+    room = await open_room(service, "p1")
+
+    # Type and delete again: text is back to what was loaded
+    write(room, "typo")
+    ytext = room.ydoc.get_text(TEXT_NAME)
+    with room.ydoc.begin_transaction() as txn:
+        ytext.delete_range(txn, 0, 4)
+
+    await service.flush(service._due_for_flush())
+
+    assert store.batches == 0
+    assert service.get_stats()["skipped_saves"] == 1
+    # Buffered until the next real change
+    assert len(service.pending_updates["p1"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_max_staleness_flushes_while_edits_continue(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SAVE_DEBOUNCE_SECONDS", 3600.0)
+    monkeypatch.setattr(settings, "COLLAB_MAX_STALENESS_SECONDS", 0.05)
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+    room = await open_room(service, "p1")
+
+    write(room, "a")
+    assert service._due_for_flush() == []
+
+    await asyncio.sleep(0.06)
+    write(room, "b")
+    assert service._due_for_flush() == ["p1"]
+
+    await service.flush(service._due_for_flush())
+    assert len(store.updates["p1"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_discarded_rooms_are_not_saved(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SAVE_DEBOUNCE_SECONDS", 0.0)
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+
+    class Client:
+        path = "/ws/p1"
+        codes = []
+
+        async def send(self, message):
+            pass
+
+        async def disconnect(self, code):
+            self.codes.append(code)
+
+    main = await open_room(service, "p1")
+    main.clients.append(Client())
+    for room_id in ("p1", "p1/intro.tex", "p2"):
+        write(await open_room(service, room_id), room_id)
+
+    # As when the project is deleted through the REST API
+    await service.discard_rooms("p1", path=None)
+    await service.flush(service._due_for_flush())
+
+    assert list(service.rooms) == ["p2"]
+    assert Client.codes == [1012]
+    assert list(store.updates) == ["p2"]
+
+
+@pytest.mark.asyncio
+async def test_rooms_reload_only_after_the_reset(monkeypatch):
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+    write(await open_room(service, "p1"), "old")
+    await service.flush(["p1"], force=True)
+    loads = store.loads
+    resetting = threading.Event()
+    proceed = threading.Event()
+
+    def reset():
+        resetting.set()
+        proceed.wait(1)
+        store.snapshots.pop("p1", None)
+        store.updates.pop("p1", None)
+
+    discard = asyncio.create_task(service.discard_rooms("p1", path=None, reset=reset))
+    await asyncio.to_thread(resetting.wait, 1)
+    # A client reconnecting during the reset waits for it
+    rejoin = asyncio.create_task(open_room(service, "p1/intro.tex"))
+    await asyncio.sleep(0.01)
+    assert not rejoin.done() and store.loads == loads
+
+    proceed.set()
+    await discard
+    await rejoin
+    assert "p1" not in service.rooms
+    assert str((await open_room(service, "p1")).ydoc.get_text(TEXT_NAME)) == ""
+
+
+@pytest.mark.asyncio
+async def test_joiners_are_served_from_cached_state(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_STATE_CACHE_MAX_TAIL", 2)
+    service = CollaborationService(store=InMemoryStore())
+    room = await open_room(service, "p1")
+    write(room, "hello")
+
+    def joined_text():
+        client_doc = Y.YDoc()
+        for message in service.initial_sync_messages("p1"):
+            Y.apply_update(client_doc, read_message(message[2:]))
+        return str(client_doc.get_text(TEXT_NAME))
+
+    assert joined_text() == "hello"
+    assert joined_text() == "hello"
+    assert service.get_stats()["state_cache_builds"] == 1
+    assert service.get_stats()["state_cache_hits"] == 1
+
+    # Changes are appended to the cached state, not re-encoded
+    write(room, " world")
+    assert joined_text() == "hello world"
+    assert service.get_stats()["state_cache_builds"] == 1
+
+    # Past the tail limit the cache is rebuilt
+    write(room, "!")
+    write(room, "!")
+    assert joined_text() == "hello world!!"
+    assert service.get_stats()["state_cache_builds"] == 2
+
+
+@pytest.mark.asyncio
+async def test_oversized_initial_sync_is_counted(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SYNC_MESSAGE_WARN_BYTES", 100)
+    service = CollaborationService(store=InMemoryStore())
+    room = await open_room(service, "p1")
+    write(room, "x" * 50)
+    service.initial_sync_messages("p1")
+    assert service.get_stats()["oversized_initial_syncs"] == 0
+
+    write(room, "x" * 200)
+    service.state_caches["p1"].base = None
+    service.initial_sync_messages("p1")
+    assert service.get_stats()["oversized_initial_syncs"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shutdown_drains_dirty_rooms_in_parallel_batches(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SAVE_DEBOUNCE_SECONDS", 3600.0)
+    monkeypatch.setattr(settings, "COLLAB_SHUTDOWN_BATCH_SIZE", 2)
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+    for project_id in ["p1", "p2", "p3"]:
+        write(await open_room(service, project_id), project_id)
+
+    await service.shutdown()
+
+    assert store.batches == 2
+    assert {pid: len(u) for pid, u in store.updates.items()} == {
+        "p1": 1,
+        "p2": 1,
+        "p3": 1,
+    }
+    assert service.pending_updates == {}
+
+
+@pytest.mark.asyncio
+async def test_shutdown_saves_updates_of_skipped_saves(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SAVE_DEBOUNCE_SECONDS", 0.0)
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+    room = await open_room(service, "p1")
+    write(room, "typo")
+    with room.ydoc.begin_transaction() as txn:
+        room.ydoc.get_text(TEXT_NAME).delete_range(txn, 0, 4)
+    await service.flush(service._due_for_flush())
+    assert store.batches == 0
+
+    await service.shutdown()
+
+    assert len(store.updates["p1"]) == 2
+    assert service.pending_updates == {}
+
+
+@pytest.mark.asyncio
+async def test_rejected_document_does_not_fail_its_batch(monkeypatch):
+    monkeypatch.setattr(settings, "COLLAB_SAVE_DEBOUNCE_SECONDS", 0.0)
+
+    class DeletedProjectStore(InMemoryStore):
+        def write_batch(self, updates, states=None):
+            if "gone" in updates:
+                raise IntegrityError("INSERT", {}, Exception("foreign key"))
+            super().write_batch(updates, states)
+
+    store = DeletedProjectStore()
+    service = CollaborationService(store=store)
+    saved = []
+    service.save_listeners.append(saved.extend)
+    for project_id in ("p1", "gone", "p2"):
+        write(await open_room(service, project_id), project_id)
+
+    await service.flush(service._due_for_flush())
+
+    assert sorted(store.updates) == ["p1", "p2"]
+    assert sorted(saved) == ["p1", "p2"]
+    # Dropped rather than retried by every later flush
+    assert service.pending_updates == {}
+
+
+@pytest.mark.asyncio
+async def test_hot_rooms_are_prewarmed_after_restart(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "COLLAB_PREWARM_ROOMS", True)
+    monkeypatch.setattr(settings, "COLLAB_HOT_ROOMS_PATH", str(tmp_path / "hot.json"))
+    store = InMemoryStore()
+    service = CollaborationService(store=store)
+    write(await open_room(service, "p1"), "hello")
+    await service.shutdown()
+
+    restarted = CollaborationService(store=store)
+    await restarted.startup()
+    await restarted._prewarm_task
+
+    assert list(restarted.rooms) == ["p1"]
+    text = restarted.rooms["p1"].ydoc.get_text(TEXT_NAME)
+    assert str(text) == "hello"
@@ -0,0 +1,111 @@
+import asyncio
+import hashlib
+import os
+import uuid
+import pytest
+from unittest.mock import AsyncMock
+from app.services.compile_cache import CompileCache, compile_key
+from app.services.compiler import CompilerService
+
+OPTIONS = {"engine": "pdflatex"}
+
+
+def test_compile_key_covers_sources_image_and_options():
+    files = {"main.tex": "A", "chapters/b.tex": "B"}
+    key = compile_key(files, "image:1", OPTIONS)
+
+    assert key == compile_key(dict(reversed(files.items())), "image:1", OPTIONS)
+    assert key != compile_key({**files, "main.tex": "A2"}, "image:1", OPTIONS)
+    assert key != compile_key(files, "image:2", OPTIONS)
+    assert key != compile_key(files, "image:1", {"engine": "xelatex"})
+    # Moving content between files changes the key
+    assert compile_key({"a": "xy", "b": ""}, "i", {}) != compile_key(
+        {"a": "x", "b": "y"}, "i", {}
+    )
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = CompileCache(str(tmp_path), max_bytes=250)
+    cache.put("old", b"o" * 100)
+    cache.put("used", b"u" * 100)
+    os.utime(tmp_path / "old.pdf", (1, 1))
+    os.utime(tmp_path / "used.pdf", (2, 2))
+
+    # A hit makes "used" the most recent entry
+    assert cache.get("used") == b"u" * 100
+    cache.put("new", b"n" * 100)
+
+    assert cache.get("old") is None
+    assert cache.get("new") == b"n" * 100
+    assert cache.get_stats() == {
+        "hits": 2,
+        "misses": 1,
+        "evictions": 1,
+        "size_bytes": 200,
+    }
+
+
+def test_size_is_counted_once_and_kept_up_to_date(tmp_path, monkeypatch):
+    (tmp_path / "earlier.pdf").write_bytes(b"e" * 100)
+    cache = CompileCache(str(tmp_path), max_bytes=1000)
+    cache.put("a", b"a" * 100)
+    # Only writes past max_bytes walk the directory again
+    monkeypatch.setattr(cache.disk, "_entries", lambda: pytest.fail("scanned"))
+    cache.put("b", b"b" * 100)
+    cache.put("a", b"a" * 50)
+    assert cache.get_stats()["size_bytes"] == 250
+
+
+@pytest.mark.asyncio
+async def test_repeat_compile_is_served_from_cache(tmp_path):
+    service = CompilerService(cache=CompileCache(str(tmp_path), 1024 * 1024))
+    service._compile = AsyncMock(return_value=b"%PDF-1.4 cached")
+    files = {"main.tex": "\\documentclass{article}"}
+
+    assert await service.compile_project("p1", files) == b"%PDF-1.4 cached"
+    assert await service.compile_project("p1", files) == b"%PDF-1.4 cached"
+
+    service._compile.assert_awaited_once()
+    assert service.get_stats()["cache"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_take_no_queue_slot(tmp_path):
+    cache = CompileCache(str(tmp_path), 1024 * 1024)
+    service = CompilerService(cache=cache)
+    release = asyncio.Event()
+
+    async def compile(project_id, files, log, preview):
+        await release.wait()
+        return files["main.tex"].encode()
+
+    service._compile = compile
+    cached = {"main.tex": "cached"}
+    cache.put(compile_key(cached, service.docker_image, service.options), b"%PDF")
+    user = uuid.uuid4()
+
+    running = await service.submit("p1", user, {"main.tex": "v1"})
+    await asyncio.sleep(0.01)
+    job = await service.submit("p1", user, cached)
+
+    # Finished right away, while the older compile was still running
+    assert job.status == "succeeded" and job.pdf == b"%PDF"
+    assert cache.latest("p1").path.read_bytes() == b"%PDF"
+    assert await running.wait(1) and running.superseded_by == job.id
+    assert service.get_stats()["queue"]["completed_on_submit"] == 1
+    await service.shutdown()
+
+
+def test_latest_pdf_per_project(tmp_path):
+    cache = CompileCache(str(tmp_path), max_bytes=150)
+    assert cache.latest("p1") is None
+
+    cache.put("k1", b"1" * 100)
+    cache.set_latest("p1", "k1", b"1" * 100)
+    latest = cache.latest("p1")
+    assert latest.path.read_bytes() == b"1" * 100 and latest.size == 100
+    assert latest.etag == hashlib.sha256(b"1" * 100).hexdigest()
+
+    # Evicted PDFs are no longer served
+    cache.put("k2", b"2" * 100)
+    assert cache.latest("p1") is None
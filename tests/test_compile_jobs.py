@@ -0,0 +1,186 @@
+import asyncio
+import uuid
+import pytest
+from fastapi import HTTPException
+from app.services.compile_jobs import CompileQueue, CompileQueueFull
+
+
+def make_queue(release: asyncio.Event = None, **limits) -> CompileQueue:
+    async def run(project_id, files, log, preview):
+        if release:
+            await release.wait()
+        if project_id == "broken":
+            raise HTTPException(status_code=400, detail="Compilation Failed")
+        return f"%PDF {files['main.tex']}".encode()
+
+    options = {"concurrency": 1, "max_queued": 10, "max_per_user": 10}
+    options.update(limits)
+    return CompileQueue(run, retention=60, **options)
+
+
+@pytest.mark.asyncio
+async def test_jobs_run_in_background():
+    queue = make_queue()
+    user = uuid.uuid4()
+
+    job = queue.submit("project", user, {"main.tex": "A"}, "A")
+    failed = queue.submit("broken", user, {"main.tex": "B"}, "B")
+    assert job.status == "queued" and queue.position(failed) == 1
+
+    assert await failed.wait(1)
+    assert job.status == "succeeded" and job.pdf == b"%PDF A"
+    assert job.files is None
+    assert failed.status == "failed"
+    assert (failed.error_status, failed.error) == (400, "Compilation Failed")
+    assert queue.get(job.id) is job
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_retry_hint():
+    release = asyncio.Event()
+    queue = make_queue(release, max_queued=1)
+
+    running = queue.submit("one", uuid.uuid4(), {"main.tex": "A"}, "A")
+    await asyncio.sleep(0)
+    queue.submit("two", uuid.uuid4(), {"main.tex": "B"}, "B")
+    with pytest.raises(CompileQueueFull) as exc_info:
+        queue.submit("three", uuid.uuid4(), {"main.tex": "C"}, "C")
+    assert exc_info.value.retry_after >= 1
+    assert queue.get_stats()["rejected"] == 1
+
+    release.set()
+    assert await running.wait(1)
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_per_user_limit():
+    release = asyncio.Event()
+    queue = make_queue(release, max_per_user=1)
+    alice, bob = uuid.uuid4(), uuid.uuid4()
+
+    job = queue.submit("one", alice, {"main.tex": "A"}, "A")
+    with pytest.raises(CompileQueueFull):
+        queue.submit("two", alice, {"main.tex": "A2"}, "A2")
+    queue.submit("two", bob, {"main.tex": "B"}, "B")
+
+    release.set()
+    assert await job.wait(1)
+    # Finished jobs no longer count against the user
+    queue.submit("three", alice, {"main.tex": "A3"}, "A3")
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_same_sources_share_one_job():
+    release = asyncio.Event()
+    queue = make_queue(release)
+
+    job = queue.submit("project", uuid.uuid4(), {"main.tex": "A"}, "A")
+    assert queue.submit("project", uuid.uuid4(), {"main.tex": "A"}, "A") is job
+    # Other projects are not coalesced
+    other = queue.submit("other", uuid.uuid4(), {"main.tex": "A"}, "A")
+    assert other is not job
+
+    release.set()
+    assert await job.wait(1) and job.pdf == b"%PDF A"
+    assert queue.get_stats()["coalesced"] == 1
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_newer_sources_supersede_older_jobs():
+    release = asyncio.Event()
+    cancelled = []
+
+    async def run(project_id, files, log, preview):
+        try:
+            await release.wait()
+        except asyncio.CancelledError:
+            cancelled.append(files["main.tex"])
+            raise
+        return files["main.tex"].encode()
+
+    queue = CompileQueue(run, 1, max_queued=10, max_per_user=1, retention=60)
+    user = uuid.uuid4()
+
+    running = queue.submit("project", user, {"main.tex": "v1"}, "v1")
+    await asyncio.sleep(0.01)
+    assert running.status == "running"
+    # The per-user limit does not count the job being replaced
+    newer = queue.submit("project", user, {"main.tex": "v2"}, "v2")
+    latest = queue.submit("project", user, {"main.tex": "v3"}, "v3")
+
+    assert await running.wait(1)
+    assert running.status == "superseded" and cancelled == ["v1"]
+    assert newer.status == "superseded" and newer.superseded_by == latest.id
+
+    release.set()
+    assert await queue.latest(running) is latest
+    assert latest.pdf == b"v3"
+    # The runner survived the cancelled compile
+    assert queue.get_stats()["superseded"] == 2
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_background_jobs_give_way_to_interactive_ones():
+    release = asyncio.Event()
+    queue = make_queue(release)
+    user = uuid.uuid4()
+
+    warming = queue.submit("one", None, {"main.tex": "A"}, "A", background=True)
+    await asyncio.sleep(0.01)
+    assert warming.status == "running"
+    # An interactive job needing the only runner preempts the background one
+    job = queue.submit("two", user, {"main.tex": "B"}, "B")
+    assert await warming.wait(1)
+    assert (warming.status, warming.error) == ("failed", "Compile preempted")
+
+    # Queued background jobs wait behind interactive ones
+    later = queue.submit("three", None, {"main.tex": "C"}, "C", background=True)
+    assert queue.position(later) == 0
+    release.set()
+    assert await later.wait(1) and job.status == "succeeded"
+    assert queue.get_stats()["preempted"] == 1
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_background_jobs_never_replace_interactive_ones():
+    release = asyncio.Event()
+    queue = make_queue(release)
+    user = uuid.uuid4()
+
+    job = queue.submit("project", user, {"main.tex": "v1"}, "v1")
+    assert queue.submit("project", None, {"main.tex": "v2"}, "v2", True) is None
+
+    # A user asking for the sources being warmed joins the background job
+    release.set()
+    await job.wait(1)
+    release.clear()
+    warming = queue.submit("project", None, {"main.tex": "v2"}, "v2", True)
+    assert queue.submit("project", user, {"main.tex": "v2"}, "v2") is warming
+    assert not warming.background and user in warming.users
+
+    release.set()
+    assert await warming.wait(1) and warming.pdf == b"%PDF v2"
+    await queue.close()
+
+
+@pytest.mark.asyncio
+async def test_previews_and_full_compiles_do_not_supersede_each_other():
+    release = asyncio.Event()
+    queue = make_queue(release)
+    user = uuid.uuid4()
+
+    full = queue.submit("project", user, {"main.tex": "v1"}, "v1")
+    preview = queue.submit("project", user, {"main.tex": "p1"}, "p1", preview=True)
+    newer = queue.submit("project", user, {"main.tex": "p2"}, "p2", preview=True)
+
+    assert not full.superseded_by and preview.superseded_by == newer.id
+    release.set()
+    assert await full.wait(1) and full.status == "succeeded"
+    assert await newer.wait(1) and newer.preview
+    await queue.close()
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from app.services.compile_log import CompileLog, Diagnostic, LogParser
+
+OUTPUT = """This is pdfTeX, Version 3.141592653-2.6-1.40.25
+(./main.tex
+LaTeX2e <2023-11-01>
+(/usr/share/texlive/texmf-dist/tex/latex/base/article.cls
+Document Class: article 2023/05/17 v1.4n Standard LaTeX document class
+(/usr/share/texlive/texmf-dist/tex/latex/base/size10.clo))
+(./sections/intro.tex
+LaTeX Warning: Reference `fig:x' on page 1 undefined on input line 7.
+
+./sections/intro.tex:9: Undefined control sequence.
+l.9 \\foo
+
+Package hyperref Warning: Token not allowed in a PDF string (Unicode):
+(hyperref)                removing `math shift' on input line 12.
+
+Overfull \\hbox (12.3pt too wide) in paragraph at lines 14--15
+)
+! Emergency stop.
+<*> main.tex
+"""
+
+
+def parse(lines):
+    parser = LogParser()
+    return [d.to_dict() for d in parser.feed(lines) + parser.close()]
+
+
+def test_errors_and_warnings_are_located():
+    diagnostics = parse(OUTPUT.splitlines())
+
+    assert [(d["severity"], d["file"], d["line"]) for d in diagnostics] == [
+        ("warning", "sections/intro.tex", 7),
+        ("error", "sections/intro.tex", 9),
+        ("warning", "sections/intro.tex", 12),
+        ("warning", "sections/intro.tex", 14),
+        ("error", "main.tex", None),
+    ]
+    # Continuation lines are part of the message
+    assert diagnostics[2]["message"].endswith("removing `math shift' on input line 12.")
+
+
+def test_wrapped_lines_are_joined():
+    message = (
+        "Reference `a-rather-long-label-name' on page 1 undefined on input line 3."
+    )
+    line = f"LaTeX Warning: {message}"
+    wrapped = [line[:79], line[79:], ""]
+
+    assert parse(wrapped) == [
+        {"severity": "warning", "message": message, "file": None, "line": 3}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_followers_replay_and_receive_new_events():
+    log = CompileLog()
+    log.begin_pass()
+    log.write(["(./main.tex"], [])
+
+    async def follow():
+        return [kind async for kind, _ in log.follow()]
+
+    reader = asyncio.create_task(follow())
+    await asyncio.sleep(0)
+    log.write(["./main.tex:1: Oops"], [Diagnostic("error", "Oops", "main.tex", 1)])
+    log.begin_pass()
+    log.close()
+
+    assert await reader == ["pass", "log", "log", "diagnostic", "pass"]
+    # Only the latest pass counts
+    assert log.passes == 2 and log.diagnostics == []
@@ -0,0 +1,65 @@
+import pytest
+from app.services.asset_store import AssetRef
+from app.services.compile_preview import DRAFT_OPTIONS, PreviewSelection
+
+MAIN = """\\documentclass{report}
+\\usepackage{graphicx}
+\\begin{document}
+\\include{chapters/intro}
+\\include{chapters/method}
+\\section{Summary}
+First
+\\section{Outlook}
+Second
+\\end{document}
+"""
+
+
+def test_selected_chapters_are_included_only():
+    files = {"main.tex": MAIN, "fig.png": AssetRef("a" * 64)}
+    main = PreviewSelection(include=["chapters/method.tex"]).apply(files)["main.tex"]
+
+    assert main.startswith(DRAFT_OPTIONS + "\\documentclass")
+    assert "\\includeonly{chapters/method}\\begin{document}" in main
+    assert main.count("\n") == MAIN.count("\n")
+
+
+def test_cursor_chapter_is_included_only():
+    selection = PreviewSelection(cursor_file="chapters/intro.tex", cursor_line=3)
+    main = selection.apply({"main.tex": MAIN})["main.tex"]
+    assert "\\includeonly{chapters/intro}" in main
+
+    # A file \input by a chapter keeps the chapters next to it
+    selection = PreviewSelection(cursor_file="chapters/table.tex")
+    main = selection.apply({"main.tex": MAIN})["main.tex"]
+    assert "\\includeonly{chapters/intro,chapters/method}" in main
+
+
+def test_includeonly_repeats_the_main_file_spelling():
+    files = {"main.tex": MAIN.replace("{chapters/intro}", "{./chapters/intro}")}
+
+    for selection in (
+        PreviewSelection(cursor_file="chapters/intro.tex"),
+        PreviewSelection(include=["chapters/intro.tex"]),
+    ):
+        assert "\\includeonly{./chapters/intro}" in selection.apply(files)["main.tex"]
+
+    selection = PreviewSelection(cursor_file="chapters/table.tex")
+    main = selection.apply(files)["main.tex"]
+    assert "\\includeonly{./chapters/intro,chapters/method}" in main
+
+
+def test_cursor_in_main_file_keeps_its_section():
+    selection = PreviewSelection(cursor_file="main.tex", cursor_line=7)
+    lines = selection.apply({"main.tex": MAIN})["main.tex"].splitlines()
+
+    # Line numbers are kept, so diagnostics still match the editor
+    assert len(lines) == len(MAIN.splitlines())
+    assert lines[5:7] == ["\\section{Summary}", "First"]
+    assert lines[3] == lines[7] == ""
+    assert lines[-1] == "\\end{document}"
+
+
+def test_invalid_paths_are_rejected():
+    with pytest.raises(ValueError):
+        PreviewSelection(include=["../secrets.tex"])
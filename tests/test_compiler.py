@@ -1,60 +1,342 @@
+import asyncio
+import os
 import pytest
+from contextlib import contextmanager
+from pathlib import Path
 from unittest.mock import MagicMock, patch
+from app.services.compile_builds import BuildDirectories
+from app.services.compile_log import CompileLog
 from app.services.compiler import CompilerService
+from app.services.compiler_pool import JOB_PID_FILE, LocalWorker
 from fastapi import HTTPException
 
 
-# Mock Docker client or subprocess
-@pytest.mark.asyncio
-async def test_compile_project_success():
-    service = CompilerService()
+class FakeDocker:
+    """
+    Stands in for the docker CLI: containers always start, and `docker exec`
+    jobs write `pdf` into their work dir after `delay` seconds.
+    """
+
+    def __init__(
+        self, returncode=0, pdf=b"%PDF-1.4 mock", stdout=b"", delay=0.0, on_exec=None
+    ):
+        self.returncode = returncode
+        # Called with the job's work dir and command when it runs
+        self.on_exec = on_exec
+        self.pdf = pdf
+        self.stdout = stdout
+        self.delay = delay
+        self.commands = []
 
-    # We'll patch subprocess.run to verify it calls docker
-    with patch("subprocess.run") as mock_run:
-        # Mock success response
-        mock_process = MagicMock()
-        mock_process.returncode = 0
-        mock_run.return_value = mock_process
+    def run(self, cmd, **kwargs):
+        self.commands.append(cmd)
+        return MagicMock(returncode=0, stdout=b"", stderr=b"")
 
-        # We also need to mock pathlib.Path.write_text and exists/read_bytes
-        # But since we use tempfile, it's easier to just let it write to /tmp (it's safe)
-        # However, the docker command won't actually generate the PDF if we mock it.
-        # So check_output will verify the PDF exists.
+    async def exec(self, *cmd, **kwargs):
+        self.commands.append(list(cmd))
+        process = MagicMock(returncode=self.returncode)
+        process.stdout = asyncio.StreamReader()
+        process.stderr = asyncio.StreamReader()
 
-        # Let's mock the file existence check and read_bytes
-        with patch("pathlib.Path.exists", return_value=True), patch(
-            "pathlib.Path.read_bytes", return_value=b"%PDF-1.4 mock"
-        ):
+        async def run():
+            await asyncio.sleep(self.delay)
+            if self.on_exec:
+                self.on_exec(Path(kwargs["cwd"]), cmd)
+            if self.pdf is not None:
+                (Path(kwargs["cwd"]) / "main.pdf").write_bytes(self.pdf)
+            for stream, data in ((process.stdout, self.stdout), (process.stderr, b"")):
+                stream.feed_data(data)
+                stream.feed_eof()
 
-            pdf_bytes = await service.compile_project(
-                "project-123",
-                "\\documentclass{article}\\begin{document}Test\\end{document}",
-            )
+        task = asyncio.create_task(run())
 
-            assert pdf_bytes == b"%PDF-1.4 mock"
+        async def wait():
+            await asyncio.gather(task, return_exceptions=True)
+            return self.returncode
 
-            # Verify docker command
-            mock_run.assert_called_once()
-            args = mock_run.call_args[0][0]
-            assert "docker" in args
-            assert "pdflatex" in args
-            assert "ghcr.io/xu-cheng/texlive-small" in args
+        process.wait = wait
+        process.kill = task.cancel
+        return process
 
+    @contextmanager
+    def patched(self):
+        with patch("subprocess.run", side_effect=self.run):
+            with patch("asyncio.create_subprocess_exec", side_effect=self.exec):
+                yield self
 
+
+# Mock Docker client or subprocess
 @pytest.mark.asyncio
-async def test_compile_project_docker_failure():
-    service = CompilerService()
+async def test_compile_project_success(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+
+    # We'll patch the docker CLI to verify it is called
+    with FakeDocker().patched() as docker:
+        pdf_bytes = await service.compile_project(
+            "project-123",
+            {
+                "main.tex": "\\documentclass{article}\\begin{document}Test\\end{document}"
+            },
+        )
+
+        assert pdf_bytes == b"%PDF-1.4 mock"
+
+        # A warm container is started once, then jobs are exec'd into it
+        start, job = docker.commands
+        assert start[:2] == ["docker", "run"]
+        assert "ghcr.io/xu-cheng/texlive-small" in start
+        assert job[:2] == ["docker", "exec"]
+        assert "pdflatex" in job
+
+        await service.compile_project("project-123", {"main.tex": "Again"})
+        assert len(docker.commands) == 3
+        assert docker.commands[-1][:2] == ["docker", "exec"]
 
-    with patch("subprocess.run") as mock_run:
-        # Mock failure
-        mock_process = MagicMock()
-        mock_process.returncode = 1
-        mock_process.stdout = b"LaTeX Error"
-        mock_process.stderr = b""
-        mock_run.return_value = mock_process
 
+@pytest.mark.asyncio
+async def test_compile_project_docker_failure(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+
+    with FakeDocker(1, pdf=None, stdout=b"LaTeX Error").patched():
         with pytest.raises(HTTPException) as exc_info:
-            await service.compile_project("project-123", "invalid latex")
+            await service.compile_project("project-123", {"main.tex": "invalid latex"})
 
         assert exc_info.value.status_code == 400
         assert "Compilation Failed" in exc_info.value.detail
+
+
+@pytest.mark.asyncio
+async def test_compile_does_not_block_event_loop(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    with FakeDocker(delay=0.2).patched():
+        task = asyncio.create_task(ticker())
+        await service.compile_project("project-123", {"main.tex": "Slow"})
+        task.cancel()
+
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_compile_project_writes_file_tree(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+    written = {}
+
+    def read_tree(work_dir: Path, cmd):
+        for path in work_dir.rglob("*.tex"):
+            written[str(path.relative_to(work_dir))] = path.read_text()
+
+    with FakeDocker(pdf=b"%PDF-1.4 tree", on_exec=read_tree).patched():
+        pdf_bytes = await service.compile_project(
+            "project-123",
+            {"main.tex": "\\input{chapters/intro}", "chapters/intro.tex": "Intro"},
+        )
+
+    assert pdf_bytes == b"%PDF-1.4 tree"
+    assert written == {
+        "main.tex": "\\input{chapters/intro}",
+        "chapters/intro.tex": "Intro",
+    }
+
+    with pytest.raises(HTTPException) as exc_info:
+        await service.compile_project(
+            "project-123", {"main.tex": "", "../outside.tex": ""}
+        )
+    assert exc_info.value.status_code == 400
+
+
+def fake_latex(work_dir: Path, cmd):
+    """Writes the .aux/.bbl files pdflatex and bibtex would."""
+    source = (work_dir / "main.tex").read_text()
+    if "bibtex" in cmd:
+        (work_dir / "main.bbl").write_text("\\begin{thebibliography}")
+        return
+    aux = [f"\\newlabel{{{i}}}" for i in range(source.count("\\label"))]
+    if "\\bibliography" in source:
+        aux.append("\\bibdata{refs}")
+        aux += [f"\\citation{{{i}}}" for i in range(source.count("\\cite"))]
+        if (work_dir / "main.bbl").exists():
+            aux.append("\\bibcite{0}")
+    (work_dir / "main.aux").write_text("\n".join(aux))
+
+
+@pytest.mark.asyncio
+async def test_build_dir_is_reused_across_compiles(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+    build_dir = service.builds.path("project-123")
+
+    def passes(docker):
+        """pdflatex and bibtex runs since the last call."""
+        runs = [
+            sum(1 for cmd in docker.commands if tool in cmd)
+            for tool in ("pdflatex", "bibtex")
+        ]
+        docker.commands.clear()
+        return tuple(runs)
+
+    with FakeDocker(on_exec=fake_latex).patched() as docker:
+        # A fresh build dir needs a second pass for the new .aux
+        files = {"main.tex": "\\label{a} Text", "intro.tex": "Intro"}
+        await service.compile_project("project-123", files)
+        assert passes(docker) == (2, 0)
+
+        # Edits that move no reference settle in one pass
+        await service.compile_project(
+            "project-123", {"main.tex": "\\label{a} More text"}
+        )
+        assert passes(docker) == (1, 0)
+        assert not (build_dir / "intro.tex").exists()
+
+        await service.compile_project(
+            "project-123", {"main.tex": "\\label{a}\\label{b}"}
+        )
+        assert passes(docker) == (2, 0)
+
+        # bibtex runs when the citations change, followed by two more passes
+        cited = {"main.tex": "\\cite{x} \\bibliography{refs}", "refs.bib": "@a{x}"}
+        await service.compile_project("project-123", cited)
+        assert passes(docker) == (3, 1)
+        await service.compile_project("project-123", cited)
+        assert passes(docker) == (1, 0)
+        cited["refs.bib"] = "@a{x} @a{y}"
+        await service.compile_project("project-123", cited)
+        assert passes(docker) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_failed_compile_cleans_build_dir(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+
+    with FakeDocker(1, pdf=None, on_exec=fake_latex).patched():
+        with pytest.raises(HTTPException):
+            await service.compile_project("project-123", {"main.tex": "\\label{a}"})
+
+    build_dir = service.builds.path("project-123")
+    assert (build_dir / "main.tex").exists()
+    assert not (build_dir / "main.aux").exists()
+
+
+@pytest.mark.asyncio
+async def test_cold_build_dirs_are_evicted(tmp_path):
+    builds = BuildDirectories(tmp_path, max_dirs=2, ttl=3600)
+    now = 1_000_000
+    for age, project_id in [
+        (10, "recent"),
+        (20, "older"),
+        (30, "oldest"),
+        (7200, "cold"),
+    ]:
+        builds.sync(project_id, {"main.tex": project_id})
+        os.utime(builds.path(project_id), (now - age, now - age))
+
+    async with builds.lock("oldest"):
+        await builds.evict(now)
+        # In use, so kept for now
+        assert builds.path("oldest").exists()
+    assert not builds.path("cold").exists()
+
+    await builds.evict(now)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["older", "recent"]
+    assert builds.get_stats() == {"dirs": 2, "evictions": 2}
+
+
+@pytest.mark.asyncio
+async def test_compile_output_is_streamed_with_diagnostics(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+    log = CompileLog()
+    stdout = (
+        b"(./main.tex\n"
+        b"LaTeX Warning: Citation `x' undefined on input line 2.\n"
+        b"\n"
+        b"./main.tex:3: Undefined control sequence.\n"
+        b"l.3 \\foo\n"
+        b")"
+    )
+
+    with FakeDocker(stdout=stdout).patched():
+        await service.compile_project("project-123", {"main.tex": "\\foo"}, log)
+
+    lines = [line for kind, lines in log.events if kind == "log" for line in lines]
+    assert lines[0] == "(./main.tex" and lines[-1] == ")"
+    assert [(d.severity, d.file, d.line) for d in log.diagnostics] == [
+        ("warning", "main.tex", 2),
+        ("error", "main.tex", 3),
+    ]
+    assert log.diagnostics[1].message == "Undefined control sequence."
+
+
+@pytest.mark.asyncio
+async def test_preview_runs_a_single_pass(tmp_path):
+    from app.services.compile_cache import CompileCache
+
+    cache = CompileCache(str(tmp_path / "cache"), 1024 * 1024)
+    service = CompilerService(work_root=str(tmp_path), cache=cache)
+    files = {"main.tex": "\\label{a} \\cite{x} \\bibliography{refs}"}
+
+    with FakeDocker(on_exec=fake_latex).patched() as docker:
+        await service.compile_project("project-123", files, preview=True)
+
+    # No second pass for the new .aux, no bibtex
+    assert [cmd for cmd in docker.commands if "bibtex" in cmd] == []
+    assert service.passes == 1
+    # The project's full PDF is left alone
+    assert cache.latest("project-123") is None
+
+
+@pytest.mark.asyncio
+async def test_previews_do_not_touch_the_full_build(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+    files = {"main.tex": "\\label{a}"}
+
+    with FakeDocker(on_exec=fake_latex).patched():
+        await service.compile_project("project-123", files)
+        full = service.builds.path("project-123")
+        aux = (full / "main.aux").read_bytes()
+        (full / "intro.aux").write_text("\\newlabel{intro}")
+        preview_files = {"main.tex": "\\label{a} \\label{b}"}
+        await service.compile_project("project-123", preview_files, preview=True)
+
+    assert (full / "main.aux").read_bytes() == aux
+    assert (full / "main.tex").read_text() == "\\label{a}"
+    # The preview ran in its own directory, from the full build's references
+    preview_dir = service.builds.path("project-123-preview")
+    assert (preview_dir / "main.aux").read_bytes() != aux
+    assert (preview_dir / "intro.aux").read_text() == "\\newlabel{intro}"
+
+
+class DetachedWorker(LocalWorker):
+    """
+    Runs jobs in the background of a client process, so that killing the
+    client leaves the job running, like `docker exec` does.
+    """
+
+    def command(self, work_dir: Path, args):
+        return ["sh", "-c", '"$@" & wait', "sh", *args]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_job_is_stopped_where_it_runs(tmp_path):
+    service = CompilerService(work_root=str(tmp_path))
+    pid_file = tmp_path / JOB_PID_FILE
+    job = asyncio.create_task(
+        service._run(DetachedWorker(), tmp_path, ["sleep", "30"])
+    )
+    for _ in range(100):
+        if pid_file.exists() and pid_file.read_text().strip():
+            break
+        await asyncio.sleep(0.05)
+    pid = int(pid_file.read_text())
+
+    job.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await job
+
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
@@ -0,0 +1,114 @@
+import asyncio
+import pytest
+from pathlib import Path
+from app.services.compiler_pool import CompilerWorker, DockerWorker, WorkerPool
+
+
+class FakeWorker(CompilerWorker):
+    def __init__(self):
+        super().__init__()
+        self.started = False
+        self.stopped = False
+        self.healthy = True
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.stopped = True
+
+    def is_healthy(self):
+        return self.healthy
+
+    def command(self, work_dir, args):
+        return args
+
+
+def fake_pool(size=1, max_jobs=10):
+    workers = []
+
+    def factory():
+        workers.append(FakeWorker())
+        return workers[-1]
+
+    return WorkerPool(factory, size, max_jobs, health_interval=3600), workers
+
+
+@pytest.mark.asyncio
+async def test_workers_are_reused_and_recycled():
+    pool, workers = fake_pool(max_jobs=2)
+    for _ in range(3):
+        async with pool.worker():
+            pass
+
+    # Two jobs on the first worker, then a fresh one
+    assert len(workers) == 2
+    assert workers[0].stopped and not workers[1].stopped
+    assert pool.get_stats()["recycled"] == 1
+    await pool.close()
+    assert workers[1].stopped
+
+
+@pytest.mark.asyncio
+async def test_unhealthy_worker_is_replaced_after_failure():
+    pool, workers = fake_pool()
+
+    with pytest.raises(RuntimeError):
+        async with pool.worker() as worker:
+            worker.healthy = False
+            raise RuntimeError("compile crashed")
+    async with pool.worker() as worker:
+        assert worker is workers[1]
+
+    # A failed job on a healthy worker keeps it
+    with pytest.raises(RuntimeError):
+        async with pool.worker():
+            raise RuntimeError("bad document")
+    async with pool.worker() as worker:
+        assert worker is workers[1]
+
+    assert pool.get_stats()["unhealthy"] == 1
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_waiter_gets_replacement_worker():
+    pool, workers = fake_pool(size=1, max_jobs=1)
+    first = await pool.acquire()
+    waiter = asyncio.create_task(pool.acquire())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    await pool.release(first)
+    second = await asyncio.wait_for(waiter, 1)
+    assert second is workers[1] and first.stopped
+    await pool.release(second)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_health_check_recycles_idle_workers():
+    pool, workers = fake_pool(size=2)
+    async with pool.worker():
+        async with pool.worker():
+            pass
+    workers[0].healthy = False
+
+    await pool.check_health()
+    assert pool.get_stats()["workers"] == 1
+    assert workers[0].stopped and not workers[1].stopped
+    await pool.close()
+
+
+def test_docker_worker_execs_in_running_container():
+    worker = DockerWorker("texlive", "/tmp/compile")
+    worker.container = "sciagent-tex-1"
+    assert worker.command(Path("/tmp/compile/job"), ["pdflatex", "main.tex"]) == [
+        "docker",
+        "exec",
+        "-w",
+        "/tmp/compile/job",
+        "sciagent-tex-1",
+        "pdflatex",
+        "main.tex",
+    ]
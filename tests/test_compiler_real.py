@@ -11,7 +11,9 @@ Hello from Real Test!
 \end{document}
     """
     try:
-        pdf_bytes = await compiler_service.compile_project("test-proj", content)
+        pdf_bytes = await compiler_service.compile_project(
+            "test-proj", {"main.tex": content}
+        )
         print(f"Success! Generated PDF of size: {len(pdf_bytes)} bytes")
         # Save it to check
         with open("test_output.pdf", "wb") as f:
@@ -0,0 +1,67 @@
+from datetime import date
+import pytest
+from app.agents.dates import DeadlineParser
+
+TODAY = date(2026, 10, 17)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("O prazo é 2027-03-15", date(2027, 3, 15)),
+        ("15/03/2027", date(2027, 3, 15)),
+        ("até 15-03-27", date(2027, 3, 15)),
+        ("dia 5.1.2027", date(2027, 1, 5)),
+        # Without a year: the next occurrence
+        ("15/03", date(2027, 3, 15)),
+        ("20/12", date(2026, 12, 20)),
+        ("15 de março de 2027", date(2027, 3, 15)),
+        ("1º de Junho", date(2027, 6, 1)),
+        ("fim de junho", date(2027, 6, 30)),
+        ("Final de fevereiro de 2028", date(2028, 2, 29)),
+        ("meados de dezembro", date(2026, 12, 15)),
+        ("em 3 meses", date(2027, 1, 17)),
+        ("daqui a duas semanas", date(2026, 10, 31)),
+        ("Daqui a 10 dias", date(2026, 10, 27)),
+        ("dentro de um ano", date(2027, 10, 17)),
+    ],
+)
+def test_parses_common_formats(text, expected):
+    assert DeadlineParser().parse(text, TODAY) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Não sei ainda",
+        "no próximo semestre",
+        # Two different dates: the LLM decides
+        "entre 10/01/2027 e 20/02/2027",
+        "31/02/2027",
+        # Ranges, fractions and compound durations
+        "daqui a 2-3 meses",
+        "em 2 ou 3 semanas",
+        "uns 3.5 meses",
+        "uns 3,5 meses",
+        "daqui a um ano e meio",
+        "em 1 ano e 6 meses",
+        "dentro de duas semanas e meia",
+        # Past the calendar
+        "em 99999999 semanas",
+        "daqui a 99999999 dias",
+        "em 99999999 meses",
+        "em 99999999999999999999 anos",
+        "em 99999999 meses e ate 15/03/2027",
+    ],
+)
+def test_leaves_ambiguous_messages_to_the_llm(text):
+    assert DeadlineParser().parse(text, TODAY) is None
+
+
+def test_counts_hits_and_misses():
+    parser = DeadlineParser()
+    parser.parse("15/03/2027", TODAY)
+    parser.parse("2027-03-15, ou seja 15/03/2027", TODAY)
+    parser.parse("quando der", TODAY)
+
+    assert parser.get_stats() == {"hits": 2, "misses": 1, "hit_rate": 2 / 3}
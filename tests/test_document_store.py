@@ -0,0 +1,157 @@
+import uuid
+import y_py as Y
+from sqlmodel import Session, select
+from app.models.document import ProjectDocumentSnapshot, ProjectDocumentUpdate
+from app.models.project import Project
+from app.models.project_file import MAIN_FILE, ProjectFile
+from app.services.document_store import TEXT_NAME, DocumentStore, document_id
+
+
+def create_project(session: Session, content: str = None) -> Project:
+    project = Project(title="Doc", owner_id=uuid.uuid4(), content=content)
+    session.add(project)
+    session.commit()
+    session.refresh(project)
+    return project
+
+
+def capture_updates(ydoc: Y.YDoc) -> list:
+    updates = []
+    ydoc.observe_after_transaction(lambda event: updates.append(event.get_update()))
+    return updates
+
+
+def test_append_and_load_replays_tail(session: Session):
+    store = DocumentStore(session.get_bind())
+    project = create_project(session)
+
+    ydoc = Y.YDoc()
+    updates = capture_updates(ydoc)
+    text = ydoc.get_text(TEXT_NAME)
+    with ydoc.begin_transaction() as txn:
+        text.extend(txn, "Hello")
+    with ydoc.begin_transaction() as txn:
+        text.extend(txn, " World")
+
+    store.append_updates(str(project.id), updates)
+
+    state = store.load(str(project.id))
+    assert state.snapshot is None
+    assert len(state.updates) == 2
+
+    replica = Y.YDoc()
+    for update in state.updates:
+        Y.apply_update(replica, update)
+    assert str(replica.get_text(TEXT_NAME)) == "Hello World"
+
+
+def test_compact_merges_log_into_snapshot_and_content(session: Session):
+    store = DocumentStore(session.get_bind())
+    project = create_project(session, content="stale")
+
+    ydoc = Y.YDoc()
+    updates = capture_updates(ydoc)
+    text = ydoc.get_text(TEXT_NAME)
+    with ydoc.begin_transaction() as txn:
+        text.extend(txn, "\\section{Intro}")
+    store.append_updates(str(project.id), updates)
+
+    store.compact(str(project.id))
+
+    session.expire_all()
+    assert session.exec(select(ProjectDocumentUpdate)).all() == []
+    snapshot = session.get(ProjectDocumentSnapshot, (project.id, MAIN_FILE))
+    assert snapshot is not None
+    assert session.get(Project, project.id).content == "\\section{Intro}"
+
+    # Edits after compaction are replayed on top of the snapshot
+    with ydoc.begin_transaction() as txn:
+        text.extend(txn, " text")
+    store.append_updates(str(project.id), updates[1:])
+
+    state = store.load(str(project.id))
+    replica = Y.YDoc()
+    Y.apply_update(replica, state.snapshot)
+    for update in state.updates:
+        Y.apply_update(replica, update)
+    assert str(replica.get_text(TEXT_NAME)) == "\\section{Intro} text"
+
+
+def test_materialize_content_is_lazy(session: Session):
+    store = DocumentStore(session.get_bind())
+    project = create_project(session, content="old")
+
+    # No log tail: content is left untouched
+    store.materialize_content(session, project)
+    assert project.content == "old"
+    assert session.get(ProjectDocumentSnapshot, (project.id, MAIN_FILE)) is None
+
+    ydoc = Y.YDoc()
+    updates = capture_updates(ydoc)
+    with ydoc.begin_transaction() as txn:
+        ydoc.get_text(TEXT_NAME).extend(txn, "new")
+    store.append_updates(str(project.id), updates)
+
+    store.materialize_content(session, project)
+    assert project.content == "new"
+
+
+def test_reset_drops_binary_state(session: Session):
+    store = DocumentStore(session.get_bind())
+    project = create_project(session, content="text")
+    ydoc = Y.YDoc()
+    with ydoc.begin_transaction() as txn:
+        ydoc.get_text(TEXT_NAME).extend(txn, "text")
+    store.compact(str(project.id), Y.encode_state_as_update(ydoc))
+
+    store.reset(session, project.id)
+    session.commit()
+
+    state = store.load(str(project.id))
+    assert not state.has_binary_state
+    assert state.content == "text"
+
+
+def test_write_batch_appends_and_compacts_in_one_transaction(session: Session):
+    store = DocumentStore(session.get_bind())
+    first = create_project(session)
+    second = create_project(session)
+
+    ydoc = Y.YDoc()
+    updates = capture_updates(ydoc)
+    with ydoc.begin_transaction() as txn:
+        ydoc.get_text(TEXT_NAME).extend(txn, "shared")
+
+    store.write_batch(
+        {str(first.id): updates, str(second.id): updates},
+        {str(second.id): Y.encode_state_as_update(ydoc)},
+    )
+
+    session.expire_all()
+    assert len(store.load(str(first.id)).updates) == 1
+    assert store.load(str(second.id)).updates == []
+    assert session.get(Project, second.id).content == "shared"
+
+
+def test_files_are_separate_documents(session: Session):
+    store = DocumentStore(session.get_bind())
+    project = create_project(session, content="main")
+    session.add(ProjectFile(project_id=project.id, path="chapters/intro.tex"))
+    session.commit()
+
+    assert store.load(document_id(project.id, "missing.tex")) is None
+
+    ydoc = Y.YDoc()
+    updates = capture_updates(ydoc)
+    with ydoc.begin_transaction() as txn:
+        ydoc.get_text(TEXT_NAME).extend(txn, "\\section{Intro}")
+    intro = document_id(project.id, "chapters/intro.tex")
+    store.append_updates(intro, updates)
+
+    assert store.load(str(project.id)).updates == []
+    assert len(store.load(intro).updates) == 1
+
+    files = store.read_files(session, project)
+    assert files == {MAIN_FILE: "main", "chapters/intro.tex": "\\section{Intro}"}
+    # Reads leave the log to be compacted by the collaboration service
+    assert len(store.load(intro).updates) == 1
@@ -0,0 +1,92 @@
+import json
+import pytest
+from app.agents.intent import GREETING, HELP, THANKS, TOPIC, IntentClassifier
+
+
+@pytest.mark.parametrize(
+    "message, kind",
+    [
+        ("Olá", GREETING),
+        ("oi, tudo bem?", GREETING),
+        ("Bom dia!", GREETING),
+        ("Obrigado!", THANKS),
+        ("Como funciona?", HELP),
+        ("O que você faz?", HELP),
+    ],
+)
+def test_small_talk_is_answered_locally(message, kind):
+    intent = IntentClassifier().classify(message)
+    assert intent.kind == kind
+    assert intent.response
+
+
+@pytest.mark.parametrize(
+    "message, topic",
+    [
+        (
+            "Quero pesquisar sobre Machine Learning na Medicina",
+            "Machine Learning na Medicina",
+        ),
+        ("Meu tema é Micro Frontends.", "Micro Frontends"),
+        ("I want to write about coffee roasting", "coffee roasting"),
+    ],
+)
+def test_topic_statements_are_extracted(message, topic):
+    intent = IntentClassifier().classify(message)
+    assert intent.kind == TOPIC
+    assert intent.topic == topic
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "O que é um paper?",
+        "Quero pesquisar algo mas não sei o quê",
+        "Quero criar um app",
+        "vou estudar amanhã",
+        "quero escrever rápido",
+        "Sou aluno de mestrado em computação",
+        "Ajuda com a minha tese de doutorado sobre IA",
+    ],
+)
+def test_unclear_messages_go_to_the_llm(message):
+    classifier = IntentClassifier()
+    assert classifier.classify(message) is None
+    assert classifier.get_stats()["escalated"] == 1
+
+
+def test_learns_from_logged_examples(tmp_path):
+    path = tmp_path / "intents.jsonl"
+    classifier = IntentClassifier(str(path))
+    classifier.train()
+    message = "Fermentação de cacau na Bahia"
+    before = classifier.probability("fermentacao de cacau na bahia")
+    classifier.record(message, True)
+
+    assert json.loads(path.read_text()) == {"text": message, "is_research_topic": True}
+    assert classifier.probability("fermentacao de cacau na bahia") > before
+    # Trained again from the log at startup
+    restarted = IntentClassifier(str(path))
+    restarted.train()
+    assert restarted.probability("fermentacao de cacau na bahia") > before
+
+
+def test_threshold_is_calibrated_on_held_out_examples():
+    classifier = IntentClassifier(min_confidence=0.5)
+    classifier.train()
+    assert classifier.classify("Machine Learning na medicina").kind == TOPIC
+
+    # A non-topic the model is confident about raises the threshold over it
+    classifier.calibrate([("Machine Learning na medicina", False)])
+    assert classifier.threshold > 0.9
+    assert classifier.classify("Machine Learning na medicina") is None
+
+
+def test_examples_log_is_rotated(tmp_path):
+    path = tmp_path / "intents.jsonl"
+    classifier = IntentClassifier(str(path), max_examples=3)
+    for i in range(6):
+        classifier.record(f"Tema {i}", True)
+
+    lines = [json.loads(line)["text"] for line in path.read_text().splitlines()]
+    assert lines == ["Tema 3", "Tema 4", "Tema 5"]
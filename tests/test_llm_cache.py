@@ -0,0 +1,89 @@
+import time
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from app.core.llm import CachedChatModel
+from app.services.llm_cache import LLMCache, llm_cache_key
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return AIMessage(content=f"reply {self.calls}")
+
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages, **kwargs)
+
+
+def prompt(text: str) -> list:
+    return [SystemMessage(content="JSON only."), HumanMessage(content=text)]
+
+
+def test_key_ignores_whitespace_but_not_model_or_type():
+    key = llm_cache_key(prompt("Olá,  mundo\n"), "llama3", 0.3, "intent")
+    assert key == llm_cache_key(prompt(" Olá, mundo"), "llama3", 0.3, "intent")
+    assert key != llm_cache_key(prompt("Olá, mundo"), "llama3", 0.7, "intent")
+    assert key != llm_cache_key(prompt("Olá, mundo"), "gemini", 0.3, "intent")
+    assert key != llm_cache_key(prompt("Olá, mundo"), "llama3", 0.3, "deadline")
+
+
+def test_memory_tier_is_lru_and_disk_keeps_everything(tmp_path):
+    cache = LLMCache(str(tmp_path), max_bytes=1024 * 1024, memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, f"content {key}", ttl=60)
+
+    assert cache.get_memory("a") is None
+    assert cache.get("a") == "content a"
+    assert cache.get_stats()["disk_hits"] == 1
+    # Read back into memory
+    assert cache.get_memory("a") == "content a"
+    # A new process finds it on disk
+    restarted = LLMCache(str(tmp_path), max_bytes=1024 * 1024, memory_entries=2)
+    assert restarted.get("c") == "content c"
+
+
+def test_entries_expire(tmp_path):
+    cache = LLMCache(str(tmp_path), max_bytes=1024 * 1024, memory_entries=2)
+    cache.put("a", "content", ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert not (tmp_path / "a.json").exists()
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = LLMCache(str(tmp_path), max_bytes=200, memory_entries=10)
+    for key in ("a", "b", "c", "d"):
+        cache.put(key, "x" * 60, ttl=60)
+        time.sleep(0.01)
+
+    assert cache.evictions > 0
+    assert not (tmp_path / "a.json").exists()
+    assert (tmp_path / "d.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_model_caches_only_opted_in_prompt_types(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "app.core.llm.settings.LLM_CACHE_TTLS", {"onboarding.intent": 60}
+    )
+    cache = LLMCache(str(tmp_path), max_bytes=1024 * 1024, memory_entries=10)
+    model = FakeModel()
+    llm = CachedChatModel(model, "llama3", 0.3, cache)
+
+    first = await llm.ainvoke(prompt("Olá"), cache_as="onboarding.intent")
+    again = await llm.ainvoke(prompt("Olá "), cache_as="onboarding.intent")
+    assert again.content == first.content
+    assert again.response_metadata["cached"]
+    assert not first.response_metadata.get("cached")
+    assert model.calls == 1
+    cached = await llm.acached(prompt("Olá"), "onboarding.intent")
+    assert cached.content == first.content
+    assert await llm.acached(prompt("Olá"), "writer") is None
+
+    # Not opted in, or a type without a TTL: always generated
+    llm.invoke(prompt("Olá"))
+    llm.invoke(prompt("Olá"), cache_as="writer")
+    assert model.calls == 3
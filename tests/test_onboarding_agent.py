@@ -1,9 +1,16 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from app.main import app
 from app.agents.state import OnboardingState
-from app.agents.onboarding import node_search_references, node_generate_roadmap
+from langchain_core.messages import AIMessage, HumanMessage
+from app.agents.onboarding import (
+    call_llm,
+    node_clarify_concept,
+    node_generate_roadmap,
+    node_search_references,
+)
 
 client = TestClient(app)
 
@@ -23,14 +30,45 @@ def test_node_search_references(mock_search_tool):
     assert len(result["suggested_articles"]) == 1
     assert result["suggested_articles"][0]["title"] == "Test Paper"
 
-def test_node_generate_roadmap():
+@pytest.mark.asyncio
+async def test_node_generate_roadmap():
     state = {"deadline": "2 months"}
-    result = node_generate_roadmap(state)
+    result = await node_generate_roadmap(state)
     
     assert result["current_step"] == "confirm"
     assert len(result["roadmap"]) > 0
     assert "Literature Review" in [t["title"] for t in result["roadmap"]]
 
+@pytest.mark.asyncio
+async def test_node_generate_roadmap_times_out():
+    async def stalled(messages, **kwargs):
+        await asyncio.sleep(10)
+
+    state = {"topic": "Coffee", "deadline": "2027-01-01"}
+    with patch("app.agents.onboarding.llm") as mock_llm, patch(
+        "app.agents.onboarding.settings.ONBOARDING_LLM_TIMEOUT_SECONDS", 0.01
+    ):
+        mock_llm.ainvoke = AsyncMock(side_effect=stalled)
+        result = await node_generate_roadmap(state)
+
+    # The stalled generation is cancelled and the fallback roadmap is used
+    assert result["current_step"] == "confirm"
+    assert result["project_title"] == "Coffee"
+    assert result["roadmap"]
+
+
+@pytest.mark.asyncio
+async def test_node_clarify_concept_answers_greetings_locally():
+    state = {"messages": [HumanMessage(content="Olá!")]}
+    with patch("app.agents.onboarding.llm") as mock_llm:
+        mock_llm.ainvoke = AsyncMock()
+        result = await node_clarify_concept(state)
+
+    assert result["current_step"] == "clarify"
+    assert result["messages"][0].content.startswith("Olá!")
+    mock_llm.ainvoke.assert_not_called()
+
+
 @patch("app.agents.onboarding.onboarding_graph.ainvoke")
 def test_chat_onboarding_endpoint(mock_invoke):
     # Mock Graph Response
@@ -48,3 +86,37 @@ def test_chat_onboarding_endpoint(mock_invoke):
     assert response.status_code == 200
     data = response.json()
     assert data["message"] == "Hello, how can I help?"
+
+
+@pytest.mark.asyncio
+async def test_node_clarify_concept_records_only_generated_replies():
+    reply = '{"is_research_topic": false, "topic": null, "response": "Certo."}'
+    state = {"messages": [HumanMessage(content="Tenho uma dúvida sobre prazos")]}
+    with patch("app.agents.onboarding.llm") as mock_llm, patch(
+        "app.agents.onboarding.intent_classifier.record"
+    ) as record:
+        mock_llm.ainvoke = AsyncMock(return_value=AIMessage(content=reply))
+        mock_llm.acached = AsyncMock(return_value=None)
+        await node_clarify_concept(state)
+        mock_llm.acached.return_value = AIMessage(
+            content=reply, response_metadata={"cached": True}
+        )
+        result = await node_clarify_concept(state)
+
+    assert result["messages"][0].content == "Certo."
+    record.assert_called_once()
+    mock_llm.ainvoke.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_cached_replies_take_no_generation_slot():
+    cached = AIMessage(content="{}", response_metadata={"cached": True})
+    with patch("app.agents.onboarding.llm") as mock_llm, patch(
+        "app.agents.onboarding.llm_slots", asyncio.Semaphore(0)
+    ), patch("app.agents.onboarding.settings.ONBOARDING_LLM_TIMEOUT_SECONDS", 0.01):
+        mock_llm.acached = AsyncMock(return_value=cached)
+        mock_llm.ainvoke = AsyncMock()
+        # No slot is free, yet the cached reply is served
+        assert await call_llm([HumanMessage(content="Olá")], "intent") is cached
+
+    mock_llm.ainvoke.assert_not_called()
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import END, StateGraph
+from sqlmodel import Session, SQLModel, create_engine, select
+from app.agents.checkpointer import DatabaseCheckpointer
+from app.agents.state import OnboardingState
+from app.models.onboarding_checkpoint import OnboardingCheckpoint
+
+
+def thread_config(thread_id: str, checkpoint_id: str = None) -> dict:
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+
+def save(saver: DatabaseCheckpointer, thread_id: str, checkpoint_id: str, **values):
+    checkpoint = empty_checkpoint()
+    checkpoint["id"] = checkpoint_id
+    checkpoint["channel_values"] = values
+    return saver.put(thread_config(thread_id), checkpoint, {"step": 0}, {})
+
+
+def test_put_and_get_latest(session: Session):
+    saver = DatabaseCheckpointer(session.get_bind(), ttl=3600, keep=3)
+    save(saver, "t1", "1", topic="Coffee")
+    config = save(saver, "t1", "2", topic="Tea")
+    saver.put_writes(config, [("topic", "Mate")], task_id="task")
+
+    latest = saver.get_tuple(thread_config("t1"))
+    assert latest.checkpoint["channel_values"] == {"topic": "Tea"}
+    assert latest.pending_writes == [("task", "topic", "Mate")]
+    first = saver.get_tuple(thread_config("t1", "1"))
+    assert first.checkpoint["channel_values"] == {"topic": "Coffee"}
+    assert saver.get_tuple(thread_config("other")) is None
+
+
+def test_keeps_latest_checkpoints_per_thread(session: Session):
+    saver = DatabaseCheckpointer(session.get_bind(), ttl=3600, keep=2)
+    for checkpoint_id in ("1", "2", "3", "4"):
+        save(saver, "t1", checkpoint_id, topic=checkpoint_id)
+    save(saver, "t2", "1", topic="other")
+
+    ids = [t.config["configurable"]["checkpoint_id"] for t in saver.list(None)]
+    assert sorted(ids) == ["1", "3", "4"]
+
+
+def test_trims_oldest_messages_past_size_cap(session: Session):
+    saver = DatabaseCheckpointer(session.get_bind(), ttl=3600, keep=3, max_bytes=2000)
+    messages = [HumanMessage(content=f"{i} " + "x" * 200) for i in range(40)]
+    save(saver, "t1", "1", messages=messages)
+
+    stored = saver.get_tuple(thread_config("t1")).checkpoint["channel_values"]
+    assert 0 < len(stored["messages"]) < len(messages)
+    assert stored["messages"][-1].content == messages[-1].content
+    assert saver.trimmed == 1
+
+
+def test_expired_threads_are_ignored_and_pruned(session: Session):
+    saver = DatabaseCheckpointer(session.get_bind(), ttl=60, keep=3)
+    save(saver, "old", "1", topic="Coffee")
+    save(saver, "new", "1", topic="Tea")
+    row = session.exec(
+        select(OnboardingCheckpoint).where(OnboardingCheckpoint.thread_id == "old")
+    ).one()
+    row.created_at = datetime.utcnow() - timedelta(seconds=120)
+    session.add(row)
+    session.commit()
+
+    assert saver.get_tuple(thread_config("old")) is None
+    assert saver.prune_expired() == 1
+    session.expire_all()
+    threads = session.exec(select(OnboardingCheckpoint.thread_id)).all()
+    assert threads == ["new"]
+
+
+@pytest.mark.asyncio
+async def test_graph_conversation_survives_a_new_checkpointer(tmp_path):
+    # LangGraph saves checkpoints and writes from concurrent threads, which
+    # need their own connections rather than the tests' shared one
+    engine = create_engine(f"sqlite:///{tmp_path / 'checkpoints.db'}")
+    SQLModel.metadata.create_all(engine)
+
+    def reply(state: OnboardingState):
+        return {"messages": [AIMessage(content=f"{len(state['messages'])}")]}
+
+    workflow = StateGraph(OnboardingState)
+    workflow.add_node("reply", reply)
+    workflow.set_entry_point("reply")
+    workflow.add_edge("reply", END)
+    config = thread_config("conversation")
+
+    graph = workflow.compile(checkpointer=DatabaseCheckpointer(engine))
+    await graph.ainvoke({"messages": [HumanMessage(content="Olá")]}, config=config)
+
+    # As after a restart: the history is loaded from the database
+    graph = workflow.compile(checkpointer=DatabaseCheckpointer(engine))
+    result = await graph.ainvoke(
+        {"messages": [HumanMessage(content="Café")]}, config=config
+    )
+    assert [m.content for m in result["messages"]] == ["Olá", "1", "Café", "3"]
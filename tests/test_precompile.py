@@ -0,0 +1,89 @@
+import asyncio
+import uuid
+import pytest
+from app.core.config import settings
+from app.services.collaboration import CollaborationService
+from app.services.precompile import Precompiler
+
+
+class RecordingCompiler:
+    """Stand-in for CompilerService that records background submissions."""
+
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, project_id, user_id, files, background=False):
+        self.submitted.append((project_id, files["main.tex"], background))
+        return object()
+
+
+def make_precompiler(monkeypatch, interval: float):
+    monkeypatch.setattr(settings, "COMPILE_ON_SAVE", True)
+    collaboration = CollaborationService(store=None)
+    compiler = RecordingCompiler()
+    precompiler = Precompiler(collaboration, compiler, interval=interval)
+    sources = {"main.tex": "v1"}
+    monkeypatch.setattr(precompiler, "_load_files", lambda project_id: dict(sources))
+    precompiler.start()
+    return precompiler, compiler, sources
+
+
+@pytest.mark.asyncio
+async def test_saves_queue_a_background_compile(monkeypatch):
+    precompiler, compiler, _ = make_precompiler(monkeypatch, interval=0.0)
+    project_id = str(uuid.uuid4())
+
+    # Every file of the project saved in the batch triggers one compile
+    for listener in precompiler.collaboration.save_listeners:
+        listener([project_id, f"{project_id}/intro.tex"])
+    await asyncio.sleep(0.01)
+
+    assert compiler.submitted == [(project_id, "v1", True)]
+    assert precompiler.get_stats()["submitted"] == 1
+    await precompiler.stop()
+
+
+@pytest.mark.asyncio
+async def test_precompiles_are_rate_limited_per_project(monkeypatch):
+    precompiler, compiler, sources = make_precompiler(monkeypatch, interval=0.1)
+    project_id, other = str(uuid.uuid4()), str(uuid.uuid4())
+
+    precompiler.on_saved([project_id])
+    await asyncio.sleep(0.01)
+    # Saves within the interval are folded into one trailing compile
+    sources["main.tex"] = "v2"
+    precompiler.on_saved([project_id])
+    sources["main.tex"] = "v3"
+    precompiler.on_saved([project_id, other])
+    await asyncio.sleep(0.01)
+    assert compiler.submitted == [(project_id, "v1", True), (other, "v3", True)]
+
+    await asyncio.sleep(0.15)
+    assert compiler.submitted[-1] == (project_id, "v3", True)
+    assert len(compiler.submitted) == 3
+    await precompiler.stop()
+
+
+@pytest.mark.asyncio
+async def test_rate_limits_are_forgotten(monkeypatch):
+    precompiler, compiler, _ = make_precompiler(monkeypatch, interval=0.05)
+    project_id, deleted = str(uuid.uuid4()), str(uuid.uuid4())
+    precompiler._load_files = lambda p: None if p == deleted else {"main.tex": "v1"}
+
+    precompiler.on_saved([project_id, deleted])
+    await asyncio.sleep(0.01)
+    assert list(precompiler._last_submit) == [project_id]
+
+    # Any later save prunes the projects whose interval is over
+    await asyncio.sleep(0.05)
+    precompiler.on_saved([])
+    assert precompiler.get_stats()["rate_limited"] == 0
+    await precompiler.stop()
+
+
+@pytest.mark.asyncio
+async def test_disabled_by_default(monkeypatch):
+    monkeypatch.setattr(settings, "COMPILE_ON_SAVE", False)
+    collaboration = CollaborationService(store=None)
+    Precompiler(collaboration, RecordingCompiler()).start()
+    assert collaboration.save_listeners == []
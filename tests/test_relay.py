@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from app.services.collaboration import CollaborationService
+from app.services.document_store import TEXT_NAME
+from app.services.relay import InProcessRelay, UnixSocketRelay
+from tests.test_collaboration import InMemoryStore, write
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_workers_converge_through_in_process_relay():
+    store = InMemoryStore()
+    worker_a = CollaborationService(store=store, relay=InProcessRelay())
+    worker_b = CollaborationService(store=store, relay=InProcessRelay())
+    try:
+        room_a = await worker_a.get_room("p1")
+        write(room_a, "from A")
+
+        # B loads from storage (nothing saved yet) and gets A's unsaved state
+        room_b = await worker_b.get_room("p1")
+        await settle()
+        assert str(room_b.ydoc.get_text(TEXT_NAME)) == "from A"
+
+        write(room_b, ", from B")
+        await settle()
+        assert str(room_a.ydoc.get_text(TEXT_NAME)) == "from A, from B"
+
+        # Each update is persisted only by the worker it originated from
+        assert len(worker_a.pending_updates["p1"]) == 1
+        assert len(worker_b.pending_updates["p1"]) == 1
+    finally:
+        await worker_a.relay.stop()
+        await worker_b.relay.stop()
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_relay_routes_to_subscribers(tmp_path):
+    path = str(tmp_path / "collab.sock")
+    received = {"hub": [], "worker": [], "other": []}
+
+    hub = UnixSocketRelay(path)
+    worker = UnixSocketRelay(path)
+    other = UnixSocketRelay(path)
+    await hub.start(lambda p, m: received["hub"].append((p, m)))
+    await worker.start(lambda p, m: received["worker"].append((p, m)))
+    await other.start(lambda p, m: received["other"].append((p, m)))
+    try:
+        assert hub.is_hub
+        assert not worker.is_hub
+
+        hub.subscribe("p1")
+        worker.subscribe("p1")
+        other.subscribe("p2")
+        await settle()
+
+        worker.publish("p1", b"to hub")
+        hub.publish("p1", b"to worker")
+        await settle()
+
+        assert received["hub"] == [("p1", b"to hub")]
+        assert received["worker"] == [("p1", b"to worker")]
+        assert received["other"] == []
+    finally:
+        await worker.stop()
+        await other.stop()
+        await hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_relay_elects_new_hub(tmp_path):
+    path = str(tmp_path / "collab.sock")
+    received = []
+
+    hub = UnixSocketRelay(path)
+    first = UnixSocketRelay(path)
+    second = UnixSocketRelay(path)
+    await hub.start(lambda p, m: None)
+    await first.start(lambda p, m: None)
+    await second.start(lambda p, m: received.append(m))
+    second.subscribe("p1")
+    await settle()
+
+    await hub.stop()
+    await settle()
+    try:
+        assert first.is_hub or second.is_hub
+        first.publish("p1", b"after failover")
+        await settle()
+        assert received == [b"after failover"]
+    finally:
+        await first.stop()
+        await second.stop()